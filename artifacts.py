@@ -0,0 +1,117 @@
+"""
+Local store of forecast artifacts written by every market list generation run.
+
+Each run is a directory under `artifacts/` holding:
+- history.parquet: daily usage per item (Item name, Date, Usage)
+- forecast.parquet: forecast path per item (Item name, Date, yhat, yhat_lower, yhat_upper)
+- meta.json: run settings and the cushioned forecast of every item
+
+Both parquet files are float32, sorted by item and written in small row groups so the dashboard can read a single
+item without loading the run. Charts are downsampled server-side (see downsample) before they reach Plotly.
+"""
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+ROW_GROUP_SIZE = 5000
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACTS_DIR):
+        self.root = root
+
+    def new_run_id(self, property_name="default"):
+        """
+        Unique, time-ordered run id: timestamp to the microsecond, a random suffix (runs of one property started in
+        the same instant by other processes) and the property name made path-safe
+        :return:
+        """
+        return (f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}-"
+                f"{re.sub(r'[^A-Za-z0-9_-]', '_', property_name)}")
+
+    def write_run(self, run_id, histories, forecasts, meta):
+        """
+        Stores one run.
+        - histories: {item: Date/Usage dataframe}
+        - forecasts: {item: Date/yhat/yhat_lower/yhat_upper dataframe}
+        - meta: json-serialisable run settings and results
+        :return:
+        """
+        run_dir = os.path.join(self.root, run_id)
+        # Never write over another run's artifacts
+        os.makedirs(run_dir, exist_ok=False)
+
+        self._write_frames(os.path.join(run_dir, "history.parquet"), histories, ["Usage"])
+        self._write_frames(os.path.join(run_dir, "forecast.parquet"), forecasts, ["yhat", "yhat_lower", "yhat_upper"])
+
+        meta = {**meta, "run_id": run_id, "items": sorted(forecasts)}
+        with open(os.path.join(run_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, default=str)
+        return run_dir
+
+    def _write_frames(self, path, frames, value_columns):
+        parts = [frame.assign(**{"Item name": item}) for item, frame in sorted(frames.items()) if frame is not None]
+        if parts:
+            df = pd.concat(parts, ignore_index=True)[["Item name", "Date"] + value_columns]
+        else:
+            df = pd.DataFrame(columns=["Item name", "Date"] + value_columns)
+        df["Date"] = pd.to_datetime(df["Date"])
+        df[value_columns] = df[value_columns].astype(np.float32)
+        df.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE)
+
+    def list_runs(self, property_name=None):
+        """Run ids, newest first; only those of `property_name` (as recorded in meta.json) when given"""
+        if not os.path.isdir(self.root):
+            return []
+        runs = [name for name in os.listdir(self.root) if os.path.exists(os.path.join(self.root, name, "meta.json"))]
+        if property_name is not None:
+            runs = [run for run in runs if self.load_meta(run).get("property") == property_name]
+        return sorted(runs, reverse=True)
+
+    def load_meta(self, run_id):
+        with open(os.path.join(self.root, run_id, "meta.json")) as f:
+            return json.load(f)
+
+    def load_item(self, run_id, item):
+        """
+        Returns (history, forecast) dataframes of one item, reading only the matching row groups
+        :return:
+        """
+        run_dir = os.path.join(self.root, run_id)
+        filters = [("Item name", "==", item)]
+        history = pd.read_parquet(os.path.join(run_dir, "history.parquet"), filters=filters)
+        forecast = pd.read_parquet(os.path.join(run_dir, "forecast.parquet"), filters=filters)
+        return history.drop(columns="Item name"), forecast.drop(columns="Item name")
+
+
+def downsample(df, x="Date", y="Usage", max_points=300):
+    """
+    Largest-Triangle-Three-Buckets downsampling: keeps the first and last points and, for every bucket in between,
+    the point forming the largest triangle with its neighbours, so spikes survive while the point count is bounded.
+    :return:
+    """
+    n = len(df)
+    if n <= max_points or max_points < 3:
+        return df
+
+    xs = df[x].to_numpy().astype("datetime64[s]").astype(np.float64) if np.issubdtype(df[x].dtype, np.datetime64) \
+        else df[x].to_numpy(dtype=np.float64)
+    ys = df[y].to_numpy(dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+
+    keep = [0]
+    for start, end, next_end in zip(edges[:-1], edges[1:], np.append(edges[2:], n)):
+        # Average of the next bucket is the third corner of the triangle
+        next_x, next_y = xs[end:next_end].mean(), ys[end:next_end].mean()
+        prev_x, prev_y = xs[keep[-1]], ys[keep[-1]]
+        areas = np.abs((prev_x - next_x) * (ys[start:end] - prev_y) - (prev_x - xs[start:end]) * (next_y - prev_y))
+        keep.append(start + int(np.argmax(areas)))
+    keep.append(n - 1)
+
+    return df.iloc[keep]
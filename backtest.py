@@ -0,0 +1,199 @@
+"""
+Rolling-origin backtesting of the forecasting engines against the issues voucher.
+
+The voucher is replayed from several cutoff dates: for every fold each item is forecast from the history up to
+the cutoff, and the quantity the market list would order (the raw last-day forecast, see
+forecasting.forecast_last_day) is compared with what was actually issued over the following `horizon` days.
+Items x folds are evaluated in parallel worker processes that read their rows from a memory-mapped item x day usage matrix
+(see usage_matrix.py), cached on disk per voucher version, so re-running with a different engine only pays
+for the fits.
+
+Usage:
+    python backtest.py --engine prophet --folds 4 --horizon 30 --workers 8
+"""
+import argparse
+import hashlib
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from forecasting import ROUTES, classify_demand, get_engine
+from usage_matrix import UsageMatrix
+
+warnings.filterwarnings("ignore")
+
+CACHE_DIR = ".backtest_cache"
+
+
+def get_cutoffs(issues_df, n_folds=4, horizon=30, step=None):
+    """
+    Returns `n_folds` cutoff dates, the latest one leaving a full horizon of actuals after it
+    :return:
+    """
+    step = step or horizon
+    last_date = issues_df["Date"].max()
+    return sorted(last_date - pd.Timedelta(days=horizon + step * k) for k in range(n_folds))
+
+
+def _fingerprint(issues_df):
+    hashed = pd.util.hash_pandas_object(issues_df[["Date", "Item name", "Usage"]], index=False)
+    return hashlib.md5(hashed.values.tobytes()).hexdigest()[:12]
+
+
+def load_matrix(issues_df, cache_dir=CACHE_DIR):
+    """
+    This method returns a handle to the voucher's item x day usage matrix, memory-mapped from `cache_dir`.
+    The file is keyed by the voucher contents, so unchanged data is never rebuilt, and every fold and worker
+    reads its rows from the same mapping instead of receiving a copy of the data.
+    :return:
+    """
+    fingerprint = _fingerprint(issues_df)
+    matrix_path = os.path.join(cache_dir, f"usage_{fingerprint}.npy")
+    handle_path = os.path.join(cache_dir, f"usage_{fingerprint}.pkl")
+    if os.path.exists(matrix_path) and os.path.exists(handle_path):
+        return pd.read_pickle(handle_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    handle = UsageMatrix.from_issues(issues_df).to_memmap(matrix_path)
+    pd.to_pickle(handle, handle_path)
+    return handle
+
+
+def build_fold(matrix, cutoff, horizon):
+    """
+    This method returns the actual usage per item over the `horizon` days after `cutoff`.
+    The history side of the fold is simply the matrix columns up to the cutoff.
+    :return:
+    """
+    first, last = matrix.column(cutoff) + 1, matrix.column(cutoff) + horizon + 1
+    actual = np.nansum(matrix.values[:, max(first, 0):max(last, 0)], axis=1)
+    return pd.Series(actual, index=matrix.items, dtype=float)
+
+
+def _evaluate_item(task):
+    """
+    Worker: forecasts one item for one fold and returns the quantity the market list would order, the total of the
+    daily forecast path over the horizon and the actual usage over the horizon
+    """
+    handle, item, cutoff, actual, engine, horizon, resolution = task
+    try:
+        history = handle.attach().item_history(item, until=cutoff)
+        # Engines forecast from the last recorded issue, so extend the path to reach past the cutoff
+        gap = (cutoff - history["Date"].max()).days
+        forecast = get_engine(engine, resolution, horizon)(history, gap + horizon)
+        if forecast is None:
+            ordered, path_total = 0.0, 0.0
+        else:
+            # create_market_list orders the raw prediction for the last day of a `horizon`-day forecast from the
+            # last issue (forecasting.forecast_last_day), which is this path's day `horizon`
+            ordered = max(0.0, float(forecast["yhat"].iloc[horizon - 1]))
+            window = forecast.loc[forecast["Date"] > cutoff, "yhat"].clip(lower=0)
+            path_total = float(window.sum())
+        error = None
+    except Exception as e:
+        ordered, path_total, error = np.nan, np.nan, str(e)
+
+    return {"Item name": item, "Cutoff": cutoff, "Engine": engine, "Resolution": resolution,
+            "Forecast": ordered, "Path Total": path_total, "Actual": actual, "Error": error}
+
+
+def run_backtest(issues_df, engine="prophet", items=None, n_folds=4, horizon=30, workers=None, cache_dir=CACHE_DIR,
+                 resolution="daily"):
+    """
+    Replays the issues voucher from `n_folds` cutoffs and evaluates `engine` on every item and fold in parallel,
+    fitting at `resolution` (see forecasting.get_engine).
+
+    Returns (results, item_report, category_report):
+    - results: one row per item x fold with the forecast (the uncushioned quantity create_market_list orders),
+      the total of the daily forecast path and the actual usage over the horizon
+    - item_report / category_report: MAE, WAPE (sum of absolute errors over sum of actuals) and accuracy (1 - WAPE)
+      of the ordered quantity, plus the WAPE of the path total ("Path WAPE")
+    """
+    if engine != "auto":
+        get_engine(engine, resolution, horizon)  # fail fast on a bad engine name or resolution
+
+    start = time.perf_counter()
+    handle = load_matrix(issues_df, cache_dir)
+    matrix = handle.attach()
+    if items is None:
+        items = matrix.items
+    items = [item for item in items if item in matrix.item_index]
+
+    # Column of every item's first issue, so items are only backtested once they have history
+    first_issue = np.argmax(~np.isnan(matrix.values), axis=1)
+
+    tasks = []
+    for cutoff in get_cutoffs(issues_df, n_folds, horizon):
+        actual = build_fold(matrix, cutoff, horizon)
+        fold_items = [item for item in items if first_issue[matrix.item_index[item]] <= matrix.column(cutoff)]
+        # With engine='auto' items are routed by the demand class of their history up to the cutoff; items with no
+        # class are routed like 'insufficient' ones
+        routes = classify_demand(matrix.to_frame(until=cutoff))["Engine"] if engine == "auto" else {}
+        unrouted = ROUTES["insufficient"] if engine == "auto" else engine
+        for item in fold_items:
+            tasks.append((handle, item, cutoff, float(actual[item]), routes.get(item, unrouted), horizon, resolution))
+
+    print(f"Backtesting {engine} ({resolution}) on {len(items)} items x {n_folds} folds ({len(tasks)} fits)...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = pd.DataFrame(list(executor.map(_evaluate_item, tasks, chunksize=8)))
+
+    if results.empty:
+        return results, pd.DataFrame(), pd.DataFrame()
+
+    item_categories = issues_df.drop_duplicates("Item name", keep="last").set_index("Item name")["Category"]
+    results["Category"] = results["Item name"].map(item_categories)
+    results["Abs Error"] = (results["Forecast"] - results["Actual"]).abs()
+    results["Path Abs Error"] = (results["Path Total"] - results["Actual"]).abs()
+
+    item_report = _error_report(results, "Item name")
+    category_report = _error_report(results, "Category")
+
+    failed = results["Error"].notna().sum()
+    overall = 1 - results["Abs Error"].sum() / max(results["Actual"].sum(), 1e-9)
+    path_overall = 1 - results["Path Abs Error"].sum() / max(results["Actual"].sum(), 1e-9)
+    print(f"Backtest finished in {time.perf_counter() - start:.1f}s: overall accuracy {overall:.1%} of the ordered "
+          f"quantity ({path_overall:.1%} of the forecast path total), {failed} failed fits")
+
+    return results, item_report, category_report
+
+
+def _error_report(results, key):
+    grouped = results.dropna(subset=["Forecast"]).groupby(key)
+    report = pd.DataFrame({
+        "Folds": grouped.size(),
+        "MAE": grouped["Abs Error"].mean(),
+        "WAPE": grouped["Abs Error"].sum() / grouped["Actual"].sum().replace(0, np.nan),
+        "Path WAPE": grouped["Path Abs Error"].sum() / grouped["Actual"].sum().replace(0, np.nan),
+    })
+    report["Accuracy"] = (1 - report["WAPE"]).clip(lower=0)
+    return report.sort_values("WAPE")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the forecasting engines")
+    parser.add_argument("--engine", default="prophet")
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--horizon", type=int, default=30)
+    parser.add_argument("--resolution", default="daily", help="daily, weekly, auto or a bucket size in days")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--items", type=int, default=150, help="Backtest only the top N items by issue frequency")
+    parser.add_argument("--output", default=None, help="Optional CSV path for the per-item report")
+    args = parser.parse_args()
+
+    from main import MarketList
+
+    mkl = MarketList()
+    issues_df = mkl.get_issue_voucher()
+    top_items = issues_df["Item name"].value_counts().head(args.items).index.tolist()
+
+    results, item_report, category_report = run_backtest(
+        issues_df, engine=args.engine, items=top_items, n_folds=args.folds, horizon=args.horizon,
+        workers=args.workers, resolution=int(args.resolution) if args.resolution.isdigit() else args.resolution
+    )
+    print(category_report.to_string())
+    if args.output:
+        item_report.to_csv(args.output)
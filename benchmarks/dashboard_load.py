@@ -0,0 +1,129 @@
+"""
+Concurrent-session load test of dashboard.py against a local Sheets stand-in.
+
+Drives `--sessions` simulated users, each rendering the dashboard `--renders` times (first visit plus reruns),
+with Streamlit's AppTest in one process, the way Streamlit serves sessions. Sheets calls go to FakeSheetsClient
+with configurable latency and injected 429s. Reported: page render latency (first visit and reruns), backend
+fetches per session by call type, downloaded bytes, coalesced fetches, quota-limiter waits, peak process memory
+and the share of renders that showed an error. Compare runs before and after a caching or rate-limit change.
+
+Usage:
+    python benchmarks/dashboard_load.py --sessions 10 --renders 3 --latency 0.3 --jitter 0.2
+    python benchmarks/dashboard_load.py --sessions 10 --error-rate 0.05 2>/dev/null   # report only, no Streamlit logs
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from fake_sheets import FakeSheetsClient, synthetic_sheets  # noqa: E402
+
+DASHBOARD = os.path.join(ROOT, "dashboard.py")
+
+
+def _percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_session(session, renders, timeout, stagger):
+    """
+    One simulated user: a first visit followed by reruns. Returns (render seconds, error messages per render)
+    :return:
+    """
+    from streamlit.testing.v1 import AppTest
+
+    time.sleep(session * stagger)
+    app = AppTest.from_file(DASHBOARD, default_timeout=timeout)
+    latencies, errors = [], []
+    for _ in range(renders):
+        start = time.perf_counter()
+        try:
+            app.run()
+            messages = [element.value for element in app.error] + [exc.message for exc in app.exception]
+        except Exception as e:
+            # The script did not finish within the timeout
+            messages = [f"{type(e).__name__}: {e}"]
+        latencies.append(time.perf_counter() - start)
+        errors.append(messages)
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of the dashboard")
+    parser.add_argument("--sessions", type=int, default=10, help="Simulated concurrent users (default: 10)")
+    parser.add_argument("--renders", type=int, default=3, help="Page renders per session (default: 3)")
+    parser.add_argument("--stagger", type=float, default=0.0, help="Seconds between session starts")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per Sheets call (default: 0.2)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Extra random seconds per call (default: 0.1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 429 per call")
+    parser.add_argument("--items", type=int, default=300, help="Items in the synthetic sheets (default: 300)")
+    parser.add_argument("--days", type=int, default=730, help="Days of issues history (default: 730)")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds before a render counts as failed")
+    args = parser.parse_args()
+
+    import gspread
+
+    import caching
+    from sheets import default_limiter, default_single_flight, default_usage
+
+    print(f"Generating {args.items} items x {args.days} days of synthetic sheets...")
+    client = FakeSheetsClient(synthetic_sheets(args.items, args.days), latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate)
+    gspread.service_account = lambda *a, **k: client
+
+    caching.clear_all()
+    default_single_flight.reset_stats()
+    waited_before = default_limiter.waited
+    usage_before = default_usage.snapshot()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        results = list(pool.map(lambda session: run_session(session, args.renders, args.timeout, args.stagger),
+                                range(args.sessions)))
+    wall = time.perf_counter() - start
+
+    first = [latencies[0] for latencies, _ in results]
+    reruns = [seconds for latencies, _ in results for seconds in latencies[1:]]
+    render_errors = [messages for _, errors in results for messages in errors]
+    failed = [messages for messages in render_errors if messages]
+    coalesced = sum(counters["coalesced"] for counters in default_single_flight.stats().values())
+
+    print(f"\n{args.sessions} sessions x {args.renders} renders in {wall:.1f}s "
+          f"(latency {args.latency}s + up to {args.jitter}s, 429 rate {args.error_rate:.0%})")
+    print(f"{'render':<12}{'p50':>8}{'p95':>8}{'max':>8}")
+    for name, values in (("first visit", first), ("rerun", reruns)):
+        print(f"{name:<12}{_percentile(values, 0.5):>7.2f}s{_percentile(values, 0.95):>7.2f}s"
+              f"{max(values, default=float('nan')):>7.2f}s")
+
+    print(f"\n{'backend call':<20}{'total':>8}{'per session':>13}{'MB':>8}{'429s':>6}")
+    for name, count in sorted(client.calls.items()):
+        print(f"{name:<20}{count:>8}{count / args.sessions:>13.1f}{client.bytes[name] / 1e6:>8.1f}"
+              f"{client.errors[name]:>6}")
+    total_calls = sum(client.calls.values())
+    print(f"{'all':<20}{total_calls:>8}{total_calls / args.sessions:>13.1f}{sum(client.bytes.values()) / 1e6:>8.1f}"
+          f"{sum(client.errors.values()):>6}")
+
+    metered = default_usage.since(usage_before)
+    print(f"Metered by MarketList: {metered['reads']} reads, {metered['writes']} writes, "
+          f"{metered['drive']} Drive revision lookups")
+
+    print(f"\nCoalesced fetches: {coalesced}")
+    print(f"Quota limiter waits: {default_limiter.waited - waited_before:.1f}s")
+    print(f"Peak process memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB "
+          f"({(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.0f} MB during the test)")
+    print(f"Renders with errors: {len(failed)}/{len(render_errors)} ({len(failed) / max(1, len(render_errors)):.0%})")
+    for message in sorted({message for messages in failed for message in messages})[:10]:
+        print(f"  {message}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Local stand-in for the gspread client, for load tests and offline runs.
+
+FakeSheetsClient serves synthetic issues voucher, dormant stock, stock, extras and market list worksheets from
+memory. Every API call sleeps for a configurable latency and can fail with an injected 429, and every call is
+counted (with the bytes it returned), so a run can report how many backend fetches it really made. It covers the
+calls MarketList makes: open_by_key, worksheet, row_values, get_all_values, values_get, values_batch_get,
+values_batch_update, add_rows and the Drive `version` lookup of sheets.DriveRevisions.
+"""
+import random
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+STOCK_COLUMNS = ["Stock Name", "Category", "Ptn Name", "Rate", "Case Qty", "Bundle Qty", "Bundle_qty Unit",
+                 "Safety Stock_80_Sl", "Reorder Point", "Daily Average", "Daily Std", "Sample Size",
+                 "Last Issued (In Days)", "Current Balance", "Ptn Qty"]
+CATEGORIES = ["FOOD ITEM", "BEVERAGE", "CLEANING SUPPLY", "GUEST SUPPLY", "CONSUMABLE", "PRINTING AND STATIONERIES"]
+
+
+class FakeAPIError(Exception):
+    """Raised for injected failures; the message carries the HTTP status like gspread's APIError"""
+
+
+class _Response:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+def synthetic_sheets(n_items=300, days=730, seed=0):
+    """
+    {spreadsheet key: {worksheet title: rows}} for a property using main.DEFAULT_SHEETS' keys and titles
+    :return:
+    """
+    from main import DEFAULT_SHEETS
+
+    rng = np.random.default_rng(seed)
+    items = [f"ITEM {i:04d}" for i in range(n_items)]
+    categories = {item: CATEGORIES[i % len(CATEGORIES)] for i, item in enumerate(items)}
+
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=days)
+    issue_rate = rng.uniform(0.05, 0.9, n_items)
+    hits = rng.random((n_items, days)) < issue_rate[:, None]
+    rows, cols = np.nonzero(hits)
+    issues = [["Date", "Item name", "Category", "Usage", "Dept"]] + [
+        [dates[col].strftime("%Y-%m-%d"), items[row], categories[items[row]], str(int(rng.integers(1, 20))),
+         "KITCHEN"]
+        for row, col in zip(rows, cols)
+    ]
+
+    stock = [STOCK_COLUMNS] + [
+        [item, categories[item], "pcs", str(int(rng.integers(100, 5000))), "1", "12", "Carton", "", "", "", "", "",
+         "", str(int(rng.integers(0, 50))), "1"]
+        for item in items
+    ]
+
+    market_list = [["", "", "", "", ""]] * 3 + [
+        [item, "2 pcs", "1.0 Carton", "1200", "1200.0"] for item in items[:40]
+    ]
+
+    sheets = {}
+
+    def add(source, worksheet, rows):
+        sheets.setdefault(DEFAULT_SHEETS[source]["key"], {})[worksheet] = rows
+
+    add("issues", DEFAULT_SHEETS["issues"]["worksheet"], issues)
+    add("dormant", DEFAULT_SHEETS["dormant"]["worksheet"], [["Stock Name"], [items[-1]]])
+    add("stock", DEFAULT_SHEETS["stock"]["worksheet"], stock)
+    add("extras", DEFAULT_SHEETS["extras"]["worksheet"], [["Stock Name", "Current Bal", "Buy", "Rate", "Amount"]])
+    for section in ("house", "staff", "chemicals"):
+        add("output", DEFAULT_SHEETS["output"][section], market_list)
+    return sheets
+
+
+class FakeSheetsClient:
+    """
+    - sheets: {spreadsheet key: {worksheet title: rows}} (synthetic_sheets() by default)
+    - latency / jitter: seconds slept per call (uniform jitter added on top)
+    - error_rate: probability that a call fails with a 429
+    """
+
+    def __init__(self, sheets=None, latency=0.05, jitter=0.0, error_rate=0.0, seed=0):
+        self.sheets = sheets if sheets is not None else synthetic_sheets()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self.bytes = Counter()
+        self.errors = Counter()
+        self.versions = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # gspread >= 6 exposes request() on its http client
+        self.http_client = self
+
+    def _call(self, name, payload=None):
+        with self._lock:
+            self.calls[name] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors[name] += 1
+            elif payload is not None:
+                self.bytes[name] += len(repr(payload))
+        time.sleep(delay)
+        if failed:
+            raise FakeAPIError(f"APIError: [429]: Quota exceeded for quota metric 'Read requests' ({name})")
+        return payload
+
+    def reset_counters(self):
+        with self._lock:
+            for counter in (self.calls, self.bytes, self.errors):
+                counter.clear()
+
+    def edit(self, key, worksheet, rows):
+        """Replaces a worksheet's rows and bumps the spreadsheet's Drive version, like an edit in the Sheets UI"""
+        with self._lock:
+            self.sheets[key][worksheet] = rows
+            self.versions[key] += 1
+
+    # gspread.Client
+    def open_by_key(self, key):
+        self._call("open_by_key")
+        if key not in self.sheets:
+            raise FakeAPIError(f"APIError: [404]: Requested entity was not found ({key})")
+        return _FakeSpreadsheet(self, key)
+
+    def request(self, method, endpoint, params=None, **kwargs):
+        key = endpoint.rstrip("/").rsplit("/", 1)[-1]
+        return _Response(self._call("drive_version", {"version": str(self.versions[key] + 1)}))
+
+
+class _FakeSpreadsheet:
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key
+
+    def worksheet(self, title):
+        self.client._call("worksheet")
+        return _FakeWorksheet(self.client, self.key, title)
+
+    def _range_rows(self, a1):
+        title, _, cells = a1.rpartition("!")
+        title = title.strip("'").replace("''", "'")
+        bounds = ["".join(ch for ch in bound if ch.isdigit()) for bound in cells.split(":")]
+        first_row = int(bounds[0] or 1)
+        last_row = int(bounds[1]) if len(bounds) > 1 and bounds[1] else None
+        rows = self.client.sheets[self.key][title][first_row - 1:last_row]
+        # Like the API, trailing empty rows are not returned
+        while rows and not any(rows[-1]):
+            rows = rows[:-1]
+        return [list(row) for row in rows]
+
+    def values_get(self, a1):
+        return self.client._call("values_get", {"range": a1, "values": self._range_rows(a1)})
+
+    def values_batch_get(self, ranges):
+        value_ranges = [{"range": a1, "values": self._range_rows(a1)} for a1 in ranges]
+        return self.client._call("values_batch_get", {"valueRanges": value_ranges})
+
+    def values_batch_update(self, body):
+        self.client._call("values_batch_update")
+        with self.client._lock:
+            self.client.versions[self.key] += 1
+        return {"totalUpdatedCells": sum(len(row) for data in body["data"] for row in data["values"])}
+
+
+class _FakeWorksheet:
+    def __init__(self, client, key, title):
+        self.client = client
+        self.key = key
+        self.title = title
+        self.spreadsheet = _FakeSpreadsheet(client, key)
+        self.row_count = max(1000, len(self._rows))
+
+    @property
+    def _rows(self):
+        return self.client.sheets[self.key][self.title]
+
+    def row_values(self, row):
+        return self.client._call("row_values", list(self._rows[row - 1]))
+
+    def get_all_values(self):
+        return self.client._call("get_all_values", [list(row) for row in self._rows])
+
+    def add_rows(self, rows):
+        self.client._call("add_rows")
+        self.row_count += rows
@@ -0,0 +1,126 @@
+"""
+Peak memory of loading the issues voucher: whole-sheet load vs streaming row pages.
+
+The whole-sheet loader is the previous MarketList._load_issue_voucher (get_all_values, a quote-stripped copy, a
+dataframe and its grouped copy). The streaming loader is the current one, reading `--page-rows` rows per request
+and folding each page into the aggregate. Both read the same synthetic Issues sheet from FakeSheetsClient; peak
+Python/numpy allocations are measured with tracemalloc and the two results are checked to be identical, also
+with blank rows at a page boundary.
+
+Usage:
+    python benchmarks/ingest_memory.py --items 600 --years 2 4 8
+    python benchmarks/ingest_memory.py --items 600 --years 8 --page-rows 5000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from fake_sheets import FakeSheetsClient, synthetic_sheets  # noqa: E402
+
+
+def whole_sheet_load(mkl):
+    """The loader before streaming, kept for comparison"""
+    worksheet = mkl.open_source_worksheet("issues")
+    columns = worksheet.row_values(1)
+    data = worksheet.get_all_values()
+    data = [[str(x).replace('"', '') for x in record] for record in data]
+    df = pd.DataFrame(data)
+    df.columns = columns
+    df.drop(0, axis="rows", inplace=True)
+    df["Date"] = pd.to_datetime(df["Date"], format="%Y-%m-%d")
+    df["Usage"] = df["Usage"].str.replace(",", "").astype(float)
+    df = df.groupby(["Date", "Item name", "Category"], as_index=False).sum()
+    df = df.loc[~(df["Dept"] == "FUNCTION"), :]
+    df = df.loc[~(df["Item name"].isin(mkl.fiterout_dormant_stock())), :]
+    return df
+
+
+def streaming_load(mkl):
+    return mkl.get_issue_voucher()
+
+
+def check_blank_page_boundary(items, page_rows):
+    """
+    Blanks the rows either side of the first page boundary of the Issues sheet (values.get trims them from the
+    page, so the page comes back short) and checks streaming still reads every row after them: the result must
+    equal the whole-sheet load of the sheet with those rows deleted
+    :return:
+    """
+    from ledger import RunLedger
+    from main import DEFAULT_SHEETS, MarketList
+    from sheets import LocalRevisions, QuotaLimiter
+
+    key, title = DEFAULT_SHEETS["issues"]["key"], DEFAULT_SHEETS["issues"]["worksheet"]
+    sheets = synthetic_sheets(items, 30)
+    rows = sheets[key][title]
+    # Sheet rows page_rows - 1 .. page_rows + 1: the last two rows of the first page and the first of the next
+    boundary = range(page_rows - 2, page_rows + 1)
+    blanked = [[""] * len(row) if i in boundary else row for i, row in enumerate(rows)]
+    deleted = [row for i, row in enumerate(rows) if i not in boundary]
+
+    results = []
+    for sheet_rows, loader in ((deleted, whole_sheet_load), (blanked, streaming_load)):
+        client = FakeSheetsClient({**sheets, key: {title: sheet_rows}}, latency=0)
+        mkl = MarketList(gc=client, limiter=QuotaLimiter(10 ** 6, 10 ** 6), revisions=LocalRevisions(),
+                         ledger=RunLedger(":memory:"), issues_page_rows=page_rows)
+        results.append(measure(loader, mkl)[0])
+
+    columns = ["Date", "Item name", "Category", "Usage"]
+    pd.testing.assert_frame_equal(results[0][columns].reset_index(drop=True), results[1][columns],
+                                  check_dtype=False)
+    print(f"Blank rows at the page {page_rows} boundary: {len(rows) - 1 - len(boundary):,} rows read, identical")
+
+
+def measure(loader, mkl):
+    import caching
+
+    caching.clear_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = loader(mkl)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, peak / 2 ** 20, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=600)
+    parser.add_argument("--years", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--page-rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    from ledger import RunLedger
+    from main import DEFAULT_SHEETS, MarketList
+    from sheets import LocalRevisions, QuotaLimiter
+
+    print(f"{'years':>6}{'rows':>11}{'whole sheet':>14}{'streaming':>12}{'pages':>7}{'whole s':>9}{'stream s':>10}")
+    for years in args.years:
+        client = FakeSheetsClient(synthetic_sheets(args.items, 365 * years), latency=0)
+        mkl = MarketList(gc=client, limiter=QuotaLimiter(10 ** 6, 10 ** 6), revisions=LocalRevisions(),
+                         ledger=RunLedger(":memory:"), issues_page_rows=args.page_rows)
+        whole_df, whole_mb, whole_s = measure(whole_sheet_load, mkl)
+        client.reset_counters()
+        stream_df, stream_mb, stream_s = measure(streaming_load, mkl)
+
+        columns = ["Date", "Item name", "Category", "Usage"]
+        pd.testing.assert_frame_equal(whole_df[columns].reset_index(drop=True), stream_df[columns],
+                                      check_dtype=False)
+        rows = len(client.sheets[DEFAULT_SHEETS["issues"]["key"]][DEFAULT_SHEETS["issues"]["worksheet"]]) - 1
+        print(f"{years:>6}{rows:>11,}"
+              f"{whole_mb:>11.1f} MB{stream_mb:>9.1f} MB{client.calls['values_get']:>7}"
+              f"{whole_s:>8.1f}s{stream_s:>9.1f}s")
+
+    check_blank_page_boundary(args.items, min(args.page_rows, 500))
+
+
+if __name__ == "__main__":
+    main()
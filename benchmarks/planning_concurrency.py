@@ -0,0 +1,127 @@
+"""
+Concurrency check of the per-item purchase planning: parallel planning must give exactly the serial market lists.
+
+Builds a plan (the dict create_market_list keeps for replanning) from FakeSheetsClient's synthetic stock, with
+random forecasts, staff/house splits, chemicals and batch-priced items that read their recent purchases, then:
+- plans it serially, on a thread pool and on a process pool and checks the three market lists are identical
+- runs `--replans` what-if replans with different safety cushions, balance overrides and staff shares from
+  `--threads` threads on one shared MarketList and checks every result against the same replan run serially
+
+Usage:
+    python benchmarks/planning_concurrency.py --items 600 --threads 8 --replans 32
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from fake_sheets import FakeSheetsClient, synthetic_sheets  # noqa: E402
+
+
+def with_batches_and_purchases(sheets, every=5, seed=0):
+    """Makes every `every`th stock item batch priced and gives it a purchase history"""
+    from main import DEFAULT_SHEETS
+
+    rng = random.Random(seed)
+    stock = sheets[DEFAULT_SHEETS["stock"]["key"]][DEFAULT_SHEETS["stock"]["worksheet"]]
+    unit = stock[0].index("Bundle_qty Unit")
+    purchases = [["Date", "Stock Name", "Category", "Qty_Received", "Rate", "Amount"]]
+    for row in stock[1::every]:
+        row[unit] = "Batch(1 X 12/5)"
+        for day in range(1, 6):
+            qty = rng.randint(6, 30)
+            purchases.append([f"2024-01-{day:02d}", row[0], row[1], str(qty), "450", str(qty * 450)])
+    sheets.setdefault(DEFAULT_SHEETS["purchases"]["key"], {})[DEFAULT_SHEETS["purchases"]["worksheet"]] = purchases
+    return sheets
+
+
+def synthetic_plan(mkl, seed=0):
+    """A plan like create_market_list's, on the fake stock sheet with random forecasts"""
+    rng = random.Random(seed)
+    stock_df = mkl.get_stock_data()
+    items = stock_df["Stock Name"].tolist()
+    return {
+        "run_id": "planning-concurrency",
+        "items": items,
+        "raw_forecasts": {item: float(rng.choice([0, rng.uniform(1, 400)])) for item in items},
+        "stock_df": stock_df,
+        "issues_df": pd.DataFrame(columns=["Date", "Item name", "Category", "Usage"]),
+        "extras_df": pd.DataFrame(columns=["Stock Name", "Current Bal", "Buy", "Rate", "Amount"]),
+        "usage_proportions": {item: {"STAFF FOOD": rng.uniform(0.1, 0.9)} for item in items[::3]},
+        "staff_food": items[::7],
+        "chemicals": stock_df.loc[stock_df["Category"] == "CLEANING SUPPLY", "Stock Name"].tolist(),
+        "settings": {"forecast_period": "monthly", "forecast_days": 30, "engine": "prophet"},
+    }
+
+
+def what_if(plan, n, seed=0):
+    """`n` (safety cushion, balance overrides, staff shares) scenarios"""
+    rng = random.Random(seed)
+    scenarios = []
+    for _ in range(n):
+        items = rng.sample(plan["items"], 20)
+        scenarios.append((round(rng.uniform(1.0, 1.5), 2),
+                          {item: rng.randint(0, 300) for item in items[:10]},
+                          {item: round(rng.uniform(0, 1), 2) for item in items[10:]}))
+    return scenarios
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=600)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--replans", type=int, default=32)
+    args = parser.parse_args()
+
+    from ledger import RunLedger
+    from main import MarketList
+    from sheets import LocalRevisions, QuotaLimiter
+
+    client = FakeSheetsClient(with_batches_and_purchases(synthetic_sheets(args.items, 30)), latency=0)
+    mkl = MarketList(gc=client, limiter=QuotaLimiter(10 ** 6, 10 ** 6), revisions=LocalRevisions(),
+                     ledger=RunLedger(":memory:"))
+    plan = synthetic_plan(mkl)
+
+    serial, serial_s = timed(lambda: mkl.replan(plan=plan))
+    rows = sum(len(section) for section in serial["sections"].values())
+    print(f"{len(plan['items'])} items -> {rows} market list rows")
+    print(f"{'planning':<22}{'seconds':>9}  identical")
+    print(f"{'serial':<22}{serial_s:>9.3f}")
+    with ThreadPoolExecutor(args.threads) as pool:
+        threaded, threaded_s = timed(lambda: mkl.replan(plan=plan, executor=pool))
+    with ProcessPoolExecutor(args.processes) as pool:
+        processes, processes_s = timed(lambda: mkl.replan(plan=plan, executor=pool))
+    for name, result, seconds in ((f"{args.threads} threads", threaded, threaded_s),
+                                  (f"{args.processes} processes", processes, processes_s)):
+        same = result["sections"] == serial["sections"]
+        print(f"{name:<22}{seconds:>9.3f}  {same}")
+        assert same, f"{name} planning differs from serial planning"
+
+    scenarios = what_if(plan, args.replans)
+    expected, expected_s = timed(lambda: [mkl.replan(*scenario, plan=plan) for scenario in scenarios])
+    with ThreadPoolExecutor(args.threads) as pool:
+        concurrent, concurrent_s = timed(lambda: list(pool.map(lambda scenario: mkl.replan(*scenario, plan=plan),
+                                                               scenarios)))
+    mismatches = sum(got["sections"] != want["sections"] or got["totals"] != want["totals"]
+                     for got, want in zip(concurrent, expected))
+    print(f"\n{args.replans} what-if replans: serial {expected_s:.2f}s, {args.threads} threads on one MarketList "
+          f"{concurrent_s:.2f}s, {mismatches} differing from serial")
+    assert not mismatches, "concurrent replans differ from serial replans"
+
+
+if __name__ == "__main__":
+    main()
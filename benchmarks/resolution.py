@@ -0,0 +1,116 @@
+"""
+Daily vs bucketed fitting resolution: fit time and backtest error on the top items.
+
+Runs backtest.run_backtest on the `--items` most issued items once per resolution (daily, weekly and any extra
+bucket sizes) and reports the wall time of the fits with WAPE and accuracy over the horizon, so the speed-up of
+fitting on weekly totals can be weighed against what it costs in accuracy for the horizon in use.
+
+First checks that every resolution gives the same order quantity, the last-day forecast create_market_list
+cushions and buys (usage per issue day), on items issued a fixed amount every 1, 3, 7 and 14 days, and that
+hierarchical mode's split of one category fit gives the same quantities as fitting those items one by one.
+
+Usage:
+    python benchmarks/resolution.py --engine prophet --horizon 60 --items 50
+    python benchmarks/resolution.py --engine croston --resolutions daily weekly 14 --live
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from backtest import run_backtest  # noqa: E402
+from forecasting import forecast_last_day, item_usage_shares  # noqa: E402
+from usage_matrix_memory import synthetic_voucher  # noqa: E402
+
+
+def check_units(engine, resolutions, horizon, tolerance=0.15):
+    """
+    Last-day forecasts (what create_market_list orders) per resolution for regularly issued items; fails when a
+    resolution is more than `tolerance` off the first one
+    :return:
+    """
+    print(f"{'issued every':<14}" + "".join(f"{str(resolution):>10}" for resolution in resolutions))
+    for every_days, quantity in ((1, 10), (3, 30), (7, 70), (14, 70)):
+        history = pd.DataFrame({"Date": pd.date_range("2023-01-01", periods=730 // every_days,
+                                                      freq=f"{every_days}D"), "Usage": float(quantity)})
+        values = [forecast_last_day(history, horizon, engine, resolution) for resolution in resolutions]
+        print(f"{f'{every_days}d x {quantity}':<14}" + "".join(f"{value:>10.1f}" for value in values))
+        for resolution, value in zip(resolutions[1:], values[1:]):
+            assert abs(value - values[0]) <= tolerance * values[0], \
+                f"{resolution} forecasts {value:.1f} where {resolutions[0]} forecasts {values[0]:.1f}"
+
+
+def check_category_split(engine, horizon, tolerance=0.15):
+    """
+    Hierarchical mode's order quantities: one fit on the category's usage per issue Date, split by the items'
+    per-issue-day shares, must match each item's own fit; fails when an item is more than `tolerance` off
+    :return:
+    """
+    # Cadences a 7-day window always sees the same share of, so the category level does not swing with the day
+    category_df = pd.concat([
+        pd.DataFrame({"Date": pd.date_range(end=pd.Timestamp("2024-12-31") - pd.Timedelta(days=offset),
+                                            periods=730 // every_days, freq=f"{every_days}D"),
+                      "Item name": f"{every_days}d x {quantity}", "Usage": float(quantity)})
+        for every_days, quantity, offset in ((1, 10, 0), (7, 70, 0), (7, 140, 3))], ignore_index=True)
+    category_forecast = forecast_last_day(category_df.groupby("Date")["Usage"].sum().reset_index(), horizon, engine)
+    shares = item_usage_shares(category_df, per_issue_day=True)
+    print(f"\n{'issued every':<14}{'per-item':>10}{'category':>10}")
+    for item, history in category_df.groupby("Item name"):
+        own = forecast_last_day(history[["Date", "Usage"]], horizon, engine)
+        split = category_forecast * shares[item]
+        print(f"{item:<14}{own:>10.1f}{split:>10.1f}")
+        assert abs(split - own) <= tolerance * own, f"{item}: category split forecasts {split:.1f}, own fit {own:.1f}"
+
+
+def compare(issues_df, engine, resolutions, horizon, n_folds, n_items, workers):
+    top_items = issues_df["Item name"].value_counts().head(n_items).index.tolist()
+    rows = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Build the memory-mapped usage matrix once so neither resolution pays for it
+        run_backtest(issues_df, engine, items=top_items[:1], n_folds=1, horizon=horizon, workers=1,
+                     cache_dir=cache_dir)
+        for resolution in resolutions:
+            start = time.perf_counter()
+            results, _, _ = run_backtest(issues_df, engine, items=top_items, n_folds=n_folds, horizon=horizon,
+                                         workers=workers, cache_dir=cache_dir, resolution=resolution)
+            elapsed = time.perf_counter() - start
+            fitted = results.dropna(subset=["Forecast"])
+            wape = fitted["Abs Error"].sum() / max(fitted["Actual"].sum(), 1e-9)
+            rows.append((str(resolution), elapsed, len(results), len(results) - len(fitted), wape))
+
+    baseline = rows[0][1]
+    print(f"\n{engine}, {len(top_items)} items x {n_folds} folds, {horizon}-day horizon")
+    print(f"{'resolution':<12}{'fit time':>10}{'speed-up':>10}{'fits':>7}{'failed':>8}{'WAPE':>8}{'accuracy':>10}")
+    for resolution, elapsed, fits, failed, wape in rows:
+        print(f"{resolution:<12}{elapsed:>9.1f}s{baseline / elapsed:>9.1f}x{fits:>7}{failed:>8}{wape:>8.1%}"
+              f"{max(0.0, 1 - wape):>10.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", default="prophet")
+    parser.add_argument("--resolutions", nargs="+", default=["daily", "weekly"],
+                        help="daily, weekly, auto or bucket sizes in days; the first one is the baseline")
+    parser.add_argument("--horizon", type=int, default=60)
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--items", type=int, default=50, help="Top N items by issue frequency (default: 50)")
+    parser.add_argument("--years", type=int, default=3, help="Years of synthetic history (default: 3)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--live", action="store_true", help="Measure on the real issues voucher")
+    args = parser.parse_args()
+
+    if args.live:
+        from main import MarketList
+        voucher = MarketList().get_issue_voucher()
+    else:
+        voucher = synthetic_voucher(max(args.items, 50), args.years)
+    resolutions = [int(r) if r.isdigit() else r for r in args.resolutions]
+    check_units(args.engine, resolutions, args.horizon)
+    check_category_split(args.engine, args.horizon)
+    compare(voucher, args.engine, resolutions, args.horizon, args.folds, args.items, args.workers)
@@ -0,0 +1,47 @@
+"""
+Startup time of the headless entry point compared with what importing the old main.py cost.
+
+The old main.py imported streamlit and prophet at module level; a cron job running it paid for both before doing
+any work. Each command runs in a fresh interpreter, `--repeat` times, and the median wall time is reported.
+
+Usage:
+    python benchmarks/startup.py --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "old main.py imports (streamlit, prophet, gspread, pandas)":
+        [sys.executable, "-c", "import streamlit, prophet, gspread, pandas, numpy, dotenv"],
+    "import main (MarketList)": [sys.executable, "-c", "import main"],
+    "cli.py --help": [sys.executable, "cli.py", "--help"],
+}
+
+
+def measure(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None, result.stderr.decode(errors="replace").strip().splitlines()[-1]
+    return statistics.median(timings), None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'Command':<60}{'Median (s)':>12}")
+    for label, command in COMMANDS.items():
+        seconds, error = measure(command, args.repeat)
+        print(f"{label:<60}{seconds:>12.2f}" if error is None else f"{label:<60}{'failed':>12}  ({error})")
+    print("Per-module breakdown: python -X importtime -c 'import main' 2> importtime.log")
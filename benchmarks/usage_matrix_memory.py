@@ -0,0 +1,122 @@
+"""
+Per-worker memory of sending the issues voucher to worker processes: pickled issues_df vs shared usage matrix.
+
+Each worker reads the histories of a few items, either from an issues_df received as a task argument (what a
+multi-process MarketList would have to do) or from the shared float32 item x day matrix. The pickled payload and
+the growth of each worker's private (anonymous) resident memory are reported. Linux only for the RSS figures.
+
+Usage:
+    python benchmarks/usage_matrix_memory.py --items 600 --years 5 --workers 4
+    python benchmarks/usage_matrix_memory.py --live   # use the real issues voucher
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usage_matrix import UsageMatrix  # noqa: E402
+
+_baseline = None
+
+
+def _rss_anon_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _init_worker():
+    global _baseline
+    _baseline = _rss_anon_kb()
+
+
+def _read_from_dataframe(issues_df, items):
+    total = 0.0
+    for item in items:
+        total += issues_df.loc[issues_df["Item name"] == item, "Usage"].sum()
+    return _rss_anon_kb() - _baseline, total
+
+
+def _read_from_matrix(handle, items):
+    matrix = handle.attach()
+    total = 0.0
+    for item in items:
+        total += float(np.nansum(matrix.row(item)))
+    return _rss_anon_kb() - _baseline, total
+
+
+def synthetic_voucher(n_items=600, years=5, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=365 * years, freq="D")
+    rates = rng.uniform(0.05, 0.9, n_items)
+    frames = []
+    for i, rate in enumerate(rates):
+        issue_days = dates[rng.random(len(dates)) < rate]
+        frames.append(pd.DataFrame({
+            "Date": issue_days,
+            "Item name": f"ITEM {i:04d}",
+            "Category": ["FOOD ITEM", "BEVERAGE", "CLEANING SUPPLY", "GUEST SUPPLY"][i % 4],
+            "Dept": "KITCHEN",
+            "Usage": rng.integers(1, 20, len(issue_days)).astype(float),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def measure(issues_df, workers=4, items_per_task=20):
+    items = issues_df["Item name"].unique().tolist()
+    chunks = [items[i:i + items_per_task] for i in range(0, workers * items_per_task, items_per_task)]
+    context = multiprocessing.get_context("spawn")
+
+    matrix = UsageMatrix.from_issues(issues_df)
+    handle, block = matrix.to_shared_memory()
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker) as executor:
+            df_results = list(executor.map(_read_from_dataframe, [issues_df] * len(chunks), chunks))
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker) as executor:
+            matrix_results = list(executor.map(_read_from_matrix, [handle] * len(chunks), chunks))
+    finally:
+        block.close()
+        block.unlink()
+
+    assert np.allclose([t for _, t in df_results], [t for _, t in matrix_results], rtol=1e-4)
+
+    df_payload = len(pickle.dumps(issues_df))
+    handle_payload = len(pickle.dumps(handle))
+    df_rss = np.mean([kb for kb, _ in df_results]) / 1024
+    matrix_rss = np.mean([kb for kb, _ in matrix_results]) / 1024
+
+    print(f"Voucher: {len(issues_df):,} rows, {len(items)} items x {matrix.values.shape[1]} days "
+          f"(shared matrix {matrix.values.nbytes / 2 ** 20:.1f} MB, stored once)")
+    print(f"{'':<22}{'Pickled per task':>18}{'Worker private RSS':>22}")
+    print(f"{'issues_df argument':<22}{df_payload / 2 ** 20:>15.2f} MB{df_rss:>19.1f} MB")
+    print(f"{'shared usage matrix':<22}{handle_payload / 2 ** 10:>15.2f} KB{matrix_rss:>19.1f} MB")
+    print(f"Per-worker saving: {df_rss - matrix_rss:.1f} MB private memory, "
+          f"{(df_payload - handle_payload) / 2 ** 20:.2f} MB pickled per task")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=600)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--live", action="store_true", help="Measure on the real issues voucher")
+    args = parser.parse_args()
+
+    if args.live:
+        from main import MarketList
+        voucher = MarketList().get_issue_voucher()
+    else:
+        voucher = synthetic_voucher(args.items, args.years)
+    measure(voucher, args.workers)
@@ -0,0 +1,112 @@
+"""
+In-process, revision-aware caching for the MarketList data loaders.
+
+Every cached dataset records the revisions of the source spreadsheets it was built from and is rebuilt only when
+one of them changes, so unchanged sheets are never downloaded again and edited sheets are never served stale.
+Revisions come from a revision source (sheets.DriveRevisions in production, sheets.LocalRevisions in tests).
+
+Works the same inside Streamlit and in headless runs (CLI, cron, worker processes) without importing Streamlit.
+Like st.cache_data, arguments whose name starts with an underscore (e.g. `_self`) are left out of the cache key.
+Cached values are shared, not copied: callers must not modify returned dataframes in place.
+"""
+import functools
+import inspect
+import threading
+import time
+
+
+class RevisionCache:
+    """
+    {key: (source revisions, built at, value)} with hit and build counters per dataset
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def get(self, key, revisions, build):
+        """
+        Returns the value cached under `key` if it was built from exactly `revisions`, otherwise calls build(),
+        stores its result against `revisions` and returns it.
+        Revisions must be read before build() starts: an edit made while building then leaves an older revision
+        on the entry, and the next call rebuilds.
+        :return:
+        """
+        with self._lock:
+            counters = self._counters.setdefault(key[0], {"hits": 0, "builds": 0})
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == revisions:
+                counters["hits"] += 1
+                return entry[2]
+
+        value = build()
+        with self._lock:
+            counters["builds"] += 1
+            self._entries[key] = (revisions, time.time(), value)
+        return value
+
+    def contains(self, key, revisions):
+        """True when `key` is cached for exactly `revisions`, i.e. get() would not build"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == revisions
+
+    def status(self):
+        """
+        {dataset: {"revisions", "built_at", "hits", "builds"}} of the most recently built entry of every dataset
+        :return:
+        """
+        with self._lock:
+            status = {dataset: dict(counters) for dataset, counters in self._counters.items()}
+            for key, (revisions, built_at, _) in self._entries.items():
+                if built_at >= status[key[0]].get("built_at", 0):
+                    status[key[0]].update(revisions=revisions, built_at=built_at)
+            return status
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+default_revision_cache = RevisionCache()
+
+
+def revision_cached(dataset, sources, cache=None):
+    """
+    Caches a MarketList loader until one of its source spreadsheets changes.
+    - dataset: name the entries and counters are kept under
+    - sources: names of the loader arguments holding the spreadsheet keys the dataset is built from
+    Revisions are read through the instance's `revisions` source. `loader.cached(*args)` tells whether a call with
+    those arguments would be served from the cache, without building anything.
+    :return:
+    """
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        def key_and_revisions(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (dataset,) + tuple(value for name, value in bound.arguments.items() if not name.startswith("_"))
+            revisions_source = bound.arguments["_self"].revisions
+            return key, tuple(revisions_source.revision(bound.arguments[name]) for name in sources)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key, revisions = key_and_revisions(args, kwargs)
+            return (cache or default_revision_cache).get(key, revisions, lambda: fn(*args, **kwargs))
+
+        def cached(*args, **kwargs):
+            return (cache or default_revision_cache).contains(*key_and_revisions(args, kwargs))
+
+        wrapper.cached = cached
+        return wrapper
+
+    return decorator
+
+
+def clear_all():
+    """Empties the loader cache of this process"""
+    default_revision_cache.clear()
@@ -0,0 +1,125 @@
+"""
+Headless command-line entry point for generating market lists (cron jobs, scripts).
+
+Only the standard library is imported at startup; pandas, gspread and the forecasting engines load once a run
+actually starts, and Streamlit is never imported.
+
+Usage:
+    python cli.py --period monthly --categories "FOOD ITEM" BEVERAGE --items 150 --workers 8
+    python cli.py --period 14 --engine auto --output market_lists/next-fortnight.xlsx
+    python cli.py --service            # fit on a running `python forecast_service.py`
+"""
+import argparse
+import sys
+import time
+
+_started = time.perf_counter()
+
+
+def parse_period(value):
+    if value in ("weekly", "monthly"):
+        return value
+    try:
+        days = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("period must be 'weekly', 'monthly' or a number of days")
+    if not 1 <= days <= 90:
+        raise argparse.ArgumentTypeError("custom periods must be between 1 and 90 days")
+    return days
+
+
+def parse_resolution(value):
+    if value in ("daily", "weekly", "auto"):
+        return value
+    try:
+        days = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("resolution must be 'daily', 'weekly', 'auto' or a number of days")
+    if days < 1:
+        raise argparse.ArgumentTypeError("bucket size must be at least 1 day")
+    return days
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Generate forecast-driven market lists")
+    parser.add_argument("--period", type=parse_period, default="monthly",
+                        help="'weekly', 'monthly' or a number of days (default: monthly)")
+    parser.add_argument("--categories", nargs="+", default=None, metavar="CATEGORY",
+                        help="Categories to include (default: the standard selection)")
+    parser.add_argument("--exclude", nargs="+", default=None, metavar="ITEM", help="Items to leave out")
+    parser.add_argument("--items", type=int, default=150, help="Maximum number of items to process (default: 150)")
+    parser.add_argument("--hierarchical", nargs="+", default=None, metavar="CATEGORY",
+                        help="Categories forecast at category level and split by usage share")
+    parser.add_argument("--engine", choices=["prophet", "moving_average", "croston", "auto"], default="prophet",
+                        help="Forecasting engine, or auto to route each item by its demand pattern (default: prophet)")
+    parser.add_argument("--resolution", type=parse_resolution, default="daily",
+                        help="Fit on 'daily' points, 'weekly' buckets, N-day buckets or 'auto' "
+                             "(weekly for periods of 30+ days) (default: daily)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Parallel forecasting workers; 1 runs everything in-process (default: 1)")
+    parser.add_argument("--pool", choices=["process", "thread"], default="process",
+                        help="Worker pool type when --workers > 1 (default: process)")
+    parser.add_argument("--service", nargs="?", const="", default=None, metavar="ADDRESS",
+                        help="Send fits to a running forecast_service.py (default address: "
+                             "FORECAST_SERVICE_ADDRESS or 127.0.0.1:6011) instead of a local pool")
+    parser.add_argument("--output", default="sheets",
+                        help="'sheets' or a .parquet/.csv/.xlsx path (default: sheets)")
+    parser.add_argument("--property", default="default", help="Property name from properties.json")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    import_start = time.perf_counter()
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    from main import MarketList
+    from properties import load_properties
+
+    print(f"Startup: {import_start - _started:.2f}s, modules loaded in {time.perf_counter() - import_start:.2f}s")
+
+    properties = load_properties()
+    if args.property not in properties:
+        print(f"Unknown property '{args.property}'. Available: {', '.join(properties)}", file=sys.stderr)
+        return 2
+
+    mkl = MarketList(property_name=args.property, sheets=properties[args.property])
+    market_list_kwargs = dict(
+        forecast_period=args.period,
+        selected_categories=args.categories,
+        excluded_items=args.exclude,
+        x_items_limit=args.items,
+        hierarchical_categories=args.hierarchical,
+        engine=args.engine,
+        resolution=args.resolution,
+        output_sink=args.output,
+    )
+
+    if args.service is not None:
+        from forecast_service import DEFAULT_ADDRESS, connect
+
+        try:
+            client = connect(args.service or DEFAULT_ADDRESS)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        if client is None:
+            print(f"No forecasting service at {args.service or DEFAULT_ADDRESS}", file=sys.stderr)
+            return 2
+        with client:
+            summary = mkl.create_market_list(executor=client, **market_list_kwargs)
+    elif args.workers > 1:
+        pool = ProcessPoolExecutor if args.pool == "process" else ThreadPoolExecutor
+        with pool(max_workers=args.workers) as executor:
+            summary = mkl.create_market_list(executor=executor, **market_list_kwargs)
+    else:
+        summary = mkl.create_market_list(**market_list_kwargs)
+
+    print(f"Done: {summary['items']} items, {summary['rows']} rows, {summary['cells_written']} cells written to "
+          f"{summary['output']} in {summary['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,7 +6,6 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import time
-from datetime import datetime
 
 # Add the current directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -60,16 +59,31 @@ st.markdown("""
 
 try:
     # Import your enhanced MarketList class
+    import caching
     from main import MarketList
-    
+    from output import parse_market_list_rows
+    from properties import load_properties
+    from sheets import describe_reads
+
+    properties = load_properties()
+    property_name = st.sidebar.selectbox("🏢 Property", list(properties)) if len(properties) > 1 else next(iter(properties))
+
     # Initialize session state
-    if 'mkl' not in st.session_state:
-        st.session_state.mkl = MarketList()
-    
-    # Cache management in session state
-    if 'cache_info' not in st.session_state:
-        st.session_state.cache_info = {}
+    if 'mkl' not in st.session_state or st.session_state.mkl.property_name != property_name:
+        st.session_state.mkl = MarketList(property_name=property_name, sheets=properties[property_name])
     
+    def cache_note(label, dataset):
+        """Age of a dataset in the revision-aware loader cache (empty until it has been built)"""
+        status = caching.default_revision_cache.status().get(dataset, {})
+        if "built_at" not in status:
+            return ""
+        age_minutes = int((time.time() - status["built_at"]) / 60)
+        return f"""
+        <div class="cache-info">
+        {label}: Built {age_minutes}min ago, reused until its sheets change
+        </div>
+        """
+
     # Header
     st.markdown('<h1 class="main-header">🏨 Kenneth\'s - Enhanced Inventory Management</h1>', 
                 unsafe_allow_html=True)
@@ -87,7 +101,7 @@ try:
         # Clear cache button
         if st.button("🗑️ Clear All Caches"):
             st.cache_data.clear()
-            st.session_state.cache_info = {}
+            caching.clear_all()
             st.success("Caches cleared!")
             st.rerun()
         
@@ -126,33 +140,12 @@ try:
         st.subheader("📦 Category Selection")
         
         try:
-            # Cached function with longer TTL to reduce API calls
-            @st.cache_data(ttl=600, show_spinner=False)  # 10 minutes cache
-            def load_categories(_mkl):
-                """Load categories with extended caching"""
-                cache_key = "categories"
-                if cache_key in st.session_state.cache_info:
-                    st.session_state.cache_info[cache_key]['last_accessed'] = datetime.now()
-                else:
-                    st.session_state.cache_info[cache_key] = {
-                        'created': datetime.now(),
-                        'last_accessed': datetime.now(),
-                        'ttl': 600
-                    }
-                return _mkl.get_available_categories()
-            
-            # Get available categories with loading indicator
+            # Cached by MarketList until the issues or dormant stock sheet changes
             with st.spinner("Loading categories..."):
-                available_categories = load_categories(st.session_state.mkl)
+                available_categories = st.session_state.mkl.get_available_categories()
             
             # Show cache info for categories
-            if 'categories' in st.session_state.cache_info:
-                cache_age = (datetime.now() - st.session_state.cache_info['categories']['created']).total_seconds()
-                cache_status_container.markdown(f"""
-                <div class="cache-info">
-                📦 Categories: Cached {int(cache_age/60)}min ago (TTL: 10min)
-                </div>
-                """, unsafe_allow_html=True)
+            cache_status_container.markdown(cache_note("📦 Categories", "category_index"), unsafe_allow_html=True)
             
             # Clean and deduplicate categories
             clean_categories = []
@@ -198,39 +191,16 @@ try:
         # Exception Items with caching
         st.subheader("🛒 Exception Items")
 
-        @st.cache_data(ttl=600, show_spinner=False)  # 10 minutes cache
-        def load_stock_data_cached(_mkl):
-            """Load stock data with extended caching"""
-            cache_key = "stock_data"
-            if cache_key in st.session_state.cache_info:
-                st.session_state.cache_info[cache_key]['last_accessed'] = datetime.now()
-            else:
-                st.session_state.cache_info[cache_key] = {
-                    'created': datetime.now(),
-                    'last_accessed': datetime.now(),
-                    'ttl': 600
-                }
-            return _mkl.get_stock_data()
-
         if selected_categories:
+            # Cached by MarketList until the stock sheet changes
             with st.spinner("Loading stock data..."):
-                stock_df = load_stock_data_cached(st.session_state.mkl)
+                stock_df = st.session_state.mkl.get_stock_data()
             
             # Show cache info for stock data
-            if 'stock_data' in st.session_state.cache_info:
-                cache_age = (datetime.now() - st.session_state.cache_info['stock_data']['created']).total_seconds()
-                cache_status_container.markdown(f"""
-                <div class="cache-info">
-                📊 Stock Data: Cached {int(cache_age/60)}min ago (TTL: 10min)
-                </div>
-                """, unsafe_allow_html=True)
+            cache_status_container.markdown(cache_note("📊 Stock Data", "stock"), unsafe_allow_html=True)
 
-            category_items = (
-                stock_df[stock_df["Category"].isin(selected_categories)]["Stock Name"]
-                .dropna()
-                .unique()
-                .tolist()
-            )
+            # Items of the selected categories, most issued first, from the precomputed category index
+            category_items = st.session_state.mkl.get_category_index().items(selected_categories)
 
             if category_items:
                 excluded_items = st.multiselect(
@@ -265,6 +235,37 @@ try:
             value=110,
             help="Safety buffer percentage for forecasts"
         ) / 100
+
+        forecast_engine = st.selectbox(
+            "Forecasting engine:",
+            ["prophet", "auto", "moving_average", "croston"],
+            index=0,
+            help="'auto' classifies each item's demand pattern (smooth, erratic, intermittent, lumpy) "
+                 "and routes it to the cheapest adequate model"
+        )
+
+        forecast_resolution = st.selectbox(
+            "Fitting resolution:",
+            ["daily", "weekly", "auto"],
+            index=0,
+            help="'weekly' sums usage into weeks before fitting (much faster for 30-90 day horizons); "
+                 "'auto' uses weekly buckets for periods of 30 days or more"
+        )
+
+        hierarchical_categories = st.multiselect(
+            "Forecast at category level:",
+            selected_categories,
+            default=[],
+            help="Fit one model per category and split it across items by recent usage share "
+                 "(faster for long-tail items with sparse histories)"
+        )
+
+        use_forecast_service = st.checkbox(
+            "Use forecasting service",
+            value=False,
+            help="Send fits to a running `python forecast_service.py` (warm Prophet workers shared with the CLI) "
+                 "instead of fitting inside the dashboard process"
+        )
     
     # Main content area with cache-aware tabs
     col1, col2 = st.columns([3, 1])
@@ -297,6 +298,13 @@ try:
     with col2:
         # Generate button
         st.markdown("### 🚀 Generate Market List")
+
+        # Sheets API budget of a run with these settings, before it starts (cached sheets cost nothing)
+        if selected_categories:
+            predicted_calls = st.session_state.mkl.plan_sheets_calls(selected_categories, max_items)
+            st.caption(f"Predicted Sheets calls: {describe_reads(predicted_calls)} reads, "
+                       f"{predicted_calls['writes']} writes, at least {predicted_calls['min_seconds']:.0f}s under the "
+                       f"quota")
         
         if st.button("🎯 Generate Enhanced Market List", type="primary", use_container_width=True):
             if not selected_categories:
@@ -304,27 +312,117 @@ try:
             else:
                 with st.spinner("🤖 Running AI forecasting with your settings..."):
                     try:
-                        st.session_state.mkl.create_market_list(
-                            forecast_period=forecast_period,
-                            selected_categories=selected_categories,
-                            excluded_items=excluded_items,
-                            x_items_limit=max_items
-                        )
+                        forecast_client = None
+                        if use_forecast_service:
+                            from forecast_service import connect
+
+                            forecast_client = connect()
+                            if forecast_client is None:
+                                st.warning("Forecasting service not reachable, fitting in the dashboard instead")
+
+                        try:
+                            run_summary = st.session_state.mkl.create_market_list(
+                                forecast_period=forecast_period,
+                                selected_categories=selected_categories,
+                                excluded_items=excluded_items,
+                                x_items_limit=max_items,
+                                hierarchical_categories=hierarchical_categories,
+                                engine=forecast_engine,
+                                resolution=forecast_resolution,
+                                safety_cushion=safety_cushion,
+                                executor=forecast_client
+                            )
+                        finally:
+                            if forecast_client is not None:
+                                forecast_client.close()
+                        st.session_state.last_run_calls = run_summary["sheets_calls"]
                         st.success("✅ Enhanced market list generated successfully!")
                         st.balloons()
                         
-                        # Clear market list cache after generation
+                        # The write changed the output sheet's revision, so the next display re-reads it
                         if st.button("🔄 Refresh Market List Display"):
-                            st.cache_data.clear()
                             st.rerun()
                         
                     except Exception as e:
                         st.error(f"❌ Error generating market list: {e}")
     
+    # Predicted vs actual Sheets calls of the last run
+    if st.session_state.get("last_run_calls"):
+        predicted, actual = st.session_state.last_run_calls["predicted"], st.session_state.last_run_calls["actual"]
+        with st.expander("📡 Sheets API calls of the last run", expanded=False):
+            call_cols = st.columns(4)
+            call_cols[0].metric("Reads", actual["reads"], delta=actual["reads"] - predicted["reads"],
+                                delta_color="inverse", help=f"Predicted: {predicted['reads']}")
+            call_cols[1].metric("Writes", actual["writes"], delta=actual["writes"] - predicted["writes"],
+                                delta_color="inverse", help=f"Predicted: {predicted['writes']}")
+            call_cols[2].metric("Downloaded / sent", f"{actual['bytes_total'] / 1e6:.1f} MB")
+            call_cols[3].metric("Min. quota time", f"{predicted['min_seconds']:.0f}s")
+            st.dataframe(pd.DataFrame({
+                "Calls": actual["calls"],
+                "MB": {method: n / 1e6 for method, n in actual["bytes"].items()},
+                "Seconds": actual["seconds"],
+            }).fillna(0), use_container_width=True)
+            st.caption("Predicted reads per step: " + ", ".join(
+                f"{step} {reads}" for step, (reads, _) in predicted["steps"].items() if reads))
+
+    # What-if replanning on the last run's raw forecasts: no refits, no Sheets reads until written
+    if getattr(st.session_state.mkl, "last_plan", None) is not None:
+        st.markdown("---")
+        with st.expander("🧪 What-if: replan the last market list without refitting", expanded=False):
+            plan = st.session_state.mkl.last_plan
+            whatif_cushion = st.slider("What-if safety cushion (%):", min_value=100, max_value=150,
+                                       value=int(round(plan["safety_cushion"] * 100)), key="whatif_cushion") / 100
+
+            stock = plan["stock_df"].drop_duplicates("Stock Name").set_index("Stock Name")
+            balances = pd.to_numeric(stock["Current Balance"], errors="coerce")
+            staff_shares = {item: shares.get("STAFF FOOD", 0.3) for item, shares in plan["usage_proportions"].items()}
+            baseline = pd.DataFrame({
+                "Item": plan["items"],
+                "Raw forecast": [round(plan["raw_forecasts"].get(item, 0.0), 1) for item in plan["items"]],
+                "Current balance": [balances.get(item, float("nan")) for item in plan["items"]],
+                "Staff share": [staff_shares.get(item, 0.3) for item in plan["items"]],
+            })
+            edited = st.data_editor(baseline, disabled=["Item", "Raw forecast"], hide_index=True,
+                                    use_container_width=True, key="whatif_editor")
+
+            changed_balance = (edited["Current balance"].ne(baseline["Current balance"])
+                               & edited["Current balance"].notna())
+            changed_share = edited["Staff share"].ne(baseline["Staff share"]) & edited["Staff share"].notna()
+            balance_overrides = dict(zip(edited.loc[changed_balance, "Item"],
+                                         edited.loc[changed_balance, "Current balance"]))
+            share_overrides = dict(zip(edited.loc[changed_share, "Item"],
+                                       edited.loc[changed_share, "Staff share"].clip(0, 1)))
+
+            replanned = st.session_state.mkl.replan(whatif_cushion, balance_overrides, share_overrides)
+            generated = {section: float(parse_market_list_rows(rows)["Total Amount"].sum())
+                         for section, rows in plan["sections"].items()}
+
+            total_cols = st.columns(4)
+            for col, (section, title) in zip(total_cols, [("house", "🏠 House"), ("staff", "👥 Staff Food"),
+                                                          ("chemicals", "🧽 Chemicals")]):
+                col.metric(title, f"₦{replanned['totals'][section]:,.0f}",
+                           delta=f"{replanned['totals'][section] - generated[section]:,.0f}")
+            total_cols[3].metric("💰 Total", f"₦{sum(replanned['totals'].values()):,.0f}",
+                                 delta=f"{sum(replanned['totals'].values()) - sum(generated.values()):,.0f}")
+            st.caption(f"Replanned {len(plan['items'])} items in {replanned['seconds'] * 1000:.0f} ms "
+                       f"({len(balance_overrides)} balance and {len(share_overrides)} split overrides)")
+
+            for section, rows in replanned["sections"].items():
+                if rows:
+                    st.markdown(f"**{section.title()}**")
+                    st.dataframe(parse_market_list_rows(rows), use_container_width=True, hide_index=True)
+
+            if st.button("📝 Write what-if lists to Google Sheets"):
+                try:
+                    summary = st.session_state.mkl.apply_replan(replanned)
+                    st.success(f"✅ What-if lists written ({summary['cells']} cells changed)")
+                except Exception as e:
+                    st.error(f"❌ Error writing what-if lists: {e}")
+
     # Optimized tabs with caching
     st.markdown("---")
-    tab1, tab2, tab3, tab4 = st.tabs([
-        "📊 Dashboard", "📋 Market Lists", "📈 Forecast Analysis", "⚙️ System Status"
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+        "📊 Dashboard", "📋 Market Lists", "📈 Forecast Analysis", "📒 Run History", "⚙️ System Status"
     ])
     
     with tab1:
@@ -335,8 +433,8 @@ try:
         with col1:
             try:
                 # Use cached stock data if available
-                if 'stock_data' in st.session_state.cache_info:
-                    stock_df = load_stock_data_cached(st.session_state.mkl)
+                if "stock" in caching.default_revision_cache.status():
+                    stock_df = st.session_state.mkl.get_stock_data()
                     total_items = len(stock_df) if not stock_df.empty else 0
                     st.metric("Total Items", total_items)
                 else:
@@ -345,11 +443,11 @@ try:
                 st.metric("Total Items", "Error")
         
         with col2:
-            st.metric("Cache Status", "Active", delta="10min TTL")
+            st.metric("Cache Status", "Active", delta="Revision-aware")
         
         with col3:
             # Show number of cached datasets
-            cache_count = len(st.session_state.cache_info)
+            cache_count = len(caching.default_revision_cache.status())
             st.metric("Cached Datasets", cache_count)
         
         with col4:
@@ -361,47 +459,13 @@ try:
     with tab2:
         st.header("📋 Generated Market Lists")
         
-        # Optimized market list loading with caching
-        @st.cache_data(ttl=300, show_spinner=False)  # 5 minutes for market lists
+        # Market lists are cached by MarketList until the output spreadsheet changes
         def load_market_lists(_mkl):
-            """Load market lists with caching"""
-            cache_key = "market_lists"
-            if cache_key in st.session_state.cache_info:
-                st.session_state.cache_info[cache_key]['last_accessed'] = datetime.now()
-            else:
-                st.session_state.cache_info[cache_key] = {
-                    'created': datetime.now(),
-                    'last_accessed': datetime.now(),
-                    'ttl': 300
-                }
-            
+            """Load market lists, skipping empty sections"""
             try:
-                sheet = _mkl.gc.open_by_key("1powB6YQD3WzpgZowXR-vsB9h9g-4FKzJ5fzXlZqEB0k")
-                
-                # Load all worksheets with rate limiting
-                time.sleep(1)  # Basic rate limiting
-                
-                results = {}
-                worksheets = [
-                    ("Zeccol Mkl", "house"),
-                    ("Staff Food", "staff"),
-                    ("Chemicals & Detergents", "chemicals")
-                ]
-                
-                for ws_name, key in worksheets:
-                    try:
-                        ws = sheet.worksheet(ws_name)
-                        data = ws.get_all_values()
-                        if len(data) > 3:
-                            df = pd.DataFrame(data[3:], columns=["Item", "Current Stock", "Quantity to Buy", "Unit Rate", "Total Amount"])
-                            df = df[df["Item"] != ""]
-                            results[key] = df
-                        time.sleep(2)  # Rate limiting between requests
-                    except Exception as e:
-                        st.warning(f"Could not load {ws_name}: {e}")
-                        continue
-                
-                return results
+                # All three A4:E ranges in one batched request, parsed straight into typed dataframes
+                results = _mkl.read_market_lists()
+                return {key: df for key, df in results.items() if not df.empty}
             except Exception as e:
                 if "429" in str(e):
                     st.error("🚫 Rate limit exceeded. Please wait a moment and try again.")
@@ -415,13 +479,7 @@ try:
                 market_data = load_market_lists(st.session_state.mkl)
             
             # Show cache info
-            if 'market_lists' in st.session_state.cache_info:
-                cache_age = (datetime.now() - st.session_state.cache_info['market_lists']['created']).total_seconds()
-                st.markdown(f"""
-                <div class="cache-info">
-                📋 Market Lists: Cached {int(cache_age/60)}min ago (TTL: 5min)
-                </div>
-                """, unsafe_allow_html=True)
+            st.markdown(cache_note("📋 Market Lists", "market_lists"), unsafe_allow_html=True)
             
             # Display controls
             col1, col2, col3 = st.columns(3)
@@ -445,13 +503,9 @@ try:
                     st.subheader(f"{emoji} {title}")
                     st.dataframe(df, use_container_width=True)
                     
-                    try:
-                        amounts = df["Total Amount"].str.replace(",", "").str.replace("₦", "").astype(float)
-                        section_total = amounts.sum()
-                        total_cost += section_total
-                        st.metric(f"{title} Total", f"₦{section_total:,.0f}")
-                    except:
-                        pass
+                    section_total = df["Total Amount"].sum()
+                    total_cost += section_total
+                    st.metric(f"{title} Total", f"₦{section_total:,.0f}")
             
             # Grand Total
             if total_cost > 0:
@@ -475,38 +529,142 @@ try:
     
     with tab3:
         st.header("📈 Enhanced Forecast Analysis")
-        st.info("Forecast analysis uses cached data to minimize API calls")
-        # ... rest of tab3 content
+        st.info("Charts render from the forecast artifacts stored by each generation run - no refitting, no API calls")
+
+        from artifacts import downsample
+
+        artifact_store = st.session_state.mkl.artifact_store
+
+        # Artifacts never change once written, so they can be cached without a TTL
+        @st.cache_data(show_spinner=False, max_entries=2000)
+        def load_item_artifacts(run_id, item, max_points):
+            history, forecast = artifact_store.load_item(run_id, item)
+            return downsample(history, "Date", "Usage", max_points), forecast
+
+        @st.cache_data(show_spinner=False)
+        def load_run_meta(run_id):
+            return artifact_store.load_meta(run_id)
+
+        runs = artifact_store.list_runs(property_name)
+        if not runs:
+            st.info("📋 Generate a market list to store forecasts for analysis.")
+        else:
+            col1, col2, col3 = st.columns([2, 2, 1])
+            with col1:
+                run_id = st.selectbox("Run", runs, help="Stored generation runs, newest first")
+            run_meta = load_run_meta(run_id)
+            with col2:
+                item_filter = st.text_input("Filter items", "", help="Case-insensitive substring match")
+            with col3:
+                max_points = st.select_slider("Points per chart", [100, 200, 300, 500, 1000], value=300)
+
+            st.caption(f"Period: {run_meta.get('forecast_period')} • Engine: {run_meta.get('engine')} • "
+                       f"Created: {run_meta.get('created')} • {len(run_meta['items'])} items")
+
+            run_items = [item for item in run_meta["items"] if item_filter.lower() in item.lower()]
+            charts_per_page = 12
+            n_pages = max(1, -(-len(run_items) // charts_per_page))
+            page = st.number_input("Page", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+            page_items = run_items[(page - 1) * charts_per_page:page * charts_per_page]
+
+            chart_cols = st.columns(2)
+            for position, item in enumerate(page_items):
+                history, forecast = load_item_artifacts(run_id, item, max_points)
+                fig = go.Figure()
+                fig.add_trace(go.Scattergl(x=history["Date"], y=history["Usage"], mode="lines", name="Usage",
+                                           line=dict(color="#1f77b4", width=1)))
+                if not forecast.empty:
+                    fig.add_trace(go.Scatter(x=forecast["Date"], y=forecast["yhat_upper"], mode="lines",
+                                             line=dict(width=0), showlegend=False, hoverinfo="skip"))
+                    fig.add_trace(go.Scatter(x=forecast["Date"], y=forecast["yhat_lower"], mode="lines",
+                                             line=dict(width=0), fill="tonexty", fillcolor="rgba(255,127,14,0.2)",
+                                             name="Interval"))
+                    fig.add_trace(go.Scatter(x=forecast["Date"], y=forecast["yhat"], mode="lines", name="Forecast",
+                                             line=dict(color="#ff7f0e", width=2)))
+                fig.update_layout(title=f"{item} → {run_meta['forecasts'].get(item, 0)}", height=300,
+                                  margin=dict(l=10, r=10, t=40, b=10), showlegend=False)
+                with chart_cols[position % 2]:
+                    st.plotly_chart(fig, use_container_width=True)
     
     with tab4:
+        st.header("📒 Run History")
+        st.info("Every generation run's forecasts and purchases, queried from the local run ledger")
+
+        ledger = st.session_state.mkl.ledger
+        ledger_runs = ledger.runs(property_name)
+        if ledger_runs.empty:
+            st.info("📋 Generate a market list to start the run history.")
+        else:
+            months = st.select_slider("Months", [3, 6, 12, 24], value=12)
+            spend = ledger.spend_by_category(months, property_name)
+            if not spend.empty:
+                st.subheader("💰 Spend by Category")
+                fig = px.bar(spend, x="month", y="amount", color="category",
+                             labels={"month": "Month", "amount": "Amount (₦)", "category": "Category"})
+                fig.update_layout(height=400, margin=dict(l=10, r=10, t=10, b=10))
+                st.plotly_chart(fig, use_container_width=True)
+
+            st.subheader("🎯 Forecast vs Actual")
+            ledger_items = ledger.query("SELECT DISTINCT item FROM lines WHERE property = ? ORDER BY item",
+                                        (property_name,))["item"].tolist()
+            ledger_item = st.selectbox("Item", ledger_items)
+            if ledger_item:
+                comparison = ledger.forecast_vs_actual(ledger_item, st.session_state.mkl.get_issue_voucher(),
+                                                       property_name)
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=comparison["created"], y=comparison["forecast"], mode="lines+markers",
+                                         name="Forecast", line=dict(color="#ff7f0e")))
+                fig.add_trace(go.Scatter(x=comparison["created"], y=comparison["Actual"], mode="lines+markers",
+                                         name="Actual", line=dict(color="#1f77b4")))
+                fig.update_layout(height=350, margin=dict(l=10, r=10, t=10, b=10))
+                st.plotly_chart(fig, use_container_width=True)
+                st.dataframe(comparison, use_container_width=True, hide_index=True)
+
+            st.subheader("🗂️ Runs")
+            st.dataframe(ledger_runs, use_container_width=True, hide_index=True)
+
+    with tab5:
         st.header("⚙️ Enhanced System Status")
         
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("🚀 Caching Features")
-            st.success("✅ 10-minute category caching")
-            st.success("✅ 10-minute stock data caching")
-            st.success("✅ 5-minute market list caching")
+            st.success("✅ Category, stock and issues caching until the sheets change")
+            st.success("✅ Market list caching until the output sheet changes")
             st.success("✅ Automatic rate limiting")
             st.success("✅ Cache status monitoring")
             st.success("✅ Manual cache clearing")
         
         with col2:
             st.subheader("📊 Cache Statistics")
-            cache_count = len(st.session_state.cache_info)
+            cache_status = caching.default_revision_cache.status()
+            cache_count = len(cache_status)
             st.metric("Active Caches", cache_count)
-            st.metric("Cache Strategy", "Multi-TTL")
+            st.metric("Cache Strategy", "Revision-aware")
             st.metric("Rate Limiting", "Active ✅")
             st.metric("API Optimization", "85% Reduction")
             
+            # Requests for the same sheet made while a download was already running wait for it instead
+            from sheets import default_single_flight
+
+            flight_stats = default_single_flight.stats()
+            if flight_stats:
+                st.subheader("🔗 Coalesced Fetches")
+                st.metric("Downloads Saved", sum(counters["coalesced"] for counters in flight_stats.values()))
+                st.dataframe(pd.DataFrame.from_dict(flight_stats, orient="index")[["requests", "fetches", "coalesced"]],
+                             use_container_width=True)
+
             # Show detailed cache info
             if cache_count > 0:
                 st.subheader("🔍 Cache Details")
-                for cache_key, info in st.session_state.cache_info.items():
-                    age_minutes = int((datetime.now() - info['created']).total_seconds() / 60)
-                    ttl_minutes = int(info['ttl'] / 60)
-                    st.text(f"{cache_key}: {age_minutes}min old (TTL: {ttl_minutes}min)")
+                for dataset, info in cache_status.items():
+                    if "built_at" not in info:
+                        continue
+                    age_minutes = int((time.time() - info["built_at"]) / 60)
+                    revisions = ", ".join(str(revision) for revision in info["revisions"])
+                    st.text(f"{dataset}: {age_minutes}min old, sheet revision {revisions} "
+                            f"({info['hits']} hits, {info['builds']} builds)")
 
 except ImportError as e:
     st.error(f"Could not import MarketList class: {e}")
@@ -0,0 +1,226 @@
+"""
+Long-lived local forecasting service.
+
+A server process keeps a pool of forecasting workers alive with Prophet and its Stan backend already loaded (each
+worker fits a tiny warm-up series at start), and answers batches of item series over a local socket. The CLI, the
+dashboard and property runs can share one service, so model/backend setup is paid once per service instead of
+once per run, and the Prophet memory stays out of the dashboard process.
+
+Start it with:
+    python forecast_service.py --workers 4
+
+and pass a ForecastServiceClient wherever create_market_list takes an executor (cli.py --service).
+The address defaults to 127.0.0.1:6011 (FORECAST_SERVICE_ADDRESS). The service and its clients must share a secret
+auth key in FORECAST_SERVICE_KEY; there is no default, and neither side starts without one.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+import pandas as pd
+
+from forecasting import get_engine, prophet_engine
+
+DEFAULT_ADDRESS = os.environ.get("FORECAST_SERVICE_ADDRESS", "127.0.0.1:6011")
+AUTHKEY_VARIABLE = "FORECAST_SERVICE_KEY"
+
+
+def get_authkey(authkey=None):
+    """
+    The auth key to use: `authkey`, else FORECAST_SERVICE_KEY. There is deliberately no default - connections
+    unpickle every message, so anyone who knows the key can run code as the service user. Raises ValueError when
+    no key is set.
+    :return:
+    """
+    authkey = authkey or os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise ValueError(f"{AUTHKEY_VARIABLE} is not set: export a secret shared by the forecasting service and its "
+                         f"clients, e.g. python -c \"import secrets; print(secrets.token_hex(32))\"")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def parse_address(address):
+    """'host:port' -> (host, port); anything else is used as a Unix socket path"""
+    host, _, port = str(address).rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _warm_up():
+    """Worker initializer: loads Prophet and its Stan backend with one small fit"""
+    try:
+        prophet_engine(pd.DataFrame({"Date": pd.date_range("2024-01-01", periods=30), "Usage": 1.0}), 1)
+    except Exception as e:
+        print(f"Forecast worker {os.getpid()}: warm-up failed: {e}")
+
+
+def _run_task(engine, usage_df, periods, resolution="daily"):
+    """Returns (forecast path, seconds, error) like main._timed_call"""
+    start = time.perf_counter()
+    try:
+        return get_engine(engine, resolution, periods)(usage_df, periods), time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+
+class ForecastService:
+    """
+    Accepts client connections and runs their batches on one shared pool of warm workers
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, workers=None):
+        self.address = parse_address(address)
+        self.authkey = get_authkey(authkey)
+        self.workers = workers or os.cpu_count() or 1
+        self.started = time.time()
+        self.batches = 0
+        self.tasks = 0
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        pool_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up) as pool:
+            # Start (and warm) every worker before accepting clients
+            for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+            print(f"Forecast service: {self.workers} workers warm in {time.perf_counter() - pool_start:.1f}s")
+
+            with Listener(self.address, authkey=self.authkey) as listener:
+                print(f"Forecast service listening on {listener.address}")
+                while True:
+                    try:
+                        conn = listener.accept()
+                    except Exception as e:
+                        # A client with the wrong auth key, or one that hung up during the handshake
+                        print(f"Forecast service: rejected connection: {e}")
+                        continue
+                    threading.Thread(target=self._handle, args=(conn, pool), daemon=True).start()
+
+    def _handle(self, conn, pool):
+        """
+        Serves one client until it disconnects. Requests:
+        - ("ping",) -> service info
+        - ("forecast", [(engine, usage_df, periods, resolution), ...]) -> [(forecast path, seconds, error), ...]
+          in order
+        """
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                if request[0] == "ping":
+                    conn.send(self.info())
+                elif request[0] == "forecast":
+                    tasks = request[1]
+                    futures = [pool.submit(_run_task, *task) for task in tasks]
+                    conn.send([future.result() for future in futures])
+                    with self._lock:
+                        self.batches += 1
+                        self.tasks += len(tasks)
+                else:
+                    conn.send(ValueError(f"Unknown request {request[0]!r}"))
+
+    def info(self):
+        with self._lock:
+            return {"pid": os.getpid(), "workers": self.workers, "uptime": time.time() - self.started,
+                    "batches": self.batches, "tasks": self.tasks}
+
+
+class _BatchedFuture(Future):
+    """Sends the client's pending batch the first time any of its results is needed"""
+
+    def __init__(self, client):
+        super().__init__()
+        self._client = client
+
+    def result(self, timeout=None):
+        self._client.flush()
+        return super().result(timeout)
+
+
+class ForecastServiceClient:
+    """
+    Connection to a running ForecastService.
+
+    submit_forecast() queues a fit and returns a future; all queued fits go to the service in one message the
+    first time a result is needed, so a whole run is one round trip. Usable as a context manager.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        self.address = parse_address(address)
+        self._conn = Client(self.address, authkey=get_authkey(authkey))
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def submit_forecast(self, usage_df, periods, engine="prophet", resolution="daily"):
+        """
+        Queues a fit of `engine` on a Date/Usage frame; the future resolves to (forecast path, seconds, error)
+        :return:
+        """
+        future = _BatchedFuture(self)
+        with self._lock:
+            self._pending.append((future, (engine, usage_df, periods, resolution)))
+        return future
+
+    def flush(self):
+        """Sends every queued fit as one batch and resolves their futures"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                self._conn.send(("forecast", [task for _, task in pending]))
+                results = self._conn.recv()
+            except Exception as e:
+                for future, _ in pending:
+                    future.set_exception(e)
+                return
+
+        for (future, _), result in zip(pending, results):
+            future.set_result(result)
+
+    def ping(self):
+        """Service info (pid, workers, uptime, batches and tasks served)"""
+        with self._lock:
+            self._conn.send(("ping",))
+            return self._conn.recv()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def connect(address=DEFAULT_ADDRESS, authkey=None):
+    """
+    Returns a ForecastServiceClient, or None when no service is listening at `address`. Raises ValueError when no
+    auth key is set (see get_authkey).
+    :return:
+    """
+    try:
+        return ForecastServiceClient(address, authkey)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local forecasting service")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port or Unix socket path")
+    parser.add_argument("--workers", type=int, default=None, help="Forecasting worker processes (default: CPUs)")
+    args = parser.parse_args()
+
+    try:
+        service = ForecastService(args.address, workers=args.workers)
+    except ValueError as e:
+        parser.exit(2, f"Forecast service not started: {e}\n")
+    service.serve_forever()
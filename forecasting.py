@@ -0,0 +1,295 @@
+"""
+Forecasting engines shared by MarketList and the backtester.
+
+Every engine takes a daily usage frame with "Date" and "Usage" columns plus the number of days to forecast,
+and returns one row per forecast day ("Date", "yhat", "yhat_lower", "yhat_upper"), or None when the
+history is too short to fit. Engines are plain module-level functions so they can be sent to worker processes.
+
+Every engine also accepts `step_days`, the spacing of the input series. get_engine() uses it to fit on weekly (or
+custom) buckets of usage instead of daily points when a resolution is requested, see bucketed_engine.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+
+def get_forecast_days(forecast_period):
+    """
+    Converts a forecast period ('weekly', 'monthly' or a number of days) into a number of days
+    :return:
+    """
+    if forecast_period == "weekly":
+        return 7
+    elif forecast_period == "monthly":
+        return 30
+    elif isinstance(forecast_period, (int, np.integer)) and not isinstance(forecast_period, bool):
+        return int(forecast_period)
+    raise ValueError("Invalid forecast_period value")
+
+
+def _clean_usage(usage_df):
+    usage_df = usage_df[["Date", "Usage"]].copy()
+    usage_df["Date"] = pd.to_datetime(usage_df["Date"], errors="coerce")
+    return usage_df.dropna(subset=["Date", "Usage"]).sort_values("Date")
+
+
+def _future_dates(usage_df, periods, step_days=1):
+    return pd.date_range(usage_df["Date"].max() + pd.Timedelta(days=step_days), periods=periods,
+                         freq=f"{step_days}D")
+
+
+def prophet_engine(usage_df, periods, step_days=1):
+    """
+    Fits Prophet on the usage history and returns the forecast path for the next `periods` steps
+    (days, unless the series is bucketed)
+    :return:
+    """
+    prophet_df = _clean_usage(usage_df).rename(columns={"Date": "ds", "Usage": "y"})
+    if prophet_df.shape[0] < 3:
+        return None
+
+    # Imported on first fit: Prophet and its Stan backend dominate startup time
+    from prophet import Prophet
+
+    if step_days == 1:
+        model = Prophet(daily_seasonality=True, yearly_seasonality=True)
+    else:
+        # Bucketed series have no within-bucket pattern left to fit
+        model = Prophet(daily_seasonality=False, weekly_seasonality=False, yearly_seasonality=True)
+    model.fit(prophet_df)
+
+    future = model.make_future_dataframe(periods=periods, freq=f"{step_days}D")
+    forecast = model.predict(future).tail(periods)
+
+    return forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].rename(columns={"ds": "Date"}).reset_index(drop=True)
+
+
+def moving_average_engine(usage_df, periods, window=7, step_days=1):
+    """
+    Flat forecast at the mean of the last `window` recorded issues, with a +/- 1 std band
+    :return:
+    """
+    usage_df = _clean_usage(usage_df)
+    if usage_df.empty:
+        return None
+
+    recent = usage_df["Usage"].tail(window)
+    level = float(recent.mean())
+    spread = float(recent.std()) if recent.shape[0] > 1 else 0.0
+
+    return pd.DataFrame({
+        "Date": _future_dates(usage_df, periods, step_days),
+        "yhat": level,
+        "yhat_lower": max(0.0, level - spread),
+        "yhat_upper": level + spread,
+    })
+
+
+def croston_engine(usage_df, periods, alpha=0.1, step_days=1):
+    """
+    Croston's method for intermittent demand. Demand sizes and the intervals between issues are smoothed separately.
+    Like the other engines the forecast is usage per issue day (the smoothed demand size), so routing an item to
+    Croston does not change the unit of its order quantity; the smoothed interval only sets the lower band, the
+    expected usage per calendar day (Syntetos-Boylan corrected).
+    :return:
+    """
+    usage_df = _clean_usage(usage_df)
+    usage_df = usage_df.loc[usage_df["Usage"] > 0, :]
+    if usage_df.empty:
+        return None
+
+    sizes = usage_df["Usage"].to_numpy(dtype=float)
+    intervals = (usage_df["Date"].diff().dt.days / step_days).fillna(1).to_numpy(dtype=float)
+
+    size_level, interval_level = sizes[0], intervals[0]
+    for size, interval in zip(sizes[1:], intervals[1:]):
+        size_level += alpha * (size - size_level)
+        interval_level += alpha * (interval - interval_level)
+
+    rate = (1 - alpha / 2) * size_level / max(interval_level, 1.0)
+    return pd.DataFrame({
+        "Date": _future_dates(usage_df, periods, step_days),
+        "yhat": size_level,
+        "yhat_lower": min(rate, size_level),
+        "yhat_upper": max(size_level, float(sizes.max())),
+    })
+
+
+ENGINES = {
+    "prophet": prophet_engine,
+    "moving_average": moving_average_engine,
+    "croston": croston_engine,
+}
+# Engines forecasting the size of a step with issues in it rather than the mean over all steps
+SIZE_ENGINES = {"croston"}
+
+# Demand-pattern classes (Syntetos-Boylan ADI/CV² quadrants) and the cheapest engine adequate for each.
+# Items with fewer than three issues cannot be classified (or fitted by Prophet) and get a moving average.
+# Every routed engine forecasts usage per issue day, so a route only changes how an item is fitted, not its unit.
+ADI_CUTOFF = 1.32
+CV2_CUTOFF = 0.49
+MIN_HISTORY = 3
+ROUTES = {
+    "smooth": "moving_average",
+    "erratic": "prophet",
+    "intermittent": "croston",
+    "lumpy": "croston",
+    "insufficient": "moving_average",
+}
+
+
+# Fitting resolutions: bucket size in days. 'auto' fits weekly buckets for horizons of AUTO_WEEKLY_DAYS or more.
+RESOLUTIONS = {"daily": 1, "weekly": 7}
+AUTO_WEEKLY_DAYS = 30
+
+
+def get_bucket_days(resolution="daily", periods=None):
+    """
+    Converts a resolution ('daily', 'weekly', 'auto' or a number of days per bucket) into a bucket size in days
+    :return:
+    """
+    if resolution == "auto":
+        return 7 if periods is not None and periods >= AUTO_WEEKLY_DAYS else 1
+    if resolution in RESOLUTIONS:
+        return RESOLUTIONS[resolution]
+    if isinstance(resolution, (int, np.integer)) and not isinstance(resolution, bool) and resolution >= 1:
+        return int(resolution)
+    raise ValueError(f"Invalid resolution {resolution!r}. Use 'daily', 'weekly', 'auto' or a number of days")
+
+
+def aggregate_usage(usage_df, bucket_days):
+    """
+    Sums daily usage into `bucket_days`-day buckets that end on the last recorded issue (so the latest bucket is
+    complete), including empty buckets as zero usage. Each bucket is dated by its last day.
+    :return:
+    """
+    usage_df = _clean_usage(usage_df)
+    last_date = usage_df["Date"].max()
+    offsets = (last_date - usage_df["Date"]).dt.days // bucket_days
+    totals = usage_df.groupby(offsets)["Usage"].sum().reindex(range(int(offsets.max()) + 1), fill_value=0.0)
+    return pd.DataFrame({
+        "Date": last_date - pd.to_timedelta(totals.index * bucket_days, unit="D"),
+        "Usage": totals.to_numpy(dtype=float),
+    }).iloc[::-1].reset_index(drop=True)
+
+
+def bucketed_engine(usage_df, periods, engine="prophet", bucket_days=7):
+    """
+    Fits `engine` on `bucket_days`-day usage buckets and turns every forecast bucket back into usage per issue day,
+    the unit of a daily fit (daily histories only hold the days an item was issued). A bucket's forecast is divided
+    by the average number of issue days per bucket over the history, so an item issued 70 once a week forecasts 70
+    at either resolution, not 10. Returns a daily path for `periods` days. Falls back to the daily fit when the
+    history has too few buckets.
+    :return:
+    """
+    usage_df = _clean_usage(usage_df)
+    if usage_df.empty:
+        return None
+
+    buckets = aggregate_usage(usage_df, bucket_days)
+    forecast = ENGINES[engine](buckets, -(-periods // bucket_days), step_days=bucket_days)
+    if forecast is None or forecast.empty:
+        return ENGINES[engine](usage_df, periods)
+
+    if engine in SIZE_ENGINES:
+        # The forecast is the size of a bucket with issues in it
+        issue_days_per_bucket = usage_df["Date"].nunique() / max(int((buckets["Usage"] > 0).sum()), 1)
+    else:
+        span_days = (usage_df["Date"].max() - usage_df["Date"].min()).days + 1
+        issue_days_per_bucket = usage_df["Date"].nunique() / span_days * bucket_days
+    values = forecast[["yhat", "yhat_lower", "yhat_upper"]].to_numpy(dtype=float) / issue_days_per_bucket
+    daily = np.repeat(values, bucket_days, axis=0)[:periods]
+    return pd.DataFrame({
+        "Date": _future_dates(usage_df, periods),
+        "yhat": daily[:, 0],
+        "yhat_lower": daily[:, 1],
+        "yhat_upper": daily[:, 2],
+    })
+
+
+def forecast_last_day(usage_df, periods, engine="prophet", resolution="daily"):
+    """
+    Runs `engine` and returns the raw (uncushioned) prediction for the last day of the period,
+    or None when the history is too short to fit
+    :return:
+    """
+    forecast = get_engine(engine, resolution, periods)(usage_df, periods)
+    if forecast is None or forecast.empty:
+        return None
+    return float(forecast.tail(1)["yhat"].values[0])
+
+
+def item_usage_shares(category_df, lookback_days=90, per_issue_day=False):
+    """
+    Each item's share of a category's usage (Date, Item name, Usage rows) over the last `lookback_days` days,
+    falling back to the full history when the recent window is empty.
+    With per_issue_day, shares are scaled by the category's issue days over the item's own issue days in the same
+    window: a category fit forecasts usage per category issue day, and this turns its share into usage per issue
+    day of the item, the unit the per-item engines forecast in
+    :return:
+    """
+    if category_df.empty:
+        return {}
+
+    recent_df = category_df.loc[category_df["Date"] > category_df["Date"].max() - pd.Timedelta(days=lookback_days), :]
+    if recent_df["Usage"].sum() <= 0:
+        recent_df = category_df
+
+    item_usage = recent_df.groupby("Item name")["Usage"].sum().clip(lower=0)
+    total_usage = item_usage.sum()
+    if total_usage <= 0:
+        return {}
+    shares = item_usage / total_usage
+    if per_issue_day:
+        item_days = recent_df.groupby("Item name")["Date"].nunique()
+        shares = shares * recent_df["Date"].nunique() / item_days
+    return shares.to_dict()
+
+
+def get_engine(engine, resolution="daily", periods=None):
+    """
+    Returns the engine function, wrapped to fit on usage buckets when `resolution` is coarser than daily
+    (`periods` is only needed to resolve resolution='auto')
+    :return:
+    """
+    try:
+        engine_fn = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Unknown forecasting engine '{engine}'. Choose from: {', '.join(ENGINES)} or auto")
+
+    bucket_days = get_bucket_days(resolution, periods)
+    if bucket_days == 1:
+        return engine_fn
+    return functools.partial(bucketed_engine, engine=engine, bucket_days=bucket_days)
+
+
+def classify_demand(issues_df):
+    """
+    Labels every item of the issues voucher as smooth, erratic, intermittent or lumpy in one vectorized pass.
+
+    - ADI: average number of days between issues
+    - CV²: squared coefficient of variation of the issued quantities
+
+    Returns a dataframe indexed by item name with the ADI, CV², number of issue days, class and routed engine.
+    """
+    daily = issues_df.groupby(["Item name", "Date"], as_index=False)["Usage"].sum()
+    daily = daily.loc[daily["Usage"] > 0, :]
+    grouped = daily.groupby("Item name")
+
+    stats = grouped.agg(first=("Date", "min"), last=("Date", "max"), n=("Usage", "size"),
+                        mean=("Usage", "mean"), std=("Usage", "std"))
+    span = (stats["last"] - stats["first"]).dt.days
+    stats["ADI"] = span / (stats["n"] - 1).where(stats["n"] > 1)
+    stats["CV2"] = (stats["std"] / stats["mean"]) ** 2
+
+    regular = stats["ADI"] < ADI_CUTOFF
+    stable = stats["CV2"] < CV2_CUTOFF
+    stats["Class"] = np.select(
+        [stats["n"] < MIN_HISTORY, regular & stable, regular, stable],
+        ["insufficient", "smooth", "erratic", "intermittent"],
+        default="lumpy",
+    )
+    stats["Engine"] = stats["Class"].map(ROUTES)
+
+    return stats[["ADI", "CV2", "n", "Class", "Engine"]]
@@ -0,0 +1,123 @@
+"""
+Streaming ingest of the issues voucher.
+
+The Issues worksheet is read in row pages (sheets.iter_row_pages) and every page is cleaned, type-converted and
+folded into the running Date x Item name x Category usage totals before the next page is fetched. Peak memory is
+one page of raw cells plus the aggregate, however many years of history the sheet holds, instead of the whole
+sheet as strings, a cleaned copy, a dataframe and its grouped copy at once.
+
+    aggregator = IssuesAggregator(columns, excluded_items=dormant_items)
+    for rows in iter_row_pages(worksheet, len(columns), limiter):
+        aggregator.add(rows)
+    issues_df = aggregator.result()
+"""
+import numpy as np
+import pandas as pd
+
+KEYS = ["Date", "Item name", "Category"]
+# Page totals are buffered and folded into the running totals this many pages at a time
+FOLD_EVERY = 8
+# Bit layout of the packed int64 aggregation key: day number | item code | category code
+_ITEM_BITS, _CATEGORY_BITS = 24, 16
+
+
+class IssuesAggregator:
+    """
+    Folds pages of raw Issues rows into usage totals per Date, Item name and Category.
+    - columns: the sheet's header row; rows are matched to it by position
+    - excluded_items: item names dropped from every page (the dormant stock)
+    - excluded_depts: departments whose issues are not demand (FUNCTION, i.e. events)
+    - names: a names.NameIndex the item names are canonicalized with before anything else
+
+    Totals are kept as a sorted int64 key array (day, item code and category code packed together) and a float64
+    usage array, 16 bytes per Date x Item x Category; item and category names are stored once each.
+    """
+
+    def __init__(self, columns, excluded_items=None, excluded_depts=("FUNCTION",), names=None,
+                 fold_every=FOLD_EVERY):
+        self.columns = [str(column).strip() for column in columns]
+        missing = [column for column in KEYS + ["Usage"] if column not in self.columns]
+        if missing:
+            raise ValueError(f"Issues sheet is missing column(s): {', '.join(missing)}")
+        self.positions = {column: self.columns.index(column) for column in KEYS + ["Usage", "Dept"]
+                          if column in self.columns}
+        self.excluded_items = set(excluded_items or [])
+        self.excluded_depts = set(excluded_depts or [])
+        self.names = names
+        self.fold_every = fold_every
+        self.items = {}
+        self.categories = {}
+        self.keys = np.empty(0, dtype=np.int64)
+        self.usage = np.empty(0, dtype=np.float64)
+        self._pending = []
+        self.rows = 0
+        self.pages = 0
+
+    def _clean(self, rows):
+        """One page of raw rows -> Date, Item name, Category, Usage dataframe of the rows that count as demand"""
+        chunk = pd.DataFrame({column: [row[position] for row in rows] for column, position in self.positions.items()})
+        for column in chunk.columns:
+            chunk[column] = chunk[column].astype(str).str.replace('"', '', regex=False)
+        if self.names is not None:
+            chunk["Item name"] = self.names.canonicalize(chunk["Item name"])
+
+        keep = chunk["Date"].str.strip() != ""
+        if "Dept" in chunk.columns and self.excluded_depts:
+            keep &= ~chunk["Dept"].isin(self.excluded_depts)
+        if self.excluded_items:
+            keep &= ~chunk["Item name"].isin(self.excluded_items)
+        chunk = chunk.loc[keep, KEYS + ["Usage"]]
+
+        chunk["Date"] = pd.to_datetime(chunk["Date"], format="%Y-%m-%d")
+        chunk["Usage"] = pd.to_numeric(chunk["Usage"].str.replace(",", "", regex=False).replace("", np.nan))
+        return chunk
+
+    @staticmethod
+    def _codes(values, table):
+        """Codes of `values` in `table` ({name: code}), adding new names as they appear"""
+        page_codes, uniques = pd.factorize(values)
+        lookup = np.array([table.setdefault(name, len(table)) for name in uniques], dtype=np.int64)
+        return lookup[page_codes]
+
+    def add(self, rows):
+        """
+        Cleans one page of raw rows and adds its usage to the running totals
+        :return:
+        """
+        self.rows += len(rows)
+        self.pages += 1
+        chunk = self._clean(rows)
+        if chunk.empty:
+            return
+        days = chunk["Date"].values.astype("datetime64[D]").astype(np.int64)
+        keys = ((days << (_ITEM_BITS + _CATEGORY_BITS))
+                | (self._codes(chunk["Item name"], self.items) << _CATEGORY_BITS)
+                | self._codes(chunk["Category"], self.categories))
+        self._pending.append((keys, np.nan_to_num(chunk["Usage"].to_numpy(dtype=np.float64))))
+        if len(self._pending) >= self.fold_every:
+            self._fold()
+
+    def _fold(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self.keys] + [keys for keys, _ in self._pending])
+        usage = np.concatenate([self.usage] + [usage for _, usage in self._pending])
+        self._pending = []
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.usage = np.bincount(inverse, weights=usage, minlength=len(self.keys))
+
+    def result(self):
+        """
+        The issues voucher dataframe: one row per Date, Item name and Category with the total Usage, sorted by them
+        :return:
+        """
+        self._fold()
+        item_names = np.array(list(self.items), dtype=object)
+        category_names = np.array(list(self.categories), dtype=object)
+        df = pd.DataFrame({
+            "Date": (self.keys >> (_ITEM_BITS + _CATEGORY_BITS)).astype("datetime64[D]").astype("datetime64[ns]"),
+            "Item name": item_names[(self.keys >> _CATEGORY_BITS) & ((1 << _ITEM_BITS) - 1)],
+            "Category": category_names[self.keys & ((1 << _CATEGORY_BITS) - 1)],
+            "Usage": self.usage,
+        })
+        return df.sort_values(KEYS, ignore_index=True)
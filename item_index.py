@@ -0,0 +1,60 @@
+"""
+Category -> items index of the issues voucher, ranked by issue frequency.
+
+Built once per issues voucher version (MarketList caches it with the voucher's sheet revisions). Item selections
+for any set of categories are answered by a lazy k-way merge of the per-category rankings that stops after
+`x_items`, so no dataframe is rescanned per selection.
+"""
+import heapq
+from itertools import islice
+
+
+class CategoryIndex:
+    """
+    ranked: {category: [(-issue count, item), ...]} sorted, i.e. most issued first and ties by item name
+    """
+
+    def __init__(self, ranked):
+        self.ranked = ranked
+
+    @classmethod
+    def from_issues(cls, issues_df):
+        """
+        Builds the index from an issues voucher dataframe (one row per Date, Item name and Category)
+        :return:
+        """
+        counts = issues_df.groupby(["Category", "Item name"]).size()
+        ranked = {}
+        for (category, item), count in counts.items():
+            ranked.setdefault(category, []).append((-int(count), item))
+        for entries in ranked.values():
+            entries.sort()
+        return cls(ranked)
+
+    @property
+    def categories(self):
+        """Sorted category names, stripped and without blanks"""
+        return sorted({str(category).strip() for category in self.ranked if category and str(category).strip()})
+
+    def _merged(self, categories):
+        """Items of `categories` in overall issue frequency order, each item once"""
+        seen = set()
+        for _, item in heapq.merge(*(self.ranked[category] for category in dict.fromkeys(categories)
+                                     if category in self.ranked)):
+            # An item filed under several selected categories ranks by its largest per-category count
+            if item not in seen:
+                seen.add(item)
+                yield item
+
+    def top_items(self, categories, x_items=150, excluded_items=None):
+        """
+        The `x_items` most issued items of `categories`, most issued first, minus `excluded_items`
+        (excluded items are dropped after the limit is applied, like the original value_counts selection)
+        :return:
+        """
+        excluded_items = set(excluded_items or [])
+        return [item for item in islice(self._merged(categories), x_items) if item not in excluded_items]
+
+    def items(self, categories):
+        """Every item of `categories`, most issued first"""
+        return list(self._merged(categories))
@@ -0,0 +1,215 @@
+"""
+Local ledger of every market list run.
+
+create_market_list appends one row per run and one line per item and market list section (forecast, balance, buy
+quantity, rate and amount) to a SQLite file, indexed by item, category and date. The history of what was forecast
+and bought can then be queried in milliseconds instead of scraping the overwritten Sheets:
+
+    ledger = RunLedger()
+    ledger.spend_by_category(months=12)
+    ledger.forecast_vs_actual("RICE (50KG)", mkl.get_issue_voucher())
+"""
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ledger.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    property TEXT NOT NULL,
+    created TEXT NOT NULL,
+    forecast_period TEXT,
+    forecast_days INTEGER,
+    engine TEXT,
+    safety_cushion REAL,
+    output TEXT
+);
+CREATE TABLE IF NOT EXISTS lines (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    property TEXT NOT NULL,
+    created TEXT NOT NULL,
+    item TEXT NOT NULL,
+    category TEXT,
+    section TEXT,
+    forecast REAL,
+    balance REAL,
+    buy REAL,
+    buy_unit TEXT,
+    rate REAL,
+    amount REAL
+);
+CREATE INDEX IF NOT EXISTS lines_item ON lines (item, created);
+CREATE INDEX IF NOT EXISTS lines_category ON lines (category, created);
+CREATE INDEX IF NOT EXISTS lines_property ON lines (property, created);
+CREATE INDEX IF NOT EXISTS lines_run ON lines (run_id);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (property, created);
+"""
+
+
+def _number(value):
+    """Leading number of a market list cell ('2.5 Carton' -> 2.5, '12,000' -> 12000.0), None when there is none"""
+    match = re.match(r"\s*(-?[\d,]*\.?\d+)", str(value))
+    if not match:
+        return None
+    return float(match.group(1).replace(",", ""))
+
+
+def ledger_lines(sections, forecasts, balances, categories):
+    """
+    Turns one run into ledger lines: a line per market list row (an item split between house and staff food has
+    two), plus a line with no section for every forecast item that did not make it onto a list.
+    - sections: {section: [[item, current stock, quantity to buy, unit rate, total amount], ...]}
+    - forecasts / balances / categories: {item: value}
+    :return:
+    """
+    lines, listed = [], set()
+    for section, rows in sections.items():
+        for row in rows:
+            item, _, buy, rate, amount = (list(row) + [""] * 5)[:5]
+            listed.add(item)
+            buy_quantity = _number(buy)
+            lines.append({
+                "item": item, "category": categories.get(item), "section": section,
+                "forecast": forecasts.get(item), "balance": balances.get(item),
+                "buy": buy_quantity, "buy_unit": str(buy).split(" ", 1)[1] if " " in str(buy) else None,
+                "rate": _number(rate), "amount": _number(amount),
+            })
+    for item, forecast in forecasts.items():
+        if item not in listed:
+            lines.append({"item": item, "category": categories.get(item), "section": None, "forecast": forecast,
+                          "balance": balances.get(item), "buy": 0.0, "buy_unit": None, "rate": None, "amount": 0.0})
+    return lines
+
+
+class RunLedger:
+    """
+    SQLite ledger of market list runs. Every call opens its own connection, so one instance can be shared by
+    the dashboard sessions and property threads of a process. An in-memory ledger (path ":memory:", for tests and
+    benchmarks) is one database per connection, so it keeps a single connection that calls take turns on.
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ready = False
+        self._memory_conn = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            with self._lock:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                self._ready = True
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        if self.path != ":memory:":
+            with closing(self._connect()) as conn:
+                yield conn
+            return
+
+        with self._lock:
+            if self._memory_conn is None:
+                self._memory_conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._memory_conn.executescript(SCHEMA)
+            yield self._memory_conn
+
+    def record_run(self, run_id, property_name, lines, created=None, replace=False, **settings):
+        """
+        Appends a run and its lines in one transaction. settings: forecast_period, forecast_days, engine,
+        safety_cushion, output
+        A run id that is already recorded raises sqlite3.IntegrityError, so no run is ever lost, unless `replace`
+        is set: then the run's settings and lines are replaced (apply_replan rewriting a run's lists). A replaced
+        run keeps its original `created`, which forecast_vs_actual measures its forecast period from.
+        :return:
+        """
+        created = (created or datetime.now()).isoformat(timespec="seconds")
+        run_settings = (str(settings.get("forecast_period")), settings.get("forecast_days"), settings.get("engine"),
+                        settings.get("safety_cushion"), settings.get("output"))
+        with self._connection() as conn, conn:
+            recorded = None
+            if replace:
+                recorded = conn.execute("SELECT created FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if recorded is None:
+                conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (run_id, property_name, created) + run_settings)
+            else:
+                created = recorded[0]
+                conn.execute("UPDATE runs SET property = ?, forecast_period = ?, forecast_days = ?, engine = ?, "
+                             "safety_cushion = ?, output = ? WHERE run_id = ?",
+                             (property_name,) + run_settings + (run_id,))
+                conn.execute("DELETE FROM lines WHERE run_id = ?", (run_id,))
+            conn.executemany(
+                "INSERT INTO lines VALUES (:run_id, :property, :created, :item, :category, :section, :forecast, "
+                ":balance, :buy, :buy_unit, :rate, :amount)",
+                [{**line, "run_id": run_id, "property": property_name, "created": created} for line in lines])
+        return len(lines)
+
+    def query(self, sql, params=()):
+        """Runs a read query and returns a dataframe"""
+        with self._connection() as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def runs(self, property_name=None, limit=50):
+        """Most recent runs with their item count and total amount"""
+        where, params = ("WHERE r.property = ?", (property_name,)) if property_name else ("", ())
+        return self.query(f"""
+            SELECT r.*, COUNT(l.item) AS lines, COALESCE(SUM(l.amount), 0) AS total_amount
+            FROM runs r LEFT JOIN lines l ON l.run_id = r.run_id
+            {where}
+            GROUP BY r.run_id ORDER BY r.created DESC LIMIT ?""", params + (limit,))
+
+    def spend_by_category(self, months=12, property_name=None):
+        """
+        Total market list amount per month and category over the last `months` months
+        :return:
+        """
+        since = (datetime.now() - timedelta(days=31 * months)).isoformat(timespec="seconds")
+        where, params = "created >= ?", (since,)
+        if property_name:
+            where, params = where + " AND property = ?", params + (property_name,)
+        return self.query(f"""
+            SELECT substr(created, 1, 7) AS month, COALESCE(category, 'UNKNOWN') AS category,
+                   SUM(amount) AS amount, COUNT(*) AS lines
+            FROM lines WHERE {where} AND amount > 0
+            GROUP BY month, category ORDER BY month, category""", params)
+
+    def item_history(self, item, property_name=None):
+        """Every run's forecast, balance, buy quantity, rate and amount of one item, oldest first"""
+        where, params = "l.item = ?", (item,)
+        if property_name:
+            where, params = where + " AND l.property = ?", params + (property_name,)
+        return self.query(f"""
+            SELECT l.created, l.run_id, l.section, l.forecast, l.balance, l.buy, l.buy_unit, l.rate, l.amount,
+                   r.forecast_days
+            FROM lines l JOIN runs r ON r.run_id = l.run_id
+            WHERE {where} ORDER BY l.created""", params)
+
+    def forecast_vs_actual(self, item, issues_df, property_name=None):
+        """
+        Compares each run's forecast of `item` with the usage actually issued over that run's forecast period
+        (from the issues voucher dataframe). Runs whose period has not ended yet have no Actual.
+        :return:
+        """
+        history = self.item_history(item, property_name).drop_duplicates("run_id")
+        if history.empty:
+            return history.assign(Actual=pd.Series(dtype=float))
+
+        usage = issues_df.loc[issues_df["Item name"] == item].groupby("Date")["Usage"].sum()
+        last_issue_day = issues_df["Date"].max()
+        actuals = []
+        for created, days in zip(pd.to_datetime(history["created"]), history["forecast_days"]):
+            start = created.normalize()
+            end = start + pd.Timedelta(days=int(days or 0))
+            actuals.append(float(usage[(usage.index >= start) & (usage.index < end)].sum())
+                           if days and end <= last_issue_day + pd.Timedelta(days=1) else None)
+        return history.assign(Actual=actuals)[["created", "run_id", "forecast", "Actual", "buy", "amount"]]
@@ -1,14 +1,27 @@
 import time
 import pandas as pd
-import gspread
 import numpy as np
 import re
-from datetime import timedelta
+from datetime import datetime, timedelta
 import json
 import math
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-from prophet import Prophet
-import streamlit as st
+from artifacts import ArtifactStore
+from caching import revision_cached
+from forecast_service import ForecastServiceClient
+from forecasting import (ROUTES, classify_demand, forecast_last_day, get_engine, get_forecast_days,
+                         item_usage_shares)
+from ingest import IssuesAggregator
+from item_index import CategoryIndex
+from ledger import RunLedger, ledger_lines
+from names import NameIndex
+from output import MARKET_LIST_SECTIONS, SheetsSink, get_sink, parse_market_list_rows
+from planning import (StockRecord, item_purchases, plan_purchases, process_batch_stock,
+                      skip_item_for_purchase_sig_test)
+from sheets import (PAGE_ROWS, DriveRevisions, MeteredClient, SheetsUsage, coalesced, default_limiter, default_usage,
+                    describe_reads, format_calls, iter_row_pages)
+from usage_matrix import UsageMatrix, forecast_item
 
 load_dotenv()
 import os
@@ -16,77 +29,179 @@ import warnings
 
 warnings.filterwarnings("ignore")
 
+# Source and output spreadsheets of the default property. Other properties override these in properties.json.
+DEFAULT_SHEETS = {
+    "extras": {"key": "19ePbzsPDeY38_gkSs4FT7nxUQWQczaJ1F5UNfGOOk1g", "worksheet": "Extras"},
+    "stock": {"key": "1qqI-9I99Kix2PS1ksUralHeFXoyaArN7ZXYmCnMDLA0", "worksheet": "My Stock"},
+    "issues": {"key": "1y-I8V05Anud-j7VWaob3OaE9ubUEd7qqUkVFB0N942w", "worksheet": "Issues"},
+    "dormant": {"key": "12z2gPOzJcezdhe7UM5p96TiXe4tjgkW7MPkXOdFHxeM", "worksheet": "Dormant Stock"},
+    "proportions": {"key": "1eA9byIBi5uD83UVGt9jaX4-35ugTuTt2nDnPjmdCut4", "worksheet": "Proportions"},
+    "purchases": {"key": "1sP-RF1JYTp6OAKhhd8aVLD_vx_iIsTD84nQB-SQocc8", "worksheet": "Purchases"},
+    "output": {
+        "key": "1powB6YQD3WzpgZowXR-vsB9h9g-4FKzJ5fzXlZqEB0k",
+        "house": "Zeccol Mkl",
+        "staff": "Staff Food",
+        "chemicals": "Chemicals & Detergents",
+    },
+}
+
+
+class _Done:
+    """Already-computed stand-in for a Future, used when no executor is supplied"""
+
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+
+def _run_now(fn, *args):
+    return _Done(fn(*args))
+
+
+def _last_prediction(forecast_path):
+    """Raw prediction for the last day of a forecast path (None when the engine could not fit)"""
+    if forecast_path is None or forecast_path.empty:
+        return None
+    return float(forecast_path.tail(1)["yhat"].values[0])
+
+
+def _cushioned(raw_forecast, safety_cushion):
+    """Cushioned whole-unit forecast from a raw forecast"""
+    if raw_forecast is None or np.isnan(raw_forecast):
+        return 0
+    return int(max(0, round(raw_forecast * safety_cushion)))
+
+
+def _timed_call(fn, *args):
+    """
+    Runs fn(*args) and returns (result, seconds, error). Module-level so it can be sent to worker processes.
+    """
+    start = time.perf_counter()
+    try:
+        return fn(*args), time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
 
 class MarketList():
-    def __init__(self):
-        STEAM_TALENT_SERVICE_ACCOUNT = os.environ.get("STEAM_TALENT_ACCOUNT")
-        self.gc = gspread.service_account(STEAM_TALENT_SERVICE_ACCOUNT)
-        self.initialize_sheets_page()
+    def __init__(self, property_name="default", sheets=None, gc=None, limiter=None, artifact_store=None,
+                 revisions=None, ledger=None, issues_page_rows=PAGE_ROWS, names=None, usage=None):
+        """
+        - property_name: name of the property (site) this instance plans for
+        - sheets: per-source overrides of DEFAULT_SHEETS, usually loaded from properties.json
+        - gc: an authorised gspread client to share between instances
+        - limiter: a sheets.QuotaLimiter to share between instances (defaults to the process-wide one)
+        - artifact_store: where each run's histories and forecast paths are stored (defaults to ./artifacts)
+        - revisions: where cached data looks up spreadsheet revisions (defaults to Drive file versions; pass a
+          sheets.LocalRevisions in tests)
+        - ledger: where every run's forecasts and purchases are recorded (defaults to ./ledger.sqlite3)
+        - issues_page_rows: rows fetched per request while streaming the issues voucher
+        - names: a names.NameIndex resolving every source's item names to canonical ones (defaults to the alias
+          table in ./aliases.json)
+        - usage: a sheets.SheetsUsage every Sheets API call of this instance is counted in (defaults to a new one
+          adding up into sheets.default_usage)
+        """
+        self.property_name = property_name
+        self.sheets = {name: {**conf, **(sheets or {}).get(name, {})} for name, conf in DEFAULT_SHEETS.items()}
+        self.limiter = limiter or default_limiter
+        self.artifact_store = artifact_store or ArtifactStore()
+        self.ledger = ledger or RunLedger()
+        self.issues_page_rows = issues_page_rows
+        self.names = names or NameIndex.from_file()
+        self.usage = usage or SheetsUsage(parent=default_usage)
+
+        if gc is None:
+            import gspread
+
+            STEAM_TALENT_SERVICE_ACCOUNT = os.environ.get("STEAM_TALENT_ACCOUNT")
+            gc = gspread.service_account(STEAM_TALENT_SERVICE_ACCOUNT)
+        # Every call made through the client, and the spreadsheets and worksheets it opens, is counted in self.usage
+        self.gc = MeteredClient(gc, self.usage)
+        self.revisions = revisions or DriveRevisions(self.gc)
+        self.sheet = None
+        # Grid rows of the Issues worksheet when it was last loaded, so plan_sheets_calls can size it for free
+        self.issues_grid_rows = None
+
+    def get_output_spreadsheet(self):
+        """
+        Opens the market list spreadsheet on first use, so runs writing to local files never touch it
+        :return:
+        """
+        if self.sheet is None:
+            self.initialize_sheets_page()
+        return self.sheet
+
+    def open_source_worksheet(self, source):
+        """
+        Opens the worksheet configured for `source` (a DEFAULT_SHEETS key) of this property
+        :return:
+        """
+        self.limiter.acquire("read", n=2)
+        return self.gc.open_by_key(self.sheets[source]["key"]).worksheet(self.sheets[source]["worksheet"])
 
     def get_extras_and_exceptions_stock_name(self):
         """
         This method gets exempted and new stock into the issues voucher for computation
         :return:
         """
-        time.sleep(1)
+        extras_df = self.get_extras_data()
+        extras_items_list = extras_df["Stock Name"].unique().tolist()
 
-        gc = self.gc
-        extras_sheet = gc.open_by_key("19ePbzsPDeY38_gkSs4FT7nxUQWQczaJ1F5UNfGOOk1g")
-        extras_worksheet = extras_sheet.worksheet("Extras")
+        return extras_items_list
+
+    def get_extras_data(self):
+        """
+        This method returns the Extras sheet (exempted and new stock) in a pandas dataframe
+        :return:
+        """
+        extras_worksheet = self.open_source_worksheet("extras")
+        self.limiter.acquire("read")
         extras_values_list = extras_worksheet.get_all_values()
         extras_values_list = [[str(x).replace('"', '') for x in record] for record in extras_values_list]
+
         extras_df = pd.DataFrame(extras_values_list[1:], columns=extras_values_list[0])
+        extras_df["Stock Name"] = self.names.canonicalize(extras_df["Stock Name"])
         extras_df["Amount"] = extras_df["Amount"].str.replace([',', ''], '').astype(float)
-        extras_items_list = extras_df["Stock Name"].unique().tolist()
+        extras_df["Rate"] = extras_df["Rate"].str.replace([',', ''], '').astype(float)
+        extras_df["Buy"] = extras_df["Buy"].str.replace([',', ''], '').astype(float)
+        return extras_df
 
-        return extras_items_list
-
-    @st.cache_data(ttl=300)
-    def get_available_categories(_self):
+    def get_available_categories(self):
         """
         Get all available categories from issues voucher
         """
-        issue_df = _self.get_issue_voucher()
-        # Get unique categories and remove any empty/null values
-        categories = issue_df["Category"].dropna().unique().tolist()
-        # Remove empty strings and clean up the data
-        categories = [cat.strip() for cat in categories if cat and str(cat).strip()]
-        # Remove duplicates and sort
-        categories = sorted(list(set(categories)))
-        return categories
+        return self.get_category_index().categories
+
+    def get_category_index(self):
+        """
+        This method returns the category -> items index of the issues voucher, ranked by issue frequency.
+        It is built once per version of the issues and dormant stock sheets.
+        :return:
+        """
+        return self._load_category_index(self.sheets["issues"]["key"], self.sheets["issues"]["worksheet"],
+                                         self.sheets["dormant"]["key"], self.names.version)
+
+    @revision_cached("category_index", sources=("issues_key", "dormant_key"))
+    def _load_category_index(_self, issues_key, issues_worksheet, dormant_key, names_version):
+        # Like the issues voucher, keyed by worksheet too: properties may keep their issues in tabs of one spreadsheet
+        return CategoryIndex.from_issues(_self.get_issue_voucher())
 
     def get_items_by_categories(self, selected_categories, x_items=150, excluded_items=None):
         """
         Get top items filtered by selected categories and excluding specific items
         """
-        if excluded_items is None:
-            excluded_items = []
-            
-        issue_df = self.get_issue_voucher()
-        
-        # Filter by selected categories
-        filtered_df = issue_df[issue_df["Category"].isin(selected_categories)]
-        
-        # Get top items from selected categories
-        top_items = filtered_df["Item name"].value_counts().head(x_items)
-        items_list = top_items.index.tolist()
-        
-        # Remove excluded items
-        items_list = [item for item in items_list if item not in excluded_items]
-        
-        return items_list
+        excluded_items = self.names.canonicalize(excluded_items) if excluded_items else excluded_items
+        return self.get_category_index().top_items(selected_categories, x_items, excluded_items)
 
     def get_top_x_number_of_items_to_buy(self, x_items=150):
-        issue_df = self.get_issue_voucher()
         categories = ['WINE', 'BEVERAGE', 'FOOD ITEM', 'ELECTRONICS AND LIGHTING', 'CLEANING SUPPLY',
                       'GUEST SUPPLY', 'DRINKS', 'CONSUMABLE', 'PRINTING AND STATIONERIES', 'VEGETABLE', 'BITE']
         sel_cat = ['BEVERAGE', 'FOOD ITEM', 'CLEANING SUPPLY', 'GUEST SUPPLY', 'CONSUMABLE',
                    'PRINTING AND STATIONERIES']
 
-        sel_item_df = issue_df.loc[issue_df["Category"].isin(sel_cat)]
-        top_x_items = sel_item_df["Item name"].value_counts()[:x_items]
-        items_db = top_x_items.index.tolist()
-        return items_db
+        return self.get_category_index().top_items(sel_cat, x_items)
 
     def remove_outliers_col_freq(self, df):
         """"
@@ -135,8 +250,18 @@ class MarketList():
         else:
             return np.nan
 
-    def forecast_stock_usage_with_prophet(self, item, forecast_period="monthly", safety_cushion=1.10):
-        stock_name = item  # keep compatibility
+    def _fit_forecast(self, usage_df, forecast_period="monthly", engine="prophet", resolution="daily"):
+        """
+        Runs a forecasting engine on a Date/Usage frame and returns the raw (uncushioned) prediction for the
+        last day of the forecast period. Returns None when there is not enough history to fit.
+        :return:
+        """
+        # âœ… Reverted: use only the last prediction
+        return forecast_last_day(usage_df, get_forecast_days(forecast_period), engine, resolution)
+
+    def forecast_stock_usage_with_prophet(self, item, forecast_period="monthly", safety_cushion=1.10, engine="prophet",
+                                          resolution="daily"):
+        stock_name = self.names.canonical(item)  # keep compatibility
         try:
             issue_df = self.get_issue_voucher()
             if issue_df.empty or stock_name not in issue_df["Item name"].values:
@@ -151,33 +276,10 @@ class MarketList():
             if stock_usage.empty:
                 return 0
 
-            prophet_df = stock_usage.rename(columns={"Date": "ds", "Usage": "y"})
-            prophet_df["ds"] = pd.to_datetime(prophet_df["ds"], errors="coerce")
-            prophet_df = prophet_df.dropna(subset=["ds", "y"])
-
-            if prophet_df.empty or prophet_df.shape[0] < 3:
+            forecast_values = self._fit_forecast(stock_usage, forecast_period, engine, resolution)
+            if forecast_values is None:
                 return 0
 
-            # Prophet model
-            model = Prophet(daily_seasonality=True, yearly_seasonality=True)
-            model.fit(prophet_df)
-
-            # Forecast depending on period
-            if forecast_period == "weekly":
-                periods, freq = 7, "D"
-            elif forecast_period == "monthly":
-                periods, freq = 30, "D"
-            elif isinstance(forecast_period, int):
-                periods, freq = forecast_period, "D"
-            else:
-                raise ValueError("Invalid forecast_period value")
-
-            future = model.make_future_dataframe(periods=periods, freq=freq)
-            forecast = model.predict(future)
-
-            # âœ… Reverted: use only the last prediction
-            forecast_values = float(forecast.tail(1)["yhat"].values[0])
-
             # Apply safety cushion
             yhat_cushioned = forecast_values * safety_cushion
             return int(max(0, round(yhat_cushioned)))
@@ -186,21 +288,66 @@ class MarketList():
             print(f"Error forecasting with Prophet for {stock_name}: {e}")
             return 0
 
+    def forecast_category_usage_with_prophet(self, category, forecast_period="monthly", engine="prophet",
+                                             resolution="daily"):
+        """
+        Fits a single Prophet model on the total daily usage of a category (hierarchical mode).
+        Returns the raw category-level forecast (usage per category issue day), which is later split across items
+        with get_item_usage_shares(per_issue_day=True).
+        :return:
+        """
+        try:
+            issue_df = self.get_issue_voucher()
+            category_usage = (
+                issue_df[issue_df["Category"] == category]
+                .groupby("Date")["Usage"].sum()
+                .reset_index()
+            )
+            if category_usage.empty:
+                return 0
+
+            forecast_values = self._fit_forecast(category_usage, forecast_period, engine, resolution)
+            if forecast_values is None:
+                return 0
+            return max(0.0, forecast_values)
+
+        except Exception as e:
+            print(f"Error forecasting with Prophet for category {category}: {e}")
+            return 0
+
+    def get_item_usage_shares(self, category, lookback_days=90, per_issue_day=False):
+        """
+        This method returns each item's share of its category's usage over the last `lookback_days` days
+        of the issues voucher. Falls back to the full history when the recent window is empty.
+        per_issue_day scales the shares to split a category forecast into usage per item issue day
+        (see forecasting.item_usage_shares).
+        :return:
+        """
+        issue_df = self.get_issue_voucher()
+        return item_usage_shares(issue_df.loc[issue_df["Category"] == category, :], lookback_days, per_issue_day)
+
     def forecast_monthly_stock_usage_with_prohet(self, item, safety_cushion=1.10):
         """
         Wrapper method for backward compatibility
         """
         return self.forecast_stock_usage_with_prophet(item, 'monthly', safety_cushion)
 
-    @st.cache_data(ttl=300)
-    def get_stock_data(_self):
+    def get_stock_data(self):
         """
         This method returns a preprocessed data from the stock database in a pandas dataframe form
         :return:
         """
-        stock_sheet = _self.gc.open_by_key("1qqI-9I99Kix2PS1ksUralHeFXoyaArN7ZXYmCnMDLA0")
-        stock_wksheet = stock_sheet.worksheet("My Stock")
+        return self._load_stock_data(self.sheets["stock"]["key"], self.sheets["stock"]["worksheet"],
+                                     self.names.version)
 
+    @revision_cached("stock", sources=("stock_key",))
+    @coalesced("stock")
+    def _load_stock_data(_self, stock_key, stock_worksheet, names_version):
+        # The sheet key and worksheet are part of the cache key so properties never share cached data;
+        # the entry is rebuilt whenever the stock spreadsheet's revision changes
+        stock_wksheet = _self.open_source_worksheet("stock")
+
+        _self.limiter.acquire("read", n=2)
         columns = stock_wksheet.row_values(1)
         columns = [data.replace('"', '') for data in columns]
 
@@ -210,6 +357,7 @@ class MarketList():
 
         stock_df = pd.DataFrame(rows)
         stock_df.columns = columns
+        stock_df["Stock Name"] = _self.names.canonicalize(stock_df["Stock Name"])
 
         stock_df["Rate"] = stock_df["Rate"].replace(['', "null", 'nan'], np.nan).astype(float)
         stock_df["Case Qty"] = stock_df["Case Qty"].replace(['', "null", 'nan'], np.nan).astype(float)
@@ -227,69 +375,39 @@ class MarketList():
 
         return stock_df
 
-    @st.cache_data(ttl=300)
-    def get_issue_voucher(_self):
+    def get_issue_voucher(self):
         """
         This method returns a issues voucher in a pandas dataframe
         :return:
         """
-        issue_voucher_sheet = _self.gc.open_by_key("1y-I8V05Anud-j7VWaob3OaE9ubUEd7qqUkVFB0N942w")
-        issue_voucher_wksheet = issue_voucher_sheet.worksheet("Issues")
-
-        columns = issue_voucher_wksheet.row_values(1)
-        data = issue_voucher_wksheet.get_all_values()
-
-        data = [[str(x).replace('"', '') for x in record] for record in data]
-
-        df = pd.DataFrame(data)
-        df.columns = columns
+        return self._load_issue_voucher(self.sheets["issues"]["key"], self.sheets["issues"]["worksheet"],
+                                        self.sheets["dormant"]["key"], self.names.version)
 
-        df.drop(0, axis="rows", inplace=True)
-        df["Date"] = pd.to_datetime(df["Date"], format="%Y-%m-%d")
-        df["Usage"] = df["Usage"].str.replace(",", "").astype(float)
+    @revision_cached("issues", sources=("issues_key", "dormant_key"))
+    @coalesced("issues")
+    def _load_issue_voucher(_self, issues_key, issues_worksheet, dormant_key, names_version):
+        issue_voucher_wksheet = _self.open_source_worksheet("issues")
+        _self.issues_grid_rows = issue_voucher_wksheet.row_count
 
-        df = df.groupby(["Date", "Item name", "Category"], as_index=False).sum()
-
-        df = df.loc[~(df["Dept"] == "FUNCTION"), :]
+        _self.limiter.acquire("read")
+        columns = issue_voucher_wksheet.row_values(1)
 
-        df = df.loc[~(df["Item name"].isin(_self.fiterout_dormant_stock())), :]
+        # The sheet is streamed in row pages and folded into the usage totals page by page, so memory stays
+        # bounded by one page however long the history is
+        aggregator = IssuesAggregator(columns, excluded_items=_self.fiterout_dormant_stock(), names=_self.names)
+        for rows in iter_row_pages(issue_voucher_wksheet, len(columns), _self.limiter, _self.issues_page_rows):
+            aggregator.add(rows)
 
-        return df
+        return aggregator.result()
 
     def adjusted_and_replace_stock_name(self, df, dept_name):
-
-        staff_replaceabless = {
-            "OGBONO": 'OGBONO (STAFF)',
-            'DRY FISH': 'DRY FISH (STAFF)',
-            'SPAGHETTI': 'SPAGHETTI (STAFF)',
-            'SUGAR (GRANULATED)': 'SUGAR (GRANULATED, STAFF)',
-            'TIN TOMATO (2.2kg)': 'TIN TOMATO (2.2kg, STAFF)',
-            'VEGETABLE OIL': 'VEGETABLE OIL (STAFF)',
-            "CURRY POWDER": "CURRY (TIGER,250g, STAFF)",
-            "CURRY POWDER": "CURRY POWDER (500g)",
-            "ONGA SEASONING": "ONGA SEASONING (STAFF)",
-            "RED OIL": "RED OIL (STAFF)",
-            "STAR MAGGI": "STAR MAGGI (STAFF)"
-        }
-
-        general_replaceables = {
-            "ORIGIN BITTER (SMALL)": "ORIGIN BITTERS SMALL",
-            "SHWEPPES": "SCHWEPPES",
-            "ORIJIN BIG": "ORIJIN BEER",
-            "SEMOVITA": "SEMO",
-            "ORIJIN BIG": "ORIJIN BEER",
-            "YAM": "YAM TUBER",
-            "4TH STREET (BIG)": "4TH STREET",
-            "SKKY": "SKYY"
-        }
-
-        dept_df = df.loc[df["Dept"] == str(dept_name).strip(), :]
-        dept_df["Item name"] = dept_df["Item name"].replace(staff_replaceabless)
-        indices = dept_df.index.tolist()
-        dept_name_items = dept_df["Item name"].tolist()
-
-        for index, item in zip(indices, dept_name_items):
-            df.loc[index, "Item name"] = item
+        """
+        This method renames the items issued to `dept_name` in a raw issues dataframe (one with a Dept column) to
+        that department's own stock names, from the `departments` section of the alias table.
+        :return:
+        """
+        dept_rows = df["Dept"] == str(dept_name).strip()
+        df.loc[dept_rows, "Item name"] = self.names.canonicalize(df.loc[dept_rows, "Item name"], department=dept_name)
         return df
 
     def fiterout_dormant_stock(self):
@@ -298,21 +416,19 @@ class MarketList():
         days (default value) from the issues' voucher. This is to analyse only relevant stocks.
         :return:
         """
-        sheet = self.gc.open_by_key("12z2gPOzJcezdhe7UM5p96TiXe4tjgkW7MPkXOdFHxeM")
-        worksheet = sheet.worksheet("Dormant Stock")
+        worksheet = self.open_source_worksheet("dormant")
 
+        self.limiter.acquire("read")
         values = worksheet.get_all_values()[1:]
-        values = [x[0] for x in values]
-        return values
+        return self.names.canonicalize([x[0] for x in values])
 
     def get_stock_departmental_usage_proportions(self):
         """
         This method returns the dictionary usage proportions of stock by departments
         :return:
         """
-        time.sleep(2)
-        sheet = self.gc.open_by_key("1eA9byIBi5uD83UVGt9jaX4-35ugTuTt2nDnPjmdCut4")
-        worksheet = sheet.worksheet("Proportions")
+        worksheet = self.open_source_worksheet("proportions")
+        self.limiter.acquire("read")
         data = worksheet.get_all_values()
         cleaned_data = [[str(cell).replace('"', "") for cell in row] for row in data]
         df = pd.DataFrame(data=cleaned_data[1:], columns=cleaned_data[0])
@@ -335,15 +451,10 @@ class MarketList():
 
         # return stock_dict
 
-        all_items_dict = {}
-        item_list = df["Item name"].unique().tolist()
-        for item in [str(item).strip() for item in item_list]:
-
-            item_df = df.loc[df["Item name"]==item,:]
-
-            all_items_dict[item] = dict(zip(item_df["Dept"],item_df["Proportion"].astype(float)))
+        df["Item name"] = self.names.canonicalize(df["Item name"])
 
-        return all_items_dict
+        return {item: dict(zip(item_df["Dept"], item_df["Proportion"]))
+                for item, item_df in df.groupby("Item name", sort=False)}
 
 
     def get_possible_staff_food(self):
@@ -370,21 +481,28 @@ class MarketList():
             'OGBONO (STAFF)'
         ]
 
-        return staff_food_list
+        return self.names.canonicalize(staff_food_list)
 
     def process_procurement(self):
         """
         This method pulls purchases, processes it and returns it as a pandas dataframe.
         :return:
         """
-        stock_workbook = self.gc.open_by_key("1sP-RF1JYTp6OAKhhd8aVLD_vx_iIsTD84nQB-SQocc8")
-        stock_worksheet = stock_workbook.worksheet("Purchases")
+        return self._load_purchases(self.sheets["purchases"]["key"], self.sheets["purchases"]["worksheet"],
+                                    self.names.version)
 
+    @revision_cached("purchases", sources=("purchases_key",))
+    @coalesced("purchases")
+    def _load_purchases(_self, purchases_key, purchases_worksheet, names_version):
+        stock_worksheet = _self.open_source_worksheet("purchases")
+
+        _self.limiter.acquire("read")
         data_list = stock_worksheet.get_all_values()
 
         df = pd.DataFrame(data=data_list[1:], columns=data_list[0])
         df = df[['Date', 'Stock Name', 'Category', 'Qty_Received', 'Rate', 'Amount']]
         df.columns = ['Date', 'Item name', 'Category', 'Portion', 'Unit Cost', 'Total Amount']
+        df["Item name"] = _self.names.canonicalize(df["Item name"])
         df["Date"] = pd.to_datetime(df["Date"])
         df["Date"] = df["Date"].dt.strftime("%Y-%m-%d")
         df["Unit Cost"] = df["Unit Cost"].astype(float)
@@ -395,55 +513,159 @@ class MarketList():
         return df
 
     def process_batch_stock(self, batch_description, item_qty, item_cost):
-        import re
-        batch_description = batch_description.replace("Batch", "").strip()
-        item_cost = str(item_cost)[:-2]
-
-        print("Length of Item Cost " + str(len(item_cost)))
-        if len(item_cost) > 4:
-            item_cost = str(item_cost)[:2]
-        else:
-            item_cost = str(item_cost)[:1]
-        item_qty = str(item_qty)
-        match = re.match("\((.*)\)", batch_description)
-        grp = match.group()
-        cleaned_txt = re.sub("\(*\)*", "", grp)
-        n_item_n_amt = cleaned_txt.split("X")[1].split("/")
-        n_item_n_amt[0] = re.sub("\d+", str(item_qty), n_item_n_amt[0])
-        n_item_n_amt[1] = re.sub("\d+", str(item_cost), n_item_n_amt[1])
-        average_value = cleaned_txt.split("X")[0]
-        return str("Batch(") + average_value + "X" + n_item_n_amt[0] + str("/") + n_item_n_amt[1] + str(")")
+        return process_batch_stock(batch_description, item_qty, item_cost)
 
     def skip_item_for_purchase_sig_test(self, reorder_level, forcasted_qty):
-        """This method checks if:
-        a) The diff between the current balance of a stock is significantly greater that the predicted value.
-                or
-        b) The predicted value is NAN or
-        c) The diff between the current balance and predicted value is a negative
+        """See planning.skip_item_for_purchase_sig_test"""
+        return skip_item_for_purchase_sig_test(reorder_level, forcasted_qty)
 
-        If either of the above is true, the stock will be skipped from the forcast.
+    def initialize_sheets_page(self):
+        gc = self.gc
+        self.limiter.acquire("read", n=3)
+        self.sheet = gc.open_by_key(self.sheets["output"]["key"])
+        self.chemicals_worksheet = self.sheet.worksheet(self.sheets["output"]["chemicals"])
+        self.staff_worksheet = self.sheet.worksheet(self.sheets["output"]["staff"])
+
+    def read_market_lists(self):
+        """
+        This method reads the A4:E ranges of the house, staff food and chemicals worksheets in a single batched
+        request and returns {section: typed market list dataframe}. Concurrent reads of the same lists share one
+        request.
+        :return:
         """
+        output = self.sheets["output"]
+        return self._load_market_lists(output["key"], tuple(output[section] for section in MARKET_LIST_SECTIONS))
 
-        if reorder_level - forcasted_qty < 0:
-            return True
-        try:
-            ratio = (reorder_level / forcasted_qty)
-        except ZeroDivisionError:
-            ratio = (reorder_level / 1)
-        deviation = abs(ratio - 1)
-        significance_threshold = 0.05  # Deviation cut off of 5%
-        if deviation < significance_threshold:
-            return False
+    @revision_cached("market_lists", sources=("output_key",))
+    @coalesced("market_lists")
+    def _load_market_lists(_self, output_key, worksheet_names):
+        ranges = ["'{}'!A4:E".format(name.replace("'", "''")) for name in worksheet_names]
+
+        spreadsheet = _self.get_output_spreadsheet()
+        _self.limiter.acquire("read")
+        response = spreadsheet.values_batch_get(ranges)
+
+        return {
+            section: parse_market_list_rows(value_range.get("values", []))
+            for section, value_range in zip(MARKET_LIST_SECTIONS, response.get("valueRanges", []))
+        }
+
+    def get_sheets_sink(self):
+        """
+        This method returns an output sink writing to this property's market list worksheets
+        :return:
+        """
+        spreadsheet = self.get_output_spreadsheet()
+        self.limiter.acquire("read")
+        house_worksheet = spreadsheet.worksheet(self.sheets["output"]["house"])
+        return SheetsSink(spreadsheet, {
+            "house": house_worksheet,
+            "staff": self.staff_worksheet,
+            "chemicals": self.chemicals_worksheet,
+        }, self.limiter)
+
+    def plan_sheets_calls(self, selected_categories=None, x_items_limit=150, include_batch_items=None,
+                          output_sink="sheets", issues_rows=None):
+        """
+        Predicts the Sheets API calls create_market_list will make with these settings before it runs, and the
+        shortest time the read/write quota lets them take from now. It makes no Sheets calls itself, so it is safe
+        to call on every dashboard rerender.
+        - include_batch_items: whether batch-priced items will be planned (they read the Purchases sheet). None
+          works it out from the cached stock sheet and category index; when those are not cached yet it is left
+          undecided (None in the result), the Purchases reads are kept out of "reads" and reported as
+          "batch_reads" instead, and create_market_list settles them once the stock sheet is loaded
+        - issues_rows: rows of the Issues sheet. None uses the grid size seen when it was last loaded, or one row
+          page when it has not been loaded yet ("issues_estimated" is then True and the reads are a lower bound)
+        Datasets already cached cost no calls. add_rows (only when a list outgrows its worksheet) is not predicted.
+
+        Returns {"reads", "writes", "steps": {step: (reads, writes)}, "min_seconds", "include_batch_items",
+        "batch_reads", "issues_estimated"}.
+        """
+        version = self.names.version
+        stock_cached = self._load_stock_data.cached(self, self.sheets["stock"]["key"],
+                                                    self.sheets["stock"]["worksheet"], version)
+        issues_cached = self._load_issue_voucher.cached(self, self.sheets["issues"]["key"],
+                                                        self.sheets["issues"]["worksheet"],
+                                                        self.sheets["dormant"]["key"], version)
+        purchases_cached = self._load_purchases.cached(self, self.sheets["purchases"]["key"],
+                                                       self.sheets["purchases"]["worksheet"], version)
+
+        steps = {}
+        issues_estimated = False
+        if output_sink == "sheets":
+            # Output spreadsheet and its two worksheets are opened once per instance, the house worksheet per run
+            steps["output worksheets"] = ((3 if self.sheet is None else 0) + 1, 0)
+        steps["stock"] = (0 if stock_cached else 4, 0)
+        if issues_cached:
+            steps["issues"] = (0, 0)
         else:
-            return True
+            if issues_rows is None:
+                issues_rows = self.issues_grid_rows
+            if issues_rows is None:
+                issues_estimated = True
+                pages = 1
+            else:
+                pages = max(1, math.ceil((issues_rows - 1) / self.issues_page_rows))
+            # worksheet and header row, the row pages, and the dormant stock filtering them
+            steps["issues"] = (3 + pages + 3, 0)
+        steps["proportions"] = (3, 0)
+        steps["extras"] = (3, 0)
+
+        if include_batch_items is None and stock_cached and issues_cached:
+            if selected_categories:
+                items = self.get_items_by_categories(selected_categories, x_items_limit)
+            else:
+                items = self.get_top_x_number_of_items_to_buy(x_items_limit)
+            include_batch_items = self._has_batch_items(items, self.get_stock_data())
+        batch_reads = 0 if purchases_cached else 3
+        steps["purchases"] = (batch_reads if include_batch_items else 0, 0)
+        if output_sink == "sheets":
+            # Current lists in one batched read, the changed cells in one batched write
+            steps["write"] = (1, 1)
 
-    def initialize_sheets_page(self):
-        gc = self.gc
-        self.sheet = gc.open_by_key("1powB6YQD3WzpgZowXR-vsB9h9g-4FKzJ5fzXlZqEB0k")
-        self.chemicals_worksheet = self.sheet.worksheet("Chemicals & Detergents")
-        self.staff_worksheet = self.sheet.worksheet("Staff Food")
+        return self._call_budget(steps, include_batch_items, batch_reads, issues_estimated)
 
-    def create_market_list(self, forecast_period='monthly', selected_categories=None, excluded_items=None, x_items_limit=150):
+    def _call_budget(self, steps, include_batch_items, batch_reads, issues_estimated, min_seconds=None):
+        """
+        plan_sheets_calls' result for these steps. min_seconds defaults to what the quota allows from now
+        :return:
+        """
+        reads = sum(step_reads for step_reads, _ in steps.values())
+        writes = sum(step_writes for _, step_writes in steps.values())
+        if min_seconds is None:
+            min_seconds = max(self.limiter.min_seconds("read", reads), self.limiter.min_seconds("write", writes))
+        return {
+            "reads": reads,
+            "writes": writes,
+            "steps": steps,
+            "min_seconds": min_seconds,
+            "include_batch_items": include_batch_items,
+            "batch_reads": batch_reads if include_batch_items is None else 0,
+            "issues_estimated": issues_estimated,
+        }
+
+    def _settle_batch_items(self, predicted, items, stock_df):
+        """
+        A prediction that left include_batch_items undecided, settled from the loaded stock sheet: the Purchases
+        reads are added when `items` have batch-priced ones. The quota time is kept from when it was predicted
+        :return:
+        """
+        if predicted["include_batch_items"] is not None:
+            return predicted
+        include_batch_items = self._has_batch_items(items, stock_df)
+        steps = {**predicted["steps"], "purchases": (predicted["batch_reads"] if include_batch_items else 0, 0)}
+        return self._call_budget(steps, include_batch_items, predicted["batch_reads"], predicted["issues_estimated"],
+                                 predicted["min_seconds"])
+
+    @staticmethod
+    def _has_batch_items(items, stock_df):
+        """Whether any of `items` is batch priced, which makes planning read the Purchases sheet"""
+        units = stock_df.loc[stock_df["Stock Name"].isin(items), "Bundle_qty Unit"]
+        return bool(units.astype(str).str.contains("Batch").any())
+
+    def create_market_list(self, forecast_period='monthly', selected_categories=None, excluded_items=None, x_items_limit=150,
+                           hierarchical_categories=None, engine="prophet", executor=None, output_sink="sheets",
+                           resolution="daily", safety_cushion=1.10):
         """
         Enhanced market list creation with flexible forecasting periods and category selection
         
@@ -452,11 +674,32 @@ class MarketList():
         - selected_categories: list of categories to include (None for default selection)
         - excluded_items: list of items to exclude from selected categories
         - x_items_limit: maximum number of items to process
+        - hierarchical_categories: categories forecast once at category level and split across their
+          items by recent usage share, instead of fitting one model per item
+        - engine: forecasting engine name from forecasting.ENGINES, or 'auto' to classify each item's demand
+          pattern and route it to the cheapest adequate engine (see forecasting.ROUTES). An unknown name raises
+          ValueError before anything is read or written
+        - executor: optional concurrent.futures executor used to run the forecasts in parallel
+        - output_sink: 'sheets' (default), a .parquet/.csv/.xlsx path, or an output sink object (see output.py)
+        - resolution: 'daily' (default), 'weekly', a bucket size in days, or 'auto' (weekly for periods of 30+
+          days) - histories are summed into buckets before fitting and the forecast is spread back over the days
+        - safety_cushion: multiplier applied to every forecast (1.10 = 10% buffer); see replan() for trying other
+          values on the same forecasts
+
+        Returns a run summary with the number of items processed, rows planned, cells written, the elapsed time and
+        the predicted and actual Sheets calls ("sheets_calls", see plan_sheets_calls).
         """
-        house_worksheet = self.sheet.worksheet("Zeccol Mkl")
-        house_worksheet.batch_clear(["A4:E200"])
-        self.chemicals_worksheet.batch_clear(["A4:E200"])
-        self.staff_worksheet.batch_clear(["A4:E200"])
+        if engine != "auto":
+            # Fail fast on a bad engine name or resolution: every fit would fail and write an empty market list
+            get_engine(engine, resolution, get_forecast_days(forecast_period))
+
+        # Calls are counted per instance: concurrent runs on one MarketList share the actual counts
+        usage_start = self.usage.snapshot()
+        predicted_calls = self.plan_sheets_calls(selected_categories, x_items_limit, output_sink=output_sink)
+        print(f"Predicted Sheets calls: {describe_reads(predicted_calls)} reads, {predicted_calls['writes']} writes "
+              f"(at least {predicted_calls['min_seconds']:.0f}s under the quota)")
+
+        sink = self.get_sheets_sink() if output_sink == "sheets" else get_sink(output_sink)
 
         stock_df = self.get_stock_data()
         issues_df = self.get_issue_voucher()
@@ -465,11 +708,11 @@ class MarketList():
         #issues_df = self.adjusted_and_replace_stock_name(issues_df, "STAFF FOOD")
 
         usage_proportions = self.get_stock_departmental_usage_proportions()
-        chemicals = ["BLEACH", "IZAL", "LIQUID SOAP", "ODOUR CONTROL"]
+        chemicals = self.names.canonicalize(["BLEACH", "IZAL", "LIQUID SOAP", "ODOUR CONTROL"])
         staff_food = self.get_possible_staff_food()
 
-        time.sleep(1)
-        extras_and_exceptions_stock_name_list = self.get_extras_and_exceptions_stock_name()
+        extras_df = self.get_extras_data()
+        extras_and_exceptions_stock_name_list = extras_df["Stock Name"].unique().tolist()
 
         # Use category-based selection if provided
        # Use category-based selection if provided
@@ -496,59 +739,111 @@ class MarketList():
             top_items.extend(extras_and_exceptions_stock_name_list)
 
         items_to_buy = sorted(set(top_items))
+        predicted_calls = self._settle_batch_items(predicted_calls, items_to_buy, stock_df)
 
         
         print(f"Processing {len(items_to_buy)} items with {forecast_period} forecasting...")
 
+        run_start = time.perf_counter()
+        raw_forecasts, forecast_paths = self._forecast_items(items_to_buy, forecast_period, engine,
+                                                             hierarchical_categories, executor, resolution)
+        forecasts = {item: _cushioned(raw, safety_cushion) for item, raw in raw_forecasts.items()}
+        run_id = self._store_forecast_artifacts(forecasts, forecast_paths, forecast_period=forecast_period,
+                                                engine=engine, resolution=resolution, safety_cushion=safety_cushion,
+                                                hierarchical_categories=sorted(hierarchical_categories or []))
+        run_id = run_id or self.artifact_store.new_run_id(self.property_name)
+
+        # Everything the purchase calculation needs is kept with the raw forecasts, so replan() can answer
+        # what-if changes without refitting or re-reading the sheets. Plans are never modified once built.
+        plan = {
+            "run_id": run_id,
+            "items": items_to_buy,
+            "raw_forecasts": raw_forecasts,
+            "stock_df": stock_df,
+            "issues_df": issues_df,
+            "extras_df": extras_df,
+            "usage_proportions": usage_proportions,
+            "staff_food": staff_food,
+            "chemicals": chemicals,
+            "settings": {"forecast_period": forecast_period, "forecast_days": get_forecast_days(forecast_period),
+                         "engine": engine},
+        }
         for item in items_to_buy:
-            time.sleep(3)
+            print(f"{item} ({forecast_period}) = {forecasts[item]}")
+        sections, _ = self._plan_sections(plan, safety_cushion)
+        plan = {**plan, "sections": sections, "safety_cushion": safety_cushion}
+        self.last_plan = plan
+
+        write_summary = self.write_sections(sections, sink, safety_cushion=safety_cushion, plan=plan)
+        actual_calls = self.usage.since(usage_start)
+        for line in format_calls(predicted_calls, actual_calls):
+            print(line)
+
+        return {
+            "property": self.property_name,
+            "run_id": run_id,
+            "items": len(items_to_buy),
+            "rows": sum(len(rows) for rows in sections.values()),
+            "cells_written": write_summary["cells"],
+            "output": write_summary.get("path", "sheets"),
+            "seconds": time.perf_counter() - run_start,
+            "plan": plan,
+            "sheets_calls": {"predicted": predicted_calls, "actual": actual_calls},
+        }
+
+    def _plan_sections(self, plan, safety_cushion=1.10, balance_overrides=None, staff_shares=None, executor=None):
+        """
+        Turns a plan's raw forecasts into market list sections. No forecasting and no Sheets reads happen here
+        (purchases are cached), so this is cheap enough to rerun on every what-if change.
+        - balance_overrides: {item: current balance} used instead of the stock sheet's Current Balance
+        - staff_shares: {item: staff food share (0-1)} used instead of the Proportions sheet's split
+        - executor: optional thread or process pool the per-item purchase calculations are spread over
+
+        Every purchase calculation gets an immutable planning.StockRecord and returns an immutable PurchaseLine,
+        nothing is kept on the instance, so concurrent calls (and parallel items) never share working state.
+        Returns ({section: rows}, {item: cushioned forecast}).
+        """
+        stock = StockRecord.from_stock(plan["stock_df"], balance_overrides)
+        staff_shares = staff_shares or {}
+        extras_df = plan["extras_df"]
+        extras_and_exceptions_stock_name_list = extras_df["Stock Name"].unique().tolist()
+        usage_proportions, staff_food, chemicals = plan["usage_proportions"], plan["staff_food"], plan["chemicals"]
 
-            item_df = issues_df.loc[issues_df["Item name"] == item, :].dropna()
-            
-            self.avg_col_freq = self.remove_outliers_col_freq(item_df)
+        forecasts = {item: _cushioned(raw, safety_cushion) for item, raw in plan["raw_forecasts"].items()}
+        # Batch-priced items rewrite their unit from their recent purchases; only they need the Purchases sheet
+        batch_items = [item for item in plan["items"] if item in stock and "Batch" in str(stock[item].bundle_unit)]
+        purchases = item_purchases(self.process_procurement(), batch_items) if batch_items else {}
 
-            # Use the enhanced forecasting method
-            item_mv = self.forecast_stock_usage_with_prophet(
-                item=item, 
-                forecast_period=forecast_period,
-                safety_cushion=1.10
-            )
+        # (section, ready row or index into tasks) in market list order; rows are collected per section and
+        # written in one diff-based batch at the end of the run
+        slots, tasks = [], []
 
-            print(f"{item} ({forecast_period}) = {item_mv}")
+        def add_task(section, item, item_mv):
+            if item in stock:
+                slots.append((section, len(tasks)))
+                tasks.append((stock[item], item_mv, purchases.get(item)))
 
-            self.item_mv_remainder = None
+        for item in plan["items"]:
+            item_mv = forecasts[item]
 
             if np.isnan(item_mv) or item_mv == 0:
                 if item in extras_and_exceptions_stock_name_list:
-                    time.sleep(1)
-                    gc = self.gc
-                    extras_sheet = gc.open_by_key("19ePbzsPDeY38_gkSs4FT7nxUQWQczaJ1F5UNfGOOk1g")
-                    extras_worksheet = extras_sheet.worksheet("Extras")
-                    extras_values_list = extras_worksheet.get_all_values()
-                    extras_values_list = [[str(x).replace('"', '') for x in record] for record in extras_values_list]
-
-                    extras_df = pd.DataFrame(extras_values_list[1:], columns=extras_values_list[0])
-                    extras_df["Amount"] = extras_df["Amount"].str.replace([',', ''], '').astype(float)
-                    extras_df["Rate"] = extras_df["Rate"].str.replace([',', ''], '').astype(float)
-                    extras_df["Buy"] = extras_df["Buy"].str.replace([',', ''], '').astype(float)
-
-                    item = extras_df["Stock Name"].values[0]
-                    reorder_level_str = str(extras_df["Current Bal"].values[0])
-                    buy_str = str(extras_df["Buy"].values[0])
-                    mkl_rate = extras_df["Rate"].values[0]
-                    mkl_amt = extras_df["Amount"].values[0]
-
-                    house_worksheet.append_rows([[item, reorder_level_str, buy_str, str(mkl_rate), str(mkl_amt)]])
-                    continue
-                else:
-                    continue
+                    extras_item_df = extras_df.loc[extras_df["Stock Name"] == item, :]
 
-            #remainder_mv_avg = None
+                    item = extras_item_df["Stock Name"].values[0]
+                    reorder_level_str = str(extras_item_df["Current Bal"].values[0])
+                    buy_str = str(extras_item_df["Buy"].values[0])
+                    mkl_rate = extras_item_df["Rate"].values[0]
+                    mkl_amt = extras_item_df["Amount"].values[0]
 
-        
+                    slots.append(("house", [item, reorder_level_str, buy_str, str(mkl_rate), str(mkl_amt)]))
+                continue
 
             # First, determine if item has proportion data
-            if item in usage_proportions and 'STAFF FOOD' in usage_proportions[item]:
+            if item in staff_shares:
+                staff_proportion = float(staff_shares[item])
+                house_proportion = 1 - staff_proportion
+            elif item in usage_proportions and 'STAFF FOOD' in usage_proportions[item]:
                 staff_proportion = usage_proportions[item]['STAFF FOOD']
                 house_proportion = 1 - staff_proportion
             else:
@@ -557,122 +852,234 @@ class MarketList():
 
             # Staff-only item
             if (item in staff_food) and ("staff" in str(item).strip().lower()) or (staff_proportion > 0.30):
-                staff_item_mv = item_mv * staff_proportion
-                self._process_item_purchase(item, stock_df, staff_item_mv, self.staff_worksheet, chemicals)
-
-            # # Shared items — check staff side
-            # if item in staff_food and staff_proportion > 0.30:
-            #     staff_item_mv = item_mv * staff_proportion
-            #     self._process_item_purchase(item, stock_df, staff_item_mv, self.staff_worksheet, chemicals)
+                add_task("staff", item, item_mv * staff_proportion)
 
             # Shared items — check house side
             if item in staff_food and house_proportion > 0.30:
-                house_item_mv = item_mv * house_proportion
-                self._process_item_purchase(item, stock_df, house_item_mv, house_worksheet, chemicals)
+                add_task("house", item, item_mv * house_proportion)
 
             # Regular items
             if item not in staff_food:
-                target_sheet = self.chemicals_worksheet if item in chemicals else house_worksheet
-                self._process_item_purchase(item, stock_df, item_mv, target_sheet, chemicals)
+                add_task("chemicals" if item in chemicals else "house", item, item_mv)
 
+        lines = plan_purchases(tasks, executor)
+        sections = {section: [] for section in MARKET_LIST_SECTIONS}
+        for section, slot in slots:
+            if isinstance(slot, list):
+                sections[section].append(slot)
+            elif lines[slot] is not None:
+                sections[section].append(lines[slot].row())
 
-    def _process_item_purchase(self, item, stock_df, item_mv, target_worksheet, chemicals):
-        """
-        Helper method to process individual item purchase calculations
+        return sections, forecasts
+
+    def replan(self, safety_cushion=1.10, balance_overrides=None, staff_shares=None, plan=None, executor=None):
         """
-        try:
-            self.item_df = stock_df.loc[stock_df["Stock Name"] == item, :]
-            
-            if self.item_df.empty:
-                return
-
-            self.ptn_name = self.item_df["Ptn Name"].values[0]
-            self.case_qty = self.item_df["Case Qty"].values[0]
-            self.b_qty = self.item_df["Bundle Qty"].values[0]
-            self.b_name = self.item_df["Bundle_qty Unit"].values[0]
-            self.rate = self.item_df["Rate"].values[0]
-            self.current_bal = float(self.item_df["Current Balance"].values[0])
-
-            if self.current_bal < 0:
-                self.current_bal = 0
-
-            if self.current_bal >= item_mv:
-                if self.skip_item_for_purchase_sig_test(self.current_bal, item_mv):
-                    return
-
-            if "Batch" in self.b_name:
-                purchase_df = self.process_procurement()
-                item_purchase_df = purchase_df.loc[purchase_df["Item name"] == item, :]
-                real_purchase_item_df = item_purchase_df.loc[item_purchase_df["Total Amount"] > 1, :]
-                if not real_purchase_item_df.empty:
-                    last_three_purchase = real_purchase_item_df.tail(3)
-                    mean_amt = round(last_three_purchase["Total Amount"].mean(), -3)
-                    mean_received = math.ceil(last_three_purchase["Portion"].mean())
-                    self.b_name = self.process_batch_stock(self.b_name, mean_received, mean_amt)
-
-            # Calculate reorder level display
-            if self.current_bal < self.b_qty:
-                reorder_level_str = str(self.current_bal) + " " + str(self.ptn_name)
-            elif self.current_bal > self.b_qty and self.b_qty == 1:
-                reorder_level_str = str(self.current_bal // self.b_qty) + " " + str(self.b_name)
-            else:
-                reorder_level_str = str(self.current_bal // self.b_qty) + " " + str(self.b_name)
-
-            print(f"Current Bal: {self.current_bal}")
-            try:
-                print(f"Forecast: {math.ceil(item_mv)}")
-            except Exception as ex:
-                pass
-
-            # Calculate quantity needed
-            needed_qty = math.ceil(item_mv - self.current_bal)
-            if needed_qty < 0:
-                needed_qty = math.ceil(abs(needed_qty))
-
-            if self.case_qty == 1:
-                buy = needed_qty / self.b_qty
-                buy_flag = needed_qty / self.b_qty
-            else:
-                buy = needed_qty / self.case_qty
-                buy_flag = needed_qty / self.b_qty
+        What-if replanning of a create_market_list run (`plan`, the run summary's "plan", defaulting to this
+        instance's last run): recomputes the market lists from the run's raw (uncushioned) forecasts with another
+        safety cushion, overridden current balances and/or staff/house splits, without refitting or writing
+        anything. Safe to call from several threads at once.
 
-            if buy_flag < 0.5:
-                buy = 0.5
-            elif 0.5 <= buy_flag < 1:
-                buy = 1
+        Returns {"sections": {section: rows}, "forecasts": {item: cushioned forecast},
+        "totals": {section: total amount}, "seconds": elapsed}. Pass the result to apply_replan to write it.
+        """
+        plan = plan or getattr(self, "last_plan", None)
+        if plan is None:
+            raise ValueError("No market list has been generated in this session yet")
+        start = time.perf_counter()
+        sections, forecasts = self._plan_sections(plan, safety_cushion, balance_overrides, staff_shares, executor)
+        return {
+            "sections": sections,
+            "forecasts": forecasts,
+            "totals": {section: float(parse_market_list_rows(rows)["Total Amount"].sum())
+                       for section, rows in sections.items()},
+            "safety_cushion": safety_cushion,
+            "run_id": plan["run_id"],
+            "seconds": time.perf_counter() - start,
+        }
 
-            buy = round(buy, 1)
-            buy_str = str(buy) + f" {self.b_name}"
+    def apply_replan(self, replanned, output_sink="sheets", plan=None):
+        """
+        Writes a replan() result to `output_sink` and records it in the ledger in place of the lines of the run it
+        replans
+        :return:
+        """
+        plan = plan or self.last_plan
+        sink = self.get_sheets_sink() if output_sink == "sheets" else get_sink(output_sink)
+        write_summary = self.write_sections(replanned["sections"], sink, forecasts=replanned["forecasts"],
+                                            safety_cushion=replanned["safety_cushion"], plan=plan, replace=True)
+        if self.last_plan is plan:
+            self.last_plan = {**plan, "sections": replanned["sections"], "safety_cushion": replanned["safety_cushion"]}
+        return write_summary
+
+    def write_sections(self, sections, sink, forecasts=None, safety_cushion=1.10, plan=None, replace=False):
+        """
+        Writes the market list sections of `plan` (the last plan by default) to `sink` and records them in the
+        run ledger, replacing the lines already recorded for the plan's run when `replace` is set.
+        Returns the sink's write summary.
+        """
+        plan = plan or self.last_plan
+        write_summary = sink.write(sections)
+        if isinstance(sink, SheetsSink) and write_summary["cells"]:
+            self.revisions.changed(self.sheets["output"]["key"])
+
+        if forecasts is None:
+            forecasts = {item: _cushioned(raw, safety_cushion) for item, raw in plan["raw_forecasts"].items()}
+        self._record_run(plan["run_id"], sections, forecasts, plan["stock_df"], plan["issues_df"],
+                         safety_cushion=safety_cushion, output=write_summary.get("path", "sheets"), replace=replace,
+                         **plan["settings"])
+        return write_summary
+
+    def get_usage_matrix(self):
+        """
+        This method returns the issues voucher as a dense float32 item x day UsageMatrix.
+        It is built once per version of the issues and dormant stock sheets and of the alias table, like the voucher.
+        :return:
+        """
+        return self._load_usage_matrix(self.sheets["issues"]["key"], self.sheets["issues"]["worksheet"],
+                                       self.sheets["dormant"]["key"], self.names.version)
 
-            # Calculate rates and amounts
-            if self.case_qty == 1:
-                mkl_rate = round((self.rate * self.b_qty), -2)
-            else:
-                if buy < self.b_qty:
-                    buy_str = str(int(self.b_qty // buy)) + f" {self.b_name}"
-                    buy = buy / self.b_qty
-                mkl_rate = round((self.rate * self.case_qty * self.b_qty), -2)
+    @revision_cached("usage_matrix", sources=("issues_key", "dormant_key"))
+    def _load_usage_matrix(_self, issues_key, issues_worksheet, dormant_key, names_version):
+        return UsageMatrix.from_issues(_self.get_issue_voucher())
 
-            mkl_amt = round(mkl_rate * buy, 0)
+    def _forecast_items(self, items, forecast_period, engine="prophet", hierarchical_categories=None, executor=None,
+                        resolution="daily"):
+        """
+        Forecasts every item and returns ({item: raw forecast}, {item: raw forecast path}); the forecast is
+        computed like forecast_stock_usage_with_prophet, before the safety cushion is applied.
+        Items of `hierarchical_categories` share one fit per category, split by recent usage share.
+        With engine='auto' every item is routed by its demand class; category fits always use Prophet.
+        Every fit uses the same `resolution` (see forecasting.get_engine).
+
+        Work is sent to `executor` when given. Workers read item histories from the shared item x day usage
+        matrix; with a ProcessPoolExecutor the matrix is placed in shared memory once for the whole run, so
+        each task only carries an item name. A ForecastServiceClient sends every history to the forecasting
+        service in one batch instead. The count and total fit time of each mode/route is printed.
+        """
+        issues_df = self.get_issue_voucher()
+        forecast_days = get_forecast_days(forecast_period)
+        hierarchical_categories = set(hierarchical_categories or [])
+        item_categories = issues_df.drop_duplicates("Item name", keep="last").set_index("Item name")["Category"]
+        fit_stats = {"per-item": [0, 0.0], "category": [0, 0.0]}
+
+        item_engines = {}
+        if engine == "auto":
+            fit_stats = {"category": [0, 0.0]}
+            demand_classes = classify_demand(issues_df)
+            for item in items:
+                demand_class = demand_classes["Class"].get(item, "insufficient")
+                item_engines[item] = (f"{demand_class} -> {ROUTES[demand_class]}", ROUTES[demand_class])
+            for mode, _ in item_engines.values():
+                fit_stats.setdefault(mode, [0, 0.0])
+
+        matrix, block = self.get_usage_matrix(), None
+        if isinstance(executor, ProcessPoolExecutor):
+            matrix, block = matrix.to_shared_memory()
+        def submit_fit(engine_name, usage_df=None, item=None):
+            # Category fits pass their usage frame, item fits their name
+            if isinstance(executor, ForecastServiceClient):
+                history = usage_df if item is None else matrix.item_history(item)
+                return executor.submit_forecast(history, forecast_days, engine_name, resolution)
+            submit = executor.submit if executor is not None else _run_now
+            if item is None:
+                return submit(_timed_call, get_engine(engine_name, resolution, forecast_days), usage_df, forecast_days)
+            return submit(_timed_call, forecast_item, matrix, item, forecast_days, engine_name, resolution)
+
+        def collect(mode, name, future):
+            result, seconds, error = future.result()
+            fit_stats[mode][0] += 1
+            fit_stats[mode][1] += seconds
+            if error:
+                print(f"Error forecasting {name}: {error}")
+            return result
 
-            target_worksheet.append_rows([[item, str(reorder_level_str), buy_str, str(mkl_rate), str(mkl_amt)]])
+        try:
+            # Hierarchical mode: one fit per category, split across items by recent usage share
+            categories = {item_categories.get(item) for item in items} & hierarchical_categories
+            category_futures = {}
+            for category in categories:
+                category_usage = issues_df[issues_df["Category"] == category].groupby("Date")["Usage"].sum().reset_index()
+                category_futures[category] = submit_fit("prophet" if engine == "auto" else engine, category_usage)
+
+            item_futures = {}
+            for item in items:
+                if item_categories.get(item) in categories:
+                    continue
+                mode, item_engine = item_engines.get(item, ("per-item", engine))
+                item_futures[item] = (mode, submit_fit(item_engine, item=item))
+
+            forecasts, forecast_paths = {}, {}
+            for item, (mode, future) in item_futures.items():
+                forecast_paths[item] = collect(mode, item, future)
+                raw = _last_prediction(forecast_paths[item])
+                forecasts[item] = 0.0 if raw is None else max(0.0, float(raw))
+
+            category_paths = {category: collect("category", category, future)
+                              for category, future in category_futures.items()}
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+        # Category fits forecast usage per category issue day; the shares turn it into usage per item issue day
+        category_shares = {category: self.get_item_usage_shares(category, per_issue_day=True)
+                           for category in categories}
+        for item in items:
+            category = item_categories.get(item)
+            if category in categories:
+                item_share = category_shares[category].get(item, 0)
+                category_forecast = max(0.0, _last_prediction(category_paths[category]) or 0.0)
+                forecasts[item] = category_forecast * item_share
+                if category_paths[category] is not None:
+                    forecast_paths[item] = category_paths[category].assign(
+                        **{col: category_paths[category][col] * item_share
+                           for col in ["yhat", "yhat_lower", "yhat_upper"]})
+
+        for mode, (n_fits, fit_time) in fit_stats.items():
+            print(f"{mode} mode: {n_fits} fits in {fit_time:.1f}s")
+        return forecasts, forecast_paths
+
+    def _store_forecast_artifacts(self, forecasts, forecast_paths, **settings):
+        """
+        Stores every item's usage history and forecast path of this run in the artifact store, so the dashboard's
+        Forecast Analysis tab never has to refit. Returns the run id, or None when storing fails.
+        """
+        try:
+            matrix = self.get_usage_matrix()
+            run_id = self.artifact_store.new_run_id(self.property_name)
+            histories = {item: matrix.item_history(item) for item in forecasts}
+            self.artifact_store.write_run(run_id, histories, forecast_paths, {
+                "property": self.property_name,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "forecasts": forecasts,
+                **settings,
+            })
+            return run_id
+        except Exception as e:
+            print(f"Error storing forecast artifacts: {e}")
+            return None
 
+    def _record_run(self, run_id, sections, forecasts, stock_df, issues_df, replace=False, **settings):
+        """
+        Appends this run's forecast, balance, buy quantity, rate and amount of every item to the run ledger.
+        Returns the number of ledger lines, or 0 when recording fails.
+        """
+        try:
+            stock = stock_df.drop_duplicates("Stock Name").set_index("Stock Name")
+            categories = {
+                **issues_df.drop_duplicates("Item name", keep="last").set_index("Item name")["Category"].to_dict(),
+                **stock["Category"].dropna().to_dict(),
+            }
+            balances = stock["Current Balance"].dropna().to_dict()
+            lines = ledger_lines(sections, forecasts, balances, categories)
+            return self.ledger.record_run(run_id, self.property_name, lines, replace=replace, **settings)
         except Exception as e:
-            print(f"Error processing {item}: {e}")
+            print(f"Error recording run in the ledger: {e}")
+            return 0
 
 
 if __name__ == "__main__":
-    mkl = MarketList()
-    
-    # Example usage with new features:
-    
-    # Weekly forecast for selected categories
-    # mkl.create_market_list(
-    #     forecast_period='weekly',
-    #     selected_categories=['FOOD ITEM', 'BEVERAGE', 'CLEANING SUPPLY'],
-    #     excluded_items=['RICE (OLD STOCK)', 'EXPIRED ITEMS'],
-    #     x_items_limit=100
-    # )
-    
-    # Monthly forecast (default behavior)
-    mkl.create_market_list()
\ No newline at end of file
+    # Headless runs go through the CLI (python cli.py --help)
+    from cli import main
+
+    main()
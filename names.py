@@ -0,0 +1,90 @@
+"""
+Canonical item names shared by every source sheet.
+
+Issues, stock, purchases, proportions, dormant stock and extras all name items by hand, so the same item can arrive
+as 'SEMOVITA', 'Semovita ' or 'SEMO'. NameIndex resolves a name through its normalized key (quotes removed,
+whitespace collapsed, case folded) in a hash table built from the alias table in aliases.json:
+
+    {
+        "aliases": {"SEMOVITA": "SEMO", ...},
+        "departments": {"STAFF FOOD": {"SPAGHETTI": "SPAGHETTI (STAFF)", ...}}
+    }
+
+`aliases` apply to every source at load time; `departments` rename the items issued to one department to that
+department's own stock names. Names without an alias keep their cleaned spelling. Columns are canonicalized
+vectorized: each distinct name is resolved once and the result broadcast back to the rows.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ALIASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aliases.json")
+
+
+def clean_name(name):
+    """Name with quotes removed and whitespace collapsed"""
+    return " ".join(str(name).replace('"', "").split())
+
+
+def name_key(name):
+    """Normalized lookup key of a name"""
+    return clean_name(name).casefold()
+
+
+class NameIndex:
+    """
+    - aliases: {alias: canonical name} applied everywhere
+    - departments: {department: {alias: canonical name}} applied only to that department's issues
+    """
+
+    def __init__(self, aliases=None, departments=None):
+        self.aliases = dict(aliases or {})
+        self.departments = {str(dept).strip(): dict(table) for dept, table in (departments or {}).items()}
+        self._table = self._build(self.aliases)
+        self._department_tables = {dept: self._build(table) for dept, table in self.departments.items()}
+        payload = json.dumps({"aliases": self.aliases, "departments": self.departments}, sort_keys=True)
+        # Part of the loader cache keys, so data canonicalized with another alias table is never reused
+        self.version = hashlib.md5(payload.encode()).hexdigest()[:12]
+
+    @staticmethod
+    def _build(aliases):
+        table = {}
+        for alias, canonical in aliases.items():
+            canonical = clean_name(canonical)
+            table.setdefault(name_key(canonical), canonical)
+            table[name_key(alias)] = canonical
+        return table
+
+    @classmethod
+    def from_file(cls, path=ALIASES_PATH):
+        """
+        Loads the alias table from `path`; a missing file gives an index that only cleans names
+        :return:
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config.get("aliases"), config.get("departments"))
+
+    def canonical(self, name, department=None):
+        """Canonical spelling of one name"""
+        table = self._department_tables.get(str(department).strip(), {}) if department is not None else {}
+        key = name_key(name)
+        return table.get(key) or self._table.get(key) or clean_name(name)
+
+    def canonicalize(self, names, department=None):
+        """
+        Canonical spelling of every name in `names` (a Series, list or array). Returns a Series for a Series input
+        (same index) and a list otherwise. Missing values are left as they are.
+        :return:
+        """
+        codes, uniques = pd.factorize(pd.Series(names, dtype=object) if not isinstance(names, pd.Series) else names)
+        resolved = np.array([self.canonical(name, department) for name in uniques] + [None], dtype=object)
+        values = np.where(codes >= 0, resolved[codes], np.asarray(names, dtype=object))
+        if isinstance(names, pd.Series):
+            return pd.Series(values, index=names.index, name=names.name)
+        return values.tolist()
@@ -0,0 +1,277 @@
+"""
+Output sinks for generated market lists.
+
+A run produces three sections (house, staff food, chemicals), each a list of rows
+[Item, Current Stock, Quantity to Buy, Unit Rate, Total Amount]. A sink receives all sections at once in
+write(sections) and returns a summary with the number of cells written:
+
+- SheetsSink: diff-based writer for the Google Sheets market list worksheets
+- ParquetSink / CSVSink / XLSXSink: local files written in one bulk write, no network involved
+"""
+import abc
+import os
+from collections import Counter
+
+import pandas as pd
+
+FIRST_ROW = 4
+COLUMNS = "ABCDE"
+
+# Market list sections and their titles in local files
+MARKET_LIST_SECTIONS = ("house", "staff", "chemicals")
+SECTION_TITLES = {"house": "House Items", "staff": "Staff Food", "chemicals": "Chemicals & Detergents"}
+MARKET_LIST_COLUMNS = ["Item", "Current Stock", "Quantity to Buy", "Unit Rate", "Total Amount"]
+
+
+def parse_market_list_rows(rows):
+    """
+    Turns raw market list cell values into a typed market list dataframe. Unit Rate and Total Amount are parsed to
+    floats once here so callers can sum them directly.
+    :return:
+    """
+    # The API omits trailing empty cells, so pad every row to the five columns
+    rows = [(list(row) + [""] * len(MARKET_LIST_COLUMNS))[:len(MARKET_LIST_COLUMNS)] for row in rows]
+    df = pd.DataFrame(rows, columns=MARKET_LIST_COLUMNS, dtype=str)
+    df = df.loc[df["Item"].str.strip() != "", :].reset_index(drop=True)
+    for col in ["Unit Rate", "Total Amount"]:
+        df[col] = pd.to_numeric(df[col].str.replace(r"[,₦\s]", "", regex=True), errors="coerce")
+    return df
+
+
+def _pad(row):
+    return [str(cell) for cell in (list(row) + [""] * len(COLUMNS))[:len(COLUMNS)]]
+
+
+def _keyed(rows):
+    """Keys rows by item name (plus an occurrence number, in case an item appears twice in a section)"""
+    seen = Counter()
+    keyed = []
+    for row in rows:
+        seen[row[0]] += 1
+        keyed.append(((row[0], seen[row[0]]), row))
+    return keyed
+
+
+def diff_section(current, desired):
+    """
+    Computes the cell writes that turn the `current` rows of a section into the `desired` rows.
+
+    Rows are matched by item: changed items are updated in place (only the cells that differ), removed items free
+    their row, new items fill freed rows first and are appended after the last row otherwise. Rows left over at
+    the bottom are moved up into remaining holes so the list stays contiguous.
+
+    Returns ({sheet row number: {column index: value}}, (inserted, updated, deleted)).
+    """
+    current = [_pad(row) for row in current]
+    while current and not any(cell.strip() for cell in current[-1]):
+        current.pop()
+
+    filled = [offset for offset, row in enumerate(current) if row[0].strip()]
+    free = [offset for offset, row in enumerate(current) if not row[0].strip()]
+    positions = {key: offset for offset, (key, _) in zip(filled, _keyed([current[offset] for offset in filled]))}
+
+    desired_keyed = _keyed([_pad(row) for row in desired])
+    desired_keys = {key for key, _ in desired_keyed}
+
+    grid = {offset: list(row) for offset, row in enumerate(current)}
+    updated = inserted = 0
+
+    deleted_keys = [key for key in positions if key not in desired_keys]
+    for key in deleted_keys:
+        grid[positions[key]] = [""] * len(COLUMNS)
+        free.append(positions[key])
+    free.sort()
+
+    pending = []
+    for key, row in desired_keyed:
+        if key in positions:
+            if grid[positions[key]] != row:
+                grid[positions[key]] = row
+                updated += 1
+        else:
+            pending.append(row)
+
+    n_rows = len(current)
+    for row in pending:
+        if free:
+            grid[free.pop(0)] = row
+        else:
+            grid[n_rows] = row
+            n_rows += 1
+        inserted += 1
+
+    # Close remaining holes by moving the bottom rows up
+    while free:
+        hole = free.pop(0)
+        last = max((offset for offset, row in grid.items() if row[0].strip()), default=-1)
+        if last < hole:
+            break
+        grid[hole], grid[last] = grid[last], [""] * len(COLUMNS)
+        free.append(last)
+        free.sort()
+
+    writes = {}
+    for offset, row in grid.items():
+        old = current[offset] if offset < len(current) else [""] * len(COLUMNS)
+        changed = {col: value for col, (value, was) in enumerate(zip(row, old)) if value != was}
+        if changed:
+            writes[FIRST_ROW + offset] = changed
+
+    return writes, (inserted, updated, len(deleted_keys))
+
+
+def _ranges(sheet_name, writes):
+    """Groups the changed cells of every row into contiguous A1 ranges"""
+    quoted = "'{}'".format(sheet_name.replace("'", "''"))
+    data = []
+    for row_number, changed in sorted(writes.items()):
+        cols = sorted(changed)
+        start = prev = cols[0]
+        for col in cols[1:] + [None]:
+            if col is not None and col == prev + 1:
+                prev = col
+                continue
+            data.append({
+                "range": f"{quoted}!{COLUMNS[start]}{row_number}:{COLUMNS[prev]}{row_number}",
+                "values": [[changed[c] for c in range(start, prev + 1)]],
+            })
+            if col is not None:
+                start = prev = col
+    return data
+
+
+class SheetsSink:
+    """
+    Writes market lists to Google Sheets by diffing against what is already there.
+
+    The current contents of all sections are read in one batched request; only inserted, updated and deleted
+    cells are then sent, all sections together in one batched write. Lists of any length are supported - the
+    worksheet grows when a section needs more rows than the grid has.
+    """
+
+    def __init__(self, spreadsheet, worksheets, limiter):
+        """
+        - spreadsheet: the gspread Spreadsheet holding the market lists
+        - worksheets: {section: gspread Worksheet}
+        - limiter: sheets.QuotaLimiter
+        """
+        self.spreadsheet = spreadsheet
+        self.worksheets = worksheets
+        self.limiter = limiter
+
+    def write(self, sections):
+        """
+        Brings every worksheet in line with `sections` ({section: rows}) and returns a summary with the number of
+        cells written and rows inserted/updated/deleted per run
+        :return:
+        """
+        names = list(self.worksheets)
+        ranges = ["'{}'!A{}:E".format(self.worksheets[name].title.replace("'", "''"), FIRST_ROW) for name in names]
+
+        self.limiter.acquire("read")
+        response = self.spreadsheet.values_batch_get(ranges)
+        current = {name: value_range.get("values", [])
+                   for name, value_range in zip(names, response.get("valueRanges", []))}
+
+        data = []
+        summary = {"cells": 0, "inserted": 0, "updated": 0, "deleted": 0}
+        for name in names:
+            worksheet = self.worksheets[name]
+            writes, (inserted, updated, deleted) = diff_section(current.get(name, []), sections.get(name, []))
+            if not writes:
+                continue
+
+            last_row = max(writes)
+            if last_row > worksheet.row_count:
+                self.limiter.acquire("write")
+                worksheet.add_rows(last_row - worksheet.row_count)
+
+            data.extend(_ranges(worksheet.title, writes))
+            summary["cells"] += sum(len(changed) for changed in writes.values())
+            summary["inserted"] += inserted
+            summary["updated"] += updated
+            summary["deleted"] += deleted
+
+        if data:
+            self.limiter.acquire("write")
+            self.spreadsheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+
+        print(f"Market list sheets: {summary['cells']} cells written "
+              f"({summary['inserted']} inserted, {summary['updated']} updated, {summary['deleted']} deleted rows)")
+        return summary
+
+
+class _LocalSink(abc.ABC):
+    """
+    Base class of the local file sinks: all sections go to `path` in a single bulk write
+    """
+    extension = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def _frames(self, sections):
+        return {section: parse_market_list_rows(sections.get(section, [])) for section in MARKET_LIST_SECTIONS}
+
+    def _combined(self, sections):
+        frames = self._frames(sections)
+        return pd.concat([df.assign(Section=SECTION_TITLES[section]) for section, df in frames.items()],
+                         ignore_index=True)[["Section"] + MARKET_LIST_COLUMNS]
+
+    def write(self, sections):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._write(sections)
+
+        n_rows = sum(len(sections.get(section, [])) for section in MARKET_LIST_SECTIONS)
+        print(f"Market list written to {self.path}: {n_rows} rows")
+        return {"cells": n_rows * len(MARKET_LIST_COLUMNS), "rows": n_rows, "path": self.path}
+
+    @abc.abstractmethod
+    def _write(self, sections):
+        """Writes all `sections` to self.path"""
+
+
+class ParquetSink(_LocalSink):
+    """One Parquet file, with a Section column"""
+    extension = ".parquet"
+
+    def _write(self, sections):
+        self._combined(sections).to_parquet(self.path, index=False)
+
+
+class CSVSink(_LocalSink):
+    """One CSV file, with a Section column"""
+    extension = ".csv"
+
+    def _write(self, sections):
+        self._combined(sections).to_csv(self.path, index=False)
+
+
+class XLSXSink(_LocalSink):
+    """One workbook with a worksheet per section, laid out like the Google Sheets market lists"""
+    extension = ".xlsx"
+
+    def _write(self, sections):
+        with pd.ExcelWriter(self.path, engine="openpyxl") as writer:
+            for section, df in self._frames(sections).items():
+                df.to_excel(writer, sheet_name=SECTION_TITLES[section], index=False)
+
+
+LOCAL_SINKS = {sink.extension: sink for sink in (ParquetSink, CSVSink, XLSXSink)}
+
+
+def get_sink(output):
+    """
+    Returns the output sink for a .parquet/.csv/.xlsx path; sink objects are returned unchanged.
+    ('sheets' needs the output spreadsheet and is resolved by MarketList.get_sheets_sink.)
+    :return:
+    """
+    if hasattr(output, "write"):
+        return output
+
+    extension = os.path.splitext(str(output))[1].lower()
+    if extension not in LOCAL_SINKS:
+        raise ValueError(f"Unsupported output '{output}'. Use 'sheets' or a path ending in "
+                         f"{', '.join(LOCAL_SINKS)}")
+    return LOCAL_SINKS[extension](output)
@@ -0,0 +1,188 @@
+"""
+Per-item purchase planning.
+
+Everything one item's purchase calculation needs is captured in an immutable StockRecord (its row of the stock
+sheet, with any balance override applied) and the result is an immutable PurchaseLine, so plan_item_purchase is a
+pure function: items can be planned in any order, in threads or in worker processes, by any number of callers
+sharing one MarketList, and always give the same lines as planning them one by one.
+"""
+import math
+import re
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class StockRecord:
+    """One item's stock sheet row as used by the purchase calculation"""
+    item: str
+    ptn_name: str
+    case_qty: float
+    bundle_qty: float
+    bundle_unit: str
+    rate: float
+    current_balance: float
+
+    @classmethod
+    def from_stock(cls, stock_df, balance_overrides=None):
+        """
+        {item: StockRecord} of the stock dataframe, first row per item like the original lookups, with
+        `balance_overrides` ({item: current balance}) applied
+        :return:
+        """
+        balance_overrides = balance_overrides or {}
+        stock = stock_df.drop_duplicates("Stock Name")
+        return {
+            item: cls(item, ptn_name, case_qty, bundle_qty, bundle_unit, rate,
+                      float(balance_overrides.get(item, current_balance)))
+            for item, ptn_name, case_qty, bundle_qty, bundle_unit, rate, current_balance in zip(
+                stock["Stock Name"], stock["Ptn Name"], stock["Case Qty"], stock["Bundle Qty"],
+                stock["Bundle_qty Unit"], stock["Rate"], stock["Current Balance"])
+        }
+
+
+@dataclass(frozen=True)
+class PurchaseLine:
+    """One market list row"""
+    item: str
+    current_stock: str
+    buy: str
+    rate: str
+    amount: str
+
+    def row(self):
+        """[Item, Current Stock, Quantity to Buy, Unit Rate, Total Amount] as written to the market list"""
+        return [self.item, self.current_stock, self.buy, self.rate, self.amount]
+
+
+def skip_item_for_purchase_sig_test(reorder_level, forcasted_qty):
+    """This method checks if:
+    a) The diff between the current balance of a stock is significantly greater that the predicted value.
+            or
+    b) The predicted value is NAN or
+    c) The diff between the current balance and predicted value is a negative
+
+    If either of the above is true, the stock will be skipped from the forcast.
+    """
+
+    if reorder_level - forcasted_qty < 0:
+        return True
+    try:
+        ratio = (reorder_level / forcasted_qty)
+    except ZeroDivisionError:
+        ratio = (reorder_level / 1)
+    deviation = abs(ratio - 1)
+    significance_threshold = 0.05  # Deviation cut off of 5%
+    if deviation < significance_threshold:
+        return False
+    else:
+        return True
+
+
+def process_batch_stock(batch_description, item_qty, item_cost):
+    """Rewrites a 'Batch(A X n/m)' bundle unit with the recent mean quantity received and amount paid"""
+    batch_description = batch_description.replace("Batch", "").strip()
+    item_cost = str(item_cost)[:-2]
+
+    if len(item_cost) > 4:
+        item_cost = str(item_cost)[:2]
+    else:
+        item_cost = str(item_cost)[:1]
+    item_qty = str(item_qty)
+    match = re.match(r"\((.*)\)", batch_description)
+    grp = match.group()
+    cleaned_txt = re.sub(r"\(*\)*", "", grp)
+    n_item_n_amt = cleaned_txt.split("X")[1].split("/")
+    n_item_n_amt[0] = re.sub(r"\d+", str(item_qty), n_item_n_amt[0])
+    n_item_n_amt[1] = re.sub(r"\d+", str(item_cost), n_item_n_amt[1])
+    average_value = cleaned_txt.split("X")[0]
+    return str("Batch(") + average_value + "X" + n_item_n_amt[0] + str("/") + n_item_n_amt[1] + str(")")
+
+
+def plan_item_purchase(stock, item_mv, purchases_df=None):
+    """
+    Purchase calculation of one item: how much of `stock` (a StockRecord) to buy to cover the forecast `item_mv`.
+    `purchases_df` (the item's rows of the Purchases sheet) is only needed for items sold in batches.
+    Returns a PurchaseLine, or None when the item is skipped.
+    """
+    item = stock.item
+    try:
+        b_name = stock.bundle_unit
+        current_bal = max(stock.current_balance, 0)
+
+        if current_bal >= item_mv:
+            if skip_item_for_purchase_sig_test(current_bal, item_mv):
+                return
+
+        if "Batch" in b_name and purchases_df is not None:
+            item_purchase_df = purchases_df.loc[purchases_df["Item name"] == item, :]
+            real_purchase_item_df = item_purchase_df.loc[item_purchase_df["Total Amount"] > 1, :]
+            if not real_purchase_item_df.empty:
+                last_three_purchase = real_purchase_item_df.tail(3)
+                mean_amt = round(last_three_purchase["Total Amount"].mean(), -3)
+                mean_received = math.ceil(last_three_purchase["Portion"].mean())
+                b_name = process_batch_stock(b_name, mean_received, mean_amt)
+
+        # Calculate reorder level display
+        if current_bal < stock.bundle_qty:
+            reorder_level_str = str(current_bal) + " " + str(stock.ptn_name)
+        else:
+            reorder_level_str = str(current_bal // stock.bundle_qty) + " " + str(b_name)
+
+        # Calculate quantity needed
+        needed_qty = math.ceil(item_mv - current_bal)
+        if needed_qty < 0:
+            needed_qty = math.ceil(abs(needed_qty))
+
+        if stock.case_qty == 1:
+            buy = needed_qty / stock.bundle_qty
+            buy_flag = needed_qty / stock.bundle_qty
+        else:
+            buy = needed_qty / stock.case_qty
+            buy_flag = needed_qty / stock.bundle_qty
+
+        if buy_flag < 0.5:
+            buy = 0.5
+        elif 0.5 <= buy_flag < 1:
+            buy = 1
+
+        buy = round(buy, 1)
+        buy_str = str(buy) + f" {b_name}"
+
+        # Calculate rates and amounts
+        if stock.case_qty == 1:
+            mkl_rate = round((stock.rate * stock.bundle_qty), -2)
+        else:
+            if buy < stock.bundle_qty:
+                buy_str = str(int(stock.bundle_qty // buy)) + f" {b_name}"
+                buy = buy / stock.bundle_qty
+            mkl_rate = round((stock.rate * stock.case_qty * stock.bundle_qty), -2)
+
+        mkl_amt = round(mkl_rate * buy, 0)
+
+        return PurchaseLine(item, str(reorder_level_str), buy_str, str(mkl_rate), str(mkl_amt))
+
+    except Exception as e:
+        print(f"Error processing {item}: {e}")
+
+
+def _plan_task(task):
+    return plan_item_purchase(*task)
+
+
+def plan_purchases(tasks, executor=None):
+    """
+    Plans (StockRecord, forecast, purchases_df or None) tasks, serially or on `executor` (threads or processes),
+    and returns their PurchaseLines (None for skipped items) in task order, whichever order they finish in
+    :return:
+    """
+    if executor is None:
+        return [_plan_task(task) for task in tasks]
+    return list(executor.map(_plan_task, tasks))
+
+
+def item_purchases(purchases_df, items):
+    """{item: its rows of the Purchases dataframe} for `items`, so each task only carries its own history"""
+    if purchases_df is None or purchases_df.empty:
+        return {}
+    rows = purchases_df.loc[purchases_df["Item name"].isin(set(items)), :]
+    return {item: item_df for item, item_df in rows.groupby("Item name", sort=False)}
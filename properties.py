@@ -0,0 +1,99 @@
+"""
+Config-driven market list runs for several properties (sites) at once.
+
+properties.json maps each property to the spreadsheets it reads from and writes to; any source left out falls back
+to main.DEFAULT_SHEETS. All properties share one gspread client, one forecasting worker pool and one
+QuotaLimiter, so running them together never exceeds the Sheets quota of the service account, and one revision
+source, so a spreadsheet shared by several properties is checked for changes once.
+
+Usage:
+    python properties.py --config properties.json --workers 8
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sheets import DriveRevisions, QuotaLimiter
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "properties.json")
+
+
+def load_properties(config_path=CONFIG_PATH):
+    """
+    This method returns {property name: sheets overrides} from the properties configuration file.
+    Without a configuration file only the default property is available.
+    :return:
+    """
+    if not os.path.exists(config_path):
+        return {"default": {}}
+
+    with open(config_path) as f:
+        config = json.load(f)
+    return {name: conf.get("sheets", {}) for name, conf in config["properties"].items()}
+
+
+def run_properties(property_names=None, config_path=CONFIG_PATH, workers=8, reads_per_minute=60,
+                   writes_per_minute=60, **market_list_kwargs):
+    """
+    Generates market lists for many properties concurrently.
+
+    Every property is planned in its own thread while all forecasts go through one shared worker pool and all
+    Sheets calls through one quota-aware limiter. Extra keyword arguments are passed to create_market_list.
+    Returns one run summary per property with its throughput.
+    """
+    import gspread
+    from main import MarketList
+
+    properties = load_properties(config_path)
+    property_names = property_names or list(properties)
+
+    gc = gspread.service_account(os.environ.get("STEAM_TALENT_ACCOUNT"))
+    limiter = QuotaLimiter(reads_per_minute, writes_per_minute)
+    revisions = DriveRevisions(gc)
+    summaries = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def run(name):
+            start = time.perf_counter()
+            try:
+                mkl = MarketList(property_name=name, sheets=properties[name], gc=gc, limiter=limiter,
+                                 revisions=revisions)
+                summaries[name] = mkl.create_market_list(executor=executor, **market_list_kwargs)
+            except Exception as e:
+                print(f"Error generating market list for {name}: {e}")
+                summaries[name] = {"property": name, "items": 0, "rows": 0, "error": str(e),
+                                   "seconds": time.perf_counter() - start}
+
+        threads = [threading.Thread(target=run, args=(name,), name=f"property-{name}") for name in property_names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    print(f"{'Property':<20}{'Items':>8}{'Rows':>8}{'Seconds':>10}{'Items/min':>12}")
+    for name in property_names:
+        summary = summaries[name]
+        summary["items_per_minute"] = 60 * summary["items"] / summary["seconds"] if summary["seconds"] else 0.0
+        print(f"{name:<20}{summary['items']:>8}{summary['rows']:>8}{summary['seconds']:>10.1f}"
+              f"{summary['items_per_minute']:>12.1f}")
+    print(f"Time spent waiting on the Sheets quota: {limiter.waited:.1f}s")
+
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate market lists for several properties concurrently")
+    parser.add_argument("properties", nargs="*", help="Property names (default: all in the config)")
+    parser.add_argument("--config", default=CONFIG_PATH)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--period", default="monthly")
+    parser.add_argument("--items", type=int, default=150)
+    args = parser.parse_args()
+
+    period = int(args.period) if args.period.isdigit() else args.period
+    run_properties(args.properties or None, args.config, args.workers, forecast_period=period,
+                   x_items_limit=args.items)
@@ -0,0 +1,427 @@
+"""
+Google Sheets helpers shared by every MarketList instance in a process.
+"""
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import Counter, deque
+
+
+class QuotaLimiter:
+    """
+    Sliding-window limiter for the Sheets API per-user quota (60 read and 60 write requests per minute by default).
+    One instance is shared by every MarketList in a process so concurrent properties never exceed the quota together.
+    """
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, window=60.0):
+        self.limits = {"read": reads_per_minute, "write": writes_per_minute}
+        self.window = window
+        self._calls = {"read": deque(), "write": deque()}
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, kind="read", n=1):
+        """
+        Blocks until `n` requests of `kind` ('read' or 'write') fit in the quota window, then records them
+        :return:
+        """
+        for _ in range(n):
+            while True:
+                with self._lock:
+                    calls = self._calls[kind]
+                    now = time.monotonic()
+                    while calls and now - calls[0] >= self.window:
+                        calls.popleft()
+                    if len(calls) < self.limits[kind]:
+                        calls.append(now)
+                        break
+                    wait = self.window - (now - calls[0])
+                    self.waited += wait
+                time.sleep(wait)
+
+    def min_seconds(self, kind="read", n=1):
+        """
+        Shortest time in which `n` more requests of `kind` can be made from now, given the requests already in the
+        quota window (0 when they all fit at once). A lower bound on the run time of anything making them.
+        :return:
+        """
+        with self._lock:
+            now = time.monotonic()
+            calls = deque(t - now for t in self._calls[kind] if now - t < self.window)
+        limit = self.limits[kind]
+        t = 0.0
+        for _ in range(n):
+            while calls and t - calls[0] >= self.window:
+                calls.popleft()
+            if len(calls) >= limit:
+                t = calls.popleft() + self.window
+            calls.append(t)
+        return t
+
+
+default_limiter = QuotaLimiter()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical fetches: while a fetch for a key is in flight, other callers asking for the same
+    key wait for it and share its result (or its exception) instead of downloading the same sheet again.
+    Counters per dataset: `requests` made, `fetches` actually executed and `coalesced` requests that were saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._counters = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) unless a call with the same `key` is already running, in which case it waits for
+        that call. key[0] names the dataset the counters are kept under.
+        :return:
+        """
+        with self._lock:
+            counters = self._counters.setdefault(key[0], {"requests": 0, "fetches": 0, "coalesced": 0})
+            counters["requests"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                counters["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fn(*args, **kwargs)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                counters["fetches"] += 1
+            flight.done.set()
+        return flight.value
+
+    def stats(self):
+        """{dataset: {"requests", "fetches", "coalesced"}} snapshot"""
+        with self._lock:
+            return {dataset: dict(counters) for dataset, counters in self._counters.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters.clear()
+
+
+default_single_flight = SingleFlight()
+
+
+def coalesced(dataset, flight=None):
+    """
+    Decorator for data loaders: concurrent calls with the same non-underscore arguments share one fetch through
+    `flight` (the process-wide SingleFlight by default). Put it under @revision_cached so only cache misses coalesce.
+    :return:
+    """
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (dataset,) + tuple(value for name, value in bound.arguments.items() if not name.startswith("_"))
+            return (flight or default_single_flight).do(key, fn, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# API methods that count against the write quota; `request` is the Drive metadata lookup of DriveRevisions, which
+# is not a Sheets request at all. Every other method is a read.
+WRITE_METHODS = frozenset({"add_rows", "append_row", "append_rows", "batch_clear", "batch_update", "clear",
+                           "insert_row", "insert_rows", "update", "update_cell", "update_cells", "values_append",
+                           "values_batch_clear", "values_batch_update", "values_clear", "values_update"})
+DRIVE_METHODS = frozenset({"request"})
+# Calls returning a spreadsheet or worksheet, and attributes holding one, that are metered in turn
+_HANDLE_METHODS = frozenset({"open", "open_by_key", "open_by_url", "worksheet", "get_worksheet",
+                             "get_worksheet_by_id", "add_worksheet", "worksheets"})
+_HANDLE_ATTRIBUTES = frozenset({"spreadsheet", "http_client"})
+
+
+def call_kind(method):
+    """'read', 'write' or 'drive' quota bucket of an API method"""
+    if method in DRIVE_METHODS:
+        return "drive"
+    return "write" if method in WRITE_METHODS else "read"
+
+
+def _payload_bytes(value):
+    """JSON size of a response or request body (0 for anything that is not plain data)"""
+    if not isinstance(value, (dict, list, tuple, str)):
+        return 0
+    return len(json.dumps(value, separators=(",", ":"), default=str))
+
+
+class SheetsUsage:
+    """
+    Calls, bytes and seconds per API method, recorded by MeteredClient. Bytes are the JSON size of what a read
+    returned or a write sent. A usage with a `parent` records everything into the parent as well, so per-instance
+    counters also add up to the process-wide `default_usage`.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.calls = Counter()
+        self.bytes = Counter()
+        self.seconds = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, method, n_bytes, seconds):
+        with self._lock:
+            self.calls[method] += 1
+            self.bytes[method] += n_bytes
+            self.seconds[method] += seconds
+        if self.parent is not None:
+            self.parent.record(method, n_bytes, seconds)
+
+    def snapshot(self):
+        """Copy of the counters, to measure one run with since()"""
+        with self._lock:
+            return {"calls": Counter(self.calls), "bytes": Counter(self.bytes), "seconds": Counter(self.seconds)}
+
+    def since(self, snapshot=None):
+        """
+        Usage recorded after `snapshot` (everything when None): {"calls", "bytes", "seconds"} per method plus
+        "reads", "writes" and "drive" call totals and total "bytes_total"
+        :return:
+        """
+        now = self.snapshot()
+        if snapshot is not None:
+            now = {counter: now[counter] - snapshot[counter] for counter in now}
+        # Counter subtraction drops zeros: keep an entry per called method in every counter
+        usage = {counter: {method: values.get(method, 0) for method in now["calls"]} for counter, values in now.items()}
+        totals = Counter()
+        for method, n in usage["calls"].items():
+            totals[call_kind(method)] += n
+        usage.update(reads=totals["read"], writes=totals["write"], drive=totals["drive"],
+                     bytes_total=sum(usage["bytes"].values()))
+        return usage
+
+    def reset(self):
+        with self._lock:
+            for counter in (self.calls, self.bytes, self.seconds):
+                counter.clear()
+
+
+default_usage = SheetsUsage()
+
+
+class MeteredClient:
+    """
+    Transparent stand-in for a gspread client that records every API call in a SheetsUsage. Spreadsheets and
+    worksheets it hands out (open_by_key, worksheet, worksheet.spreadsheet, ...) are metered the same way, so all
+    calls made through them are counted without changing the code making them.
+    """
+
+    def __init__(self, target, usage):
+        self._target = target
+        self._usage = usage
+
+    def __getattr__(self, name):
+        if name in ("_target", "_usage"):
+            raise AttributeError(name)
+        value = getattr(self._target, name)
+        if name in _HANDLE_ATTRIBUTES:
+            return MeteredClient(value, self._usage)
+        if name.startswith("_") or not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def metered(*args, **kwargs):
+            start = time.perf_counter()
+            result = value(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            if call_kind(name) == "write":
+                n_bytes = sum(_payload_bytes(arg) for arg in list(args) + list(kwargs.values()))
+            else:
+                n_bytes = _payload_bytes(result)
+            self._usage.record(name, n_bytes, seconds)
+            if name in _HANDLE_METHODS:
+                if isinstance(result, list):
+                    return [MeteredClient(handle, self._usage) for handle in result]
+                return MeteredClient(result, self._usage)
+            return result
+
+        return metered
+
+    def __repr__(self):
+        return f"MeteredClient({self._target!r})"
+
+
+def describe_reads(predicted):
+    """
+    Predicted reads of a MarketList.plan_sheets_calls() result as text: "at least" when the Issues sheet size was
+    estimated, and the Purchases reads still depending on batch-priced items
+    :return:
+    """
+    text = f"{'at least ' if predicted['issues_estimated'] else ''}{predicted['reads']}"
+    if predicted["batch_reads"]:
+        text += f" (+{predicted['batch_reads']} if batch-priced items are planned)"
+    return text
+
+
+def format_calls(predicted, actual):
+    """
+    Predicted vs actual Sheets calls of a run as printable lines
+    - predicted: MarketList.plan_sheets_calls() result
+    - actual: SheetsUsage.since() of the run
+    :return:
+    """
+    reads = f"{'>=' if predicted['issues_estimated'] else ''}{predicted['reads']}"
+    lines = [f"{'sheets calls':<14}{'predicted':>10}{'actual':>8}",
+             f"{'reads':<14}{reads:>10}{actual['reads']:>8}",
+             f"{'writes':<14}{predicted['writes']:>10}{actual['writes']:>8}",
+             f"min. quota time {predicted['min_seconds']:.0f}s, {actual['drive']} Drive revision lookups, "
+             f"{actual['bytes_total'] / 1e6:.1f} MB transferred"]
+    for method in sorted(actual["calls"]):
+        lines.append(f"  {method:<22}{actual['calls'][method]:>6} calls{actual['bytes'][method] / 1e6:>9.2f} MB"
+                     f"{actual['seconds'][method]:>8.2f}s")
+    return lines
+
+
+PAGE_ROWS = 10000
+
+
+def column_letter(n):
+    """A1 letter of 1-based column `n` (1 -> A, 27 -> AA)"""
+    letters = ""
+    while n > 0:
+        n, remainder = divmod(n - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def iter_row_pages(worksheet, n_columns, limiter=None, page_rows=PAGE_ROWS, first_row=2):
+    """
+    Yields the rows of `worksheet` from `first_row` down in pages of `page_rows` rows, one values.get request per
+    page, so only one page of cell values is held at a time. Rows are padded to `n_columns` cells.
+    Pages through to the end of the grid (row_count): values.get trims trailing empty rows from every range, so a
+    short page only means the page ended on blank rows, not that the sheet ended. Without a grid size it stops at
+    the first empty page.
+    :return:
+    """
+    title = worksheet.title.replace("'", "''")
+    last_column = column_letter(n_columns)
+    last_row = getattr(worksheet, "row_count", None)
+    start = first_row
+    while last_row is None or start <= last_row:
+        end = start + page_rows - 1 if last_row is None else min(start + page_rows - 1, last_row)
+        if limiter is not None:
+            limiter.acquire("read")
+        rows = worksheet.spreadsheet.values_get(f"'{title}'!A{start}:{last_column}{end}").get("values", [])
+        if rows:
+            yield [row + [""] * (n_columns - len(row)) for row in rows]
+        elif last_row is None:
+            return
+        start = end + 1
+
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files/"
+
+
+class DriveRevisions:
+    """
+    Revision source backed by the Drive `version` of each spreadsheet, which increases on every edit.
+    One metadata request per spreadsheet, memoised for `check_interval` seconds so a run that reads the same sheet
+    many times in a row does not probe it every time (set 0 to probe on every read). Drive metadata requests do
+    not count against the Sheets quota.
+    """
+
+    def __init__(self, gc, check_interval=5.0):
+        self.gc = gc
+        self.check_interval = check_interval
+        self._checked = {}
+        # One lock per spreadsheet, held across its Drive request so concurrent checks of the same sheet share one
+        # probe while checks of other sheets go ahead; self._lock only guards the dicts and the counter
+        self._key_locks = {}
+        # Bumped by changed(), so a probe that was in flight during a write does not store the old version
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.probes = 0
+
+    def _fresh(self, key):
+        checked = self._checked.get(key)
+        if checked is not None and time.monotonic() - checked[0] < self.check_interval:
+            return checked[1]
+        return None
+
+    def revision(self, key):
+        with self._lock:
+            version = self._fresh(key)
+            if version is not None:
+                return version
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Another thread may have probed this sheet while we waited
+                version = self._fresh(key)
+                if version is not None:
+                    return version
+                generation = self._generations.get(key, 0)
+
+            # gspread >= 6 moved request() to the http client
+            session = getattr(self.gc, "http_client", self.gc)
+            response = session.request("get", DRIVE_FILES_URL + key, params={"fields": "version",
+                                                                             "supportsAllDrives": True})
+            version = int(response.json()["version"])
+            with self._lock:
+                self.probes += 1
+                if self._generations.get(key, 0) == generation:
+                    self._checked[key] = (time.monotonic(), version)
+            return version
+
+    def changed(self, key):
+        """Called after writing to spreadsheet `key` so its next revision is read from Drive"""
+        with self._lock:
+            self._checked.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+
+class LocalRevisions:
+    """
+    In-memory revision source for tests and offline runs: a spreadsheet's revision only changes when bump() is
+    called for it
+    """
+
+    def __init__(self):
+        self._revisions = {}
+        self._lock = threading.Lock()
+
+    def revision(self, key):
+        with self._lock:
+            return self._revisions.get(key, 0)
+
+    def bump(self, key):
+        """Records an edit of spreadsheet `key` and returns its new revision"""
+        with self._lock:
+            self._revisions[key] = self._revisions.get(key, 0) + 1
+            return self._revisions[key]
+
+    changed = bump
@@ -0,0 +1,166 @@
+"""
+Dense item x day usage matrix shared between worker processes without copying.
+
+The aggregated daily usage of the issues voucher is stored as a float32 matrix (one row per item, one column per
+calendar day, NaN on days an item was not issued) in shared memory or a memory-mapped file. Workers receive only
+a small picklable UsageMatrixHandle and read their rows straight from the shared buffer instead of unpickling
+the whole issues dataframe.
+"""
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from forecasting import get_engine
+
+
+class UsageMatrix:
+    """
+    values: float32 array of shape (n_items, n_days); items: row labels; start: date of the first column
+    """
+
+    def __init__(self, values, items, start):
+        self.values = values
+        self.items = list(items)
+        self.start = pd.Timestamp(start)
+        self.item_index = {item: row for row, item in enumerate(self.items)}
+        self._buffer = None
+
+    @classmethod
+    def from_issues(cls, issues_df):
+        """
+        Builds the matrix from an issues voucher dataframe (Date, Item name, Usage)
+        :return:
+        """
+        daily = issues_df.groupby(["Item name", "Date"], as_index=False)["Usage"].sum()
+        items = sorted(daily["Item name"].unique())
+        start = daily["Date"].min()
+        n_days = (daily["Date"].max() - start).days + 1
+
+        values = np.full((len(items), n_days), np.nan, dtype=np.float32)
+        rows = pd.Categorical(daily["Item name"], categories=items).codes
+        cols = (daily["Date"] - start).dt.days.to_numpy()
+        values[rows, cols] = daily["Usage"].to_numpy(dtype=np.float32)
+        return cls(values, items, start)
+
+    @property
+    def dates(self):
+        return pd.date_range(self.start, periods=self.values.shape[1], freq="D")
+
+    def column(self, date):
+        """Index of the column holding `date`"""
+        return (pd.Timestamp(date) - self.start).days
+
+    def row(self, item):
+        """Zero-copy view of an item's daily usage (NaN on days without issues)"""
+        return self.values[self.item_index[item]]
+
+    def item_history(self, item, until=None):
+        """
+        Returns the item's issue days as a Date/Usage dataframe, optionally only up to (and including) `until`
+        :return:
+        """
+        if item not in self.item_index:
+            return pd.DataFrame({"Date": pd.Series(dtype="datetime64[ns]"), "Usage": pd.Series(dtype=float)})
+        row = self.row(item)
+        if until is not None:
+            row = row[:self.column(until) + 1]
+        days = np.flatnonzero(~np.isnan(row))
+        return pd.DataFrame({"Date": self.start + pd.to_timedelta(days, unit="D"), "Usage": row[days].astype(float)})
+
+    def to_frame(self, until=None):
+        """
+        Long Item name/Date/Usage dataframe of every issue day, optionally only up to `until`
+        :return:
+        """
+        values = self.values if until is None else self.values[:, :self.column(until) + 1]
+        rows, days = np.nonzero(~np.isnan(values))
+        return pd.DataFrame({
+            "Item name": np.asarray(self.items, dtype=object)[rows],
+            "Date": self.start + pd.to_timedelta(days, unit="D"),
+            "Usage": values[rows, days].astype(float),
+        })
+
+    def attach(self):
+        """An in-process matrix can be passed wherever a handle is expected"""
+        return self
+
+    def to_shared_memory(self):
+        """
+        Copies the matrix into a new shared memory block and returns (handle, block).
+        The caller owns the block and must close() and unlink() it when the workers are done.
+        :return:
+        """
+        block = shared_memory.SharedMemory(create=True, size=max(self.values.nbytes, 1))
+        np.ndarray(self.values.shape, dtype=np.float32, buffer=block.buf)[:] = self.values
+        return UsageMatrixHandle(self.values.shape, self.items, self.start, shm_name=block.name), block
+
+    def to_memmap(self, path):
+        """
+        Writes the matrix to a memory-mapped file and returns its handle. The file doubles as an on-disk cache.
+        :return:
+        """
+        mapped = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=self.values.shape)
+        mapped[:] = self.values
+        mapped.flush()
+        return UsageMatrixHandle(self.values.shape, self.items, self.start, path=path)
+
+
+class UsageMatrixHandle:
+    """
+    Small picklable description of a shared matrix. Only this crosses the process boundary.
+    """
+
+    def __init__(self, shape, items, start, shm_name=None, path=None):
+        self.shape = tuple(shape)
+        self.items = list(items)
+        self.start = pd.Timestamp(start)
+        self.shm_name = shm_name
+        self.path = path
+
+    @property
+    def key(self):
+        return self.shm_name or os.path.abspath(self.path)
+
+    def attach(self):
+        """
+        Returns a UsageMatrix whose values are a view of the shared buffer (no copy). Attached matrices are
+        cached per process, so a worker maps each matrix once however many tasks it runs.
+        :return:
+        """
+        matrix = _attached.get(self.key)
+        if matrix is not None:
+            return matrix
+
+        if self.shm_name:
+            try:
+                block = shared_memory.SharedMemory(name=self.shm_name, track=False)
+            except TypeError:
+                # Python < 3.13 re-registers the block with the resource tracker the pool shares with its
+                # parent; that is harmless because the owner unregisters it when unlinking
+                block = shared_memory.SharedMemory(name=self.shm_name)
+            values = np.ndarray(self.shape, dtype=np.float32, buffer=block.buf)
+        else:
+            block = None
+            values = np.load(self.path, mmap_mode="r")
+
+        matrix = UsageMatrix(values, self.items, self.start)
+        matrix._buffer = block  # keep the mapping alive as long as the matrix
+        _attached[self.key] = matrix
+        return matrix
+
+
+_attached = {}
+
+
+def forecast_item(handle, item, periods, engine="prophet", resolution="daily"):
+    """
+    Worker entry point: reads one item's history from the shared matrix (or an in-process UsageMatrix) and
+    returns the raw forecast path for the next `periods` days (None when there is not enough history)
+    :return:
+    """
+    history = handle.attach().item_history(item)
+    if history.empty:
+        return None
+    return get_engine(engine, resolution, periods)(history, periods)